@@ -14,6 +14,7 @@ from requests import Response
 from . import LOGGER
 from .ankihub_client import AnkiHubClient, AnkiHubHTTPError
 from .ankihub_client.ankihub_client import API
+from .db import ankihub_db
 from .settings import config
 
 
@@ -30,7 +31,8 @@ def logging_hook(response: Response, *args, **kwargs) -> Response:
     body_dict: Optional[Dict] = None
     try:
         body_dict = json.loads(body) if body else None
-    except ValueError:
+    except (TypeError, ValueError):
+        # The body is not JSON, e.g. when it's a stream of zipped media files
         pass
 
     if "/login/" in endpoint:
@@ -88,6 +90,7 @@ class AddonAnkiHubClient(AnkiHubClient):
             response_hooks=hooks if hooks is not None else DEFAULT_RESPONSE_HOOKS,
             get_token=lambda: config.token(),
             local_media_dir_path_cb=lambda: (Path(collection_or_error().media.dir())),
+            media_file_hashes_cb=ankihub_db.media_file_hashes,
         )
 
     def upload_logs(self, file: Path, key: str) -> None:
@@ -1,7 +1,10 @@
 import base64
+import codecs
 import csv
+import dataclasses
 import gzip
-import hashlib
+import io
+import itertools
 import json
 import os
 import re
@@ -11,7 +14,8 @@ import sys
 import threading
 import urllib.parse
 import uuid
-from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+import zlib
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
 from datetime import datetime
 from enum import Enum
 from pathlib import Path
@@ -20,6 +24,7 @@ from typing import (
     Any,
     Callable,
     Dict,
+    Iterable,
     Iterator,
     List,
     Optional,
@@ -30,11 +35,12 @@ from typing import (
     Union,
     cast,
 )
-from zipfile import ZipFile
+from zipfile import ZIP64_LIMIT, ZipFile, ZipInfo
 
 import requests
 import structlog
 from requests import PreparedRequest, Request, Response, Session
+from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
 from tenacity import (
     RetryError,
     retry,
@@ -43,7 +49,10 @@ from tenacity import (
     stop_after_attempt,
     wait_exponential,
 )
+from urllib3.fields import RequestField
+from urllib3.filepost import choose_boundary
 
+from ..common_utils import md5_file_content_hash
 from .models import (
     ANKIHUB_DATETIME_FORMAT_STR,
     CardReviewData,
@@ -85,10 +94,26 @@ DECK_UPDATE_PAGE_SIZE = 2000  # seems to work well in terms of speed
 DECK_EXTENSION_UPDATE_PAGE_SIZE = 2000
 DECK_MEDIA_UPDATE_PAGE_SIZE = 2000
 
+# How many suggestions create_suggestions_in_bulk sends per request
+SUGGESTIONS_BULK_PAGE_SIZE = 500
+
 CSV_DELIMITER = ";"
 
+# How many notes download_deck_in_batches yields at once
+DECK_CSV_BATCH_SIZE = 2000
+DECK_DOWNLOAD_CHUNK_SIZE = 10**6  # 1 megabyte
+
 CHUNK_BYTES_THRESHOLD = 67108864  # 60 megabytes
 
+# Media files are read in chunks of this size when they are zipped for an upload
+MEDIA_UPLOAD_READ_CHUNK_SIZE = 1024 * 1024
+
+# Sizes of the records of a zip file without compression which is written to a non-seekable file object
+ZIP_LOCAL_FILE_HEADER_SIZE = 30
+ZIP_DATA_DESCRIPTOR_SIZE = 16
+ZIP_CENTRAL_DIRECTORY_HEADER_SIZE = 46
+ZIP_END_OF_CENTRAL_DIRECTORY_SIZE = 22
+
 # Exceptions for which we should retry the request.
 REQUEST_RETRY_EXCEPTION_TYPES = (
     requests.exceptions.JSONDecodeError,
@@ -121,6 +146,22 @@ IMAGE_FILE_EXTENSIONS = [
 THREAD_POOL_MAX_WORKERS = min(32, (os.cpu_count() or 1) + 1)
 
 
+# Media files are downloaded with a bounded number of queued downloads, so that not all of the
+# (possibly tens of thousands of) downloads of a deck are submitted to the thread pool at once.
+MEDIA_DOWNLOAD_MAX_WORKERS = THREAD_POOL_MAX_WORKERS
+MEDIA_DOWNLOAD_MAX_QUEUED = MEDIA_DOWNLOAD_MAX_WORKERS * 2
+
+# The chunk size for writing a media file is adapted to the size of the file within these bounds.
+MEDIA_DOWNLOAD_MIN_CHUNK_SIZE = 64 * 1024
+MEDIA_DOWNLOAD_MAX_CHUNK_SIZE = 1024 * 1024
+
+# Interrupted media downloads are resumed from where they stopped using Range requests.
+MEDIA_DOWNLOAD_MAX_ATTEMPTS = 3
+
+# Media files are downloaded to a hidden temporary file in the media folder and renamed once they are complete.
+MEDIA_DOWNLOAD_TEMP_FILE_PREFIX = ".ankihub_download_"
+
+
 CONNECTION_TIMEOUT = 10
 STANDARD_READ_TIMEOUT = 20
 LONG_READ_TIMEOUT = 60
@@ -241,21 +282,26 @@ class AnkiHubClient(AnkiWebClientMixin):
         api_url: str = DEFAULT_API_URL,
         s3_bucket_url: str = DEFAULT_S3_BUCKET_URL,
         ankiweb_url: str = DEFAULT_ANKIWEB_URL,
+        media_file_hashes_cb: Optional[Callable[[Sequence[Path]], Dict[Path, str]]] = None,
     ):
         """Create a new AnkiHubClient.
         The token can be set with the token parameter or with the get_token parameter.
         The get_token parameter is a function that returns the token. It has priority over the token parameter.
         If both are set, the token parameter is ignored.
+        The media_file_hashes_cb parameter is a function that returns the md5 hashes of the content of the
+        given media files (only for files that exist). It can be used to cache the hashes.
+        By default, the hashes are computed from the file contents every time they are needed.
         """
         self.api_url = api_url
         self.s3_bucket_url = s3_bucket_url
         self.ankiweb_url = ankiweb_url
         self.local_media_dir_path_cb = local_media_dir_path_cb
+        self.media_file_hashes_cb = media_file_hashes_cb or _media_file_hashes
         self.token = token
         self.get_token = get_token
         self.response_hooks = response_hooks
         self.should_stop_background_threads = False
-        self.thread_local_session = ThreadLocalSession()
+        self.thread_local_session = ThreadLocalSession(pool_maxsize=MEDIA_DOWNLOAD_MAX_WORKERS)
 
     def _send_request(
         self,
@@ -268,11 +314,12 @@ class AnkiHubClient(AnkiWebClientMixin):
         params=None,
         stream=False,
         is_long_running=False,
+        headers=None,
     ) -> Response:
         """Send a request to an API. This method should be used for all requests.
         Logs the request and response.
         Retries the request if necessary.
-        Uses appropriate headers for the given API.
+        Uses appropriate headers for the given API, additional headers can be passed with the headers parameter.
         (The url_suffix is the part of the url after the base url.)
         """
         if api == API.ANKIHUB:
@@ -284,7 +331,7 @@ class AnkiHubClient(AnkiWebClientMixin):
         else:
             raise ValueError(f"Unknown API: {api}")
 
-        headers = {}
+        headers = dict(headers) if headers else {}
         if api == API.ANKIHUB:
             headers["Content-Type"] = "application/json"
             headers["Accept"] = f"application/json; version={API_VERSION}"
@@ -385,15 +432,7 @@ class AnkiHubClient(AnkiWebClientMixin):
 
         s3_url_suffix = self._presigned_url_suffix_from_key(key=deck_file_name, action="upload")
 
-        notes_data_transformed = [note_info_for_upload(note_data).to_dict() for note_data in notes_data]
-        data = self._gzip_compress_string(
-            json.dumps(
-                {
-                    "notes": notes_data_transformed,
-                    "note_types": note_types_data,
-                }
-            ),
-        )
+        data = self._gzip_compressed_deck_json(notes_data=notes_data, note_types_data=note_types_data)
 
         s3_response = self._send_request(
             "PUT",
@@ -423,14 +462,21 @@ class AnkiHubClient(AnkiWebClientMixin):
         ankihub_did = uuid.UUID(response_data["deck_id"])
         return ankihub_did
 
-    def _gzip_compress_string(self, string: str) -> bytes:
-        result = gzip.compress(
-            bytes(
-                string,
-                encoding="utf-8",
-            )
-        )
-        return result
+    def _gzip_compressed_deck_json(self, notes_data: Iterable[NoteInfo], note_types_data: List[Dict]) -> bytes:
+        """Encodes the deck as JSON and compresses it with gzip. The notes are encoded and compressed one at a time,
+        so that the JSON of the whole deck is never held in memory uncompressed."""
+        result = io.BytesIO()
+        with gzip.GzipFile(fileobj=result, mode="wb") as gzip_file:
+            with io.TextIOWrapper(gzip_file, encoding="utf-8") as text_file:
+                text_file.write('{"notes": [')
+                for i, note_data in enumerate(notes_data):
+                    if i > 0:
+                        text_file.write(", ")
+                    text_file.write(json.dumps(note_info_for_upload(note_data).to_dict()))
+                text_file.write('], "note_types": ')
+                text_file.write(json.dumps(note_types_data))
+                text_file.write("}")
+        return result.getvalue()
 
     def _gzip_decompress_string(self, string: bytes) -> str:
         result = gzip.decompress(string).decode("utf-8")
@@ -443,19 +489,16 @@ class AnkiHubClient(AnkiWebClientMixin):
         Returns a map of the old filename to the new filename.
         """
         result: Dict[str, str] = {}
+        # Media files which don't exist locally are not included in the hashes and are skipped
+        file_content_hashes = self.media_file_hashes_cb(media_file_paths)
         for for_old_media_path in media_file_paths:
-            # First we check if the media file exists locally.
-            # If no, we skip this iteration.
-            if not for_old_media_path.is_file():
+            file_content_hash = file_content_hashes.get(for_old_media_path)
+            if file_content_hash is None:
                 continue
 
-            # Generate a hash from the file's content
-            with for_old_media_path.open("rb") as media_file:
-                file_content_hash = hashlib.md5(media_file.read())
-
             # Store the new filename under the old filename key in the dict
             # that will be returned
-            new_media_path = for_old_media_path.parent / (file_content_hash.hexdigest() + for_old_media_path.suffix)
+            new_media_path = for_old_media_path.parent / (file_content_hash + for_old_media_path.suffix)
 
             if self._media_file_should_be_converted_to_webp(for_old_media_path):
                 # The lambda will convert images to the webp format if they are uploaded with a .webp extension and
@@ -488,31 +531,7 @@ class AnkiHubClient(AnkiWebClientMixin):
     def upload_media(
         self, media_paths: Set[Path], ah_did: uuid.UUID, on_media_chunk_uploaded: Callable[[Future], None]
     ) -> None:
-        # Create chunks of media paths to zip and upload each chunk individually.
-        # Each chunk is divided based on the size of all media files in that chunk to
-        # create chunks of similar size.
-        media_path_chunks: List[List[Path]] = []
-        chunk: List[Path] = []
-        current_chunk_size_bytes = 0
-        for media_path in media_paths:
-            if media_path.is_file():
-                current_chunk_size_bytes += media_path.stat().st_size
-                chunk.append(media_path)
-
-            if current_chunk_size_bytes > CHUNK_BYTES_THRESHOLD:
-                media_path_chunks.append(chunk)
-                current_chunk_size_bytes = 0
-                chunk = []
-            else:
-                # We need this so we don't lose chunks of smaller size
-                # that didn't reach the threshold (usually the "tail"
-                # of the list, but it can also happen if we have just
-                # a few media files and all of them sum up to less than the threshold
-                # right on the first chunk)
-                if media_path == list(media_paths)[-1]:
-                    # Check if we're leaving the loop (last iteration) - if yes,
-                    # just close this small chunk before leaving.
-                    media_path_chunks.append(chunk)
+        media_path_chunks = _media_path_chunks(media_paths)
 
         # Get a S3 presigned URL that allows uploading multiple files with a given prefix
         s3_presigned_info = self._get_presigned_url_for_multiple_uploads(prefix=f"deck_assets/{ah_did}")
@@ -564,90 +583,99 @@ class AnkiHubClient(AnkiWebClientMixin):
         if self.should_stop_background_threads:
             return 0
 
-        # Zip the media files found locally
-        zip_filepath = Path(self.local_media_dir_path_cb() / f"{ah_did}_{chunk_number}_deck_assets_part.zip")
-        LOGGER.debug("Creating zipped media file", zip_filepath=zip_filepath)
-        with ZipFile(zip_filepath, "w") as media_zip:
-            for media_path in chunk:
-                if media_path.is_file():
-                    media_zip.write(media_path, arcname=media_path.name)
-
-        def remove_zip() -> None:
-            # Remove the zip file from the local machine after the upload
-            LOGGER.debug("Removing file from local files", zip_filepath=zip_filepath.name)
-            try:
-                os.remove(zip_filepath)
-            except FileNotFoundError:
-                LOGGER.warning(
-                    "Could not remove file from local files.",
-                    zip_filepath=zip_filepath.name,
-                )
-
-        if self.should_stop_background_threads:
-            remove_zip()
-            return 0
-
-        # Upload to S3
-        LOGGER.debug("Uploading file to S3", zip_filepath=zip_filepath.name)
-        self._upload_file_to_s3_with_reusable_presigned_url(s3_presigned_info=s3_presigned_info, filepath=zip_filepath)
-        LOGGER.debug("Successfully uploaded file to S3", zip_filepath=zip_filepath.name)
-        remove_zip()
+        # The zip file is created while it is uploaded, so it is never written to disk
+        zip_name = f"{ah_did}_{chunk_number}_deck_assets_part.zip"
+        LOGGER.debug("Uploading zipped media files to S3", zip_name=zip_name)
+        self._upload_zipped_media_to_s3_with_reusable_presigned_url(
+            s3_presigned_info=s3_presigned_info, zip_name=zip_name, media_paths=chunk
+        )
+        LOGGER.debug("Successfully uploaded zipped media files to S3", zip_name=zip_name)
 
         return len(chunk)
 
-    def _upload_file_to_s3_with_reusable_presigned_url(self, s3_presigned_info: dict, filepath: Path) -> None:
-        """Opens and uploads the file data to S3 using a reusable presigned URL. Useful when uploading
-        multiple media files to the same path while keeping the original filename.
+    def _upload_zipped_media_to_s3_with_reusable_presigned_url(
+        self, s3_presigned_info: dict, zip_name: str, media_paths: List[Path]
+    ) -> None:
+        """Uploads the media files as a zip file to S3 using a reusable presigned URL.
+        The zip file is created while the request body is sent, so it is never held in memory or on disk as a whole.
         :param s3_presigned_info: dict with the reusable presigned URL info.
                                   Obtained as the return of 'get_presigned_url_for_multiple_uploads'
-        :param filepath: the Path object with the location of the file in the system
-        -"""
-        with open(filepath, "rb") as data:
-            url: str = s3_presigned_info["url"]
-            url_suffix = url.split(self.s3_bucket_url)[1]
-            s3_response = self._send_request(
-                "POST",
-                API.S3,
-                url_suffix=url_suffix,
-                data=s3_presigned_info["fields"],
-                files={"file": (filepath.name, data)},
-                is_long_running=True,
-            )
+        :param zip_name: the name of the zip file on S3
+        :param media_paths: the media files which should be included in the zip file
+        """
+        url: str = s3_presigned_info["url"]
+        url_suffix = url.split(self.s3_bucket_url)[1]
+        # The request body is a stream, so it can't be reused for a retry. Instead, a new body is created
+        # for each attempt.
+        for attempt in range(1, LONG_RUNNING_MAX_RETRIES + 1):
+            body = _ZippedMediaFormData(fields=s3_presigned_info["fields"], zip_name=zip_name, media_paths=media_paths)
+            try:
+                s3_response = self._send_request(
+                    "POST",
+                    API.S3,
+                    url_suffix=url_suffix,
+                    data=body,
+                    headers={"Content-Type": body.content_type},
+                )
+            except AnkiHubRequestException as e:
+                if attempt == LONG_RUNNING_MAX_RETRIES:
+                    raise
+
+                LOGGER.info("Retrying upload of zipped media files.", zip_name=zip_name, exc_info=e)
+                continue
+
+            if not _should_retry_for_response(s3_response):
+                break
 
         if s3_response.status_code != 204:
             raise AnkiHubHTTPError(s3_response)
 
     def download_media(
-        self, media_names: List[str], deck_id: uuid.UUID, on_downloaded_file: Callable[[Future], None]
+        self,
+        media_names: List[str],
+        deck_id: uuid.UUID,
+        on_downloaded_file: Callable[[Future], None],
+        on_bytes_downloaded: Optional[Callable[[int], None]] = None,
     ) -> None:
+        """Downloads the media files of the deck into the local media folder.
+        on_downloaded_file is called with the future of each download when it is done (or failed).
+        on_bytes_downloaded is called from the download threads with the number of bytes received,
+        e.g. to show the download speed.
+        Each download thread reuses the connections of its thread-local session.
+        """
         deck_media_remote_dir = f"/deck_assets/{deck_id}/"
-        with ThreadPoolExecutor(max_workers=THREAD_POOL_MAX_WORKERS) as executor:
-            media_dir_path = self.local_media_dir_path_cb()
-            futures: List[Future] = []
-            for media_name in media_names:
+        media_dir_path = self.local_media_dir_path_cb()
+        downloaded_media_count = 0
+        media_names_to_submit = iter(media_names)
+        with ThreadPoolExecutor(max_workers=MEDIA_DOWNLOAD_MAX_WORKERS) as executor:
+            futures: Set[Future] = set()
+            while True:
                 if self.should_stop_background_threads:
                     LOGGER.info("Background threads stopped, aborting download tasks...")
                     for future in futures:
                         future.cancel()
                     return
-                media_path = media_dir_path / media_name
-                media_remote_path = deck_media_remote_dir + urllib.parse.quote_plus(media_name)
-                futures.append(executor.submit(self._download_media, media_path, media_remote_path))
 
-            downloaded_media_count = 0
-            for future in as_completed(futures):
-                if self.should_stop_background_threads:
-                    LOGGER.info("Background threads stopped, aborting download tasks...")
-                    for future in futures:
-                        future.cancel()
-                    return
-                try:
-                    on_downloaded_file(future)
-                    future.result()
-                    downloaded_media_count += 1
-                except Exception as exc:
-                    if not isinstance(exc, AnkiHubMediaDownloadError):
-                        LOGGER.warning("Failed to download media file", exc_info=exc)
+                # Keep the queue of downloads filled, without submitting all downloads at once
+                for media_name in itertools.islice(media_names_to_submit, MEDIA_DOWNLOAD_MAX_QUEUED - len(futures)):
+                    media_path = media_dir_path / media_name
+                    media_remote_path = deck_media_remote_dir + urllib.parse.quote_plus(media_name)
+                    futures.add(
+                        executor.submit(self._download_media, media_path, media_remote_path, on_bytes_downloaded)
+                    )
+
+                if not futures:
+                    break
+
+                done_futures, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done_futures:
+                    try:
+                        on_downloaded_file(future)
+                        future.result()
+                        downloaded_media_count += 1
+                    except Exception as exc:
+                        if not isinstance(exc, AnkiHubMediaDownloadError):
+                            LOGGER.warning("Failed to download media file", exc_info=exc)
         LOGGER.info(
             "Downloaded media from AnkiHub.",
             ah_did=deck_id,
@@ -655,30 +683,107 @@ class AnkiHubClient(AnkiWebClientMixin):
             downloaded_count=downloaded_media_count,
         )
 
-    def _download_media(self, media_file_path: Path, media_remote_path: str) -> None:
-        response = self._send_request("GET", API.S3, media_remote_path, stream=True)
-        # Log and skip this iteration if the response is not 200 OK
-        if response.ok:
-            # If we get a valid response, open the file and write the content
-            with open(media_file_path, "wb") as file:
-                for block in response.iter_content(1024):
-                    if not block:
-                        break
+    def _download_media(
+        self,
+        media_file_path: Path,
+        media_remote_path: str,
+        on_bytes_downloaded: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        """Downloads a media file to a temporary file which is renamed to the media file once it is complete.
+        If the download is interrupted, it is resumed from the end of the temporary file.
+        """
+        temp_file_path = media_file_path.with_name(MEDIA_DOWNLOAD_TEMP_FILE_PREFIX + media_file_path.name)
+        is_completed = False
+
+        @retry(
+            stop=stop_after_attempt(MEDIA_DOWNLOAD_MAX_ATTEMPTS),
+            wait=wait_exponential(multiplier=1, max=10),
+            retry=RETRY_CONDITION | retry_if_exception_type(AnkiHubRequestException),
+        )
+        def download_with_resume() -> Response:
+            nonlocal is_completed
+            downloaded_size = temp_file_path.stat().st_size if temp_file_path.exists() else 0
+            response = self._send_request(
+                "GET",
+                API.S3,
+                media_remote_path,
+                stream=True,
+                headers={"Range": f"bytes={downloaded_size}-"} if downloaded_size else None,
+            )
+            if response.status_code == 416:
+                # The temporary file is not a prefix of the media file, start over
+                response.close()
+                temp_file_path.unlink()
+                response = self._send_request("GET", API.S3, media_remote_path, stream=True)
+
+            with response:
+                if response.ok:
+                    # If the server ignored the Range header, the whole file is downloaded again
+                    is_completed = self._write_media_file_content(
+                        response,
+                        temp_file_path,
+                        append=response.status_code == 206,
+                        on_bytes_downloaded=on_bytes_downloaded,
+                    )
+            return response
+
+        try:
+            try:
+                response = download_with_resume()
+            except RetryError as e:
+                last_attempt = cast(Future, e.last_attempt)
+                try:
+                    response = last_attempt.result()
+                except AnkiHubRequestException:
+                    raise
+                except Exception as e:
+                    raise AnkiHubRequestException(e) from e
 
-                    file.write(block)
+            if not response.ok:
+                LOGGER.warning(
+                    "Unable to download media file.",
+                    media_remote_path=media_remote_path,
+                    status_code=response.status_code,
+                )
+                raise AnkiHubMediaDownloadError(response, media_remote_path)
 
-                    if self.should_stop_background_threads:
-                        # Remove incomplete file if the download was interrupted
-                        file.close()
-                        media_file_path.unlink()
+            if is_completed:
+                temp_file_path.replace(media_file_path)
+        finally:
+            # Remove the temporary file if the download failed or was stopped
+            temp_file_path.unlink(missing_ok=True)
 
-        else:
-            LOGGER.warning(
-                "Unable to download media file.",
-                media_remote_path=media_remote_path,
-                status_code=response.status_code,
+    def _write_media_file_content(
+        self,
+        response: Response,
+        file_path: Path,
+        append: bool,
+        on_bytes_downloaded: Optional[Callable[[int], None]],
+    ) -> bool:
+        """Writes the content of the response to the file.
+        Returns False if the download was stopped before the content was written completely."""
+        expected_size = int(response.headers.get("Content-Length") or 0)
+        # Small files are written in one chunk, large files in chunks which are large enough
+        # to keep the per-chunk overhead low but small enough to stop the download quickly.
+        chunk_size = min(max(expected_size, MEDIA_DOWNLOAD_MIN_CHUNK_SIZE), MEDIA_DOWNLOAD_MAX_CHUNK_SIZE)
+        received_size = 0
+        with open(file_path, "ab" if append else "wb") as file:
+            for chunk in response.iter_content(chunk_size):
+                if self.should_stop_background_threads:
+                    return False
+
+                file.write(chunk)
+                received_size += len(chunk)
+                if on_bytes_downloaded:
+                    on_bytes_downloaded(len(chunk))
+
+        if expected_size and received_size < expected_size:
+            # The connection was closed before the whole content was received
+            raise requests.exceptions.ChunkedEncodingError(
+                f"Received {received_size} of {expected_size} bytes of {response.url}"
             )
-            raise AnkiHubMediaDownloadError(response, media_remote_path)
+
+        return True
 
     def stop_background_threads(self) -> None:
         """Can be called to stop all background threads started by this client."""
@@ -723,51 +828,67 @@ class AnkiHubClient(AnkiWebClientMixin):
         download_progress_cb: Optional[Callable[[int], None]] = None,
         s3_presigned_url: Optional[str] = None,
     ) -> List[NoteInfo]:
+        return [
+            note_data
+            for notes_data_batch in self.download_deck_in_batches(
+                ah_did,
+                download_progress_cb=download_progress_cb,
+                s3_presigned_url=s3_presigned_url,
+            )
+            for note_data in notes_data_batch
+        ]
+
+    def download_deck_in_batches(
+        self,
+        ah_did: uuid.UUID,
+        download_progress_cb: Optional[Callable[[int], None]] = None,
+        s3_presigned_url: Optional[str] = None,
+        batch_size: int = DECK_CSV_BATCH_SIZE,
+    ) -> Iterator[List[NoteInfo]]:
+        """Downloads the deck CSV of the deck and yields its notes in batches of at most batch_size notes.
+
+        The CSV (which can be gzipped) is decompressed and parsed while it is being downloaded,
+        so only one chunk of the response and one batch of notes are held in memory at a time.
+        download_progress_cb gets passed the percentage of the download progress.
+        """
         if not s3_presigned_url:
             deck_info = self.get_deck_by_id(ah_did)
             s3_url_suffix = self._presigned_url_suffix_from_key(key=deck_info.csv_notes_filename, action="download")
         else:
             s3_url_suffix = self._presigned_url_suffix_from_url(s3_presigned_url)
 
-        if download_progress_cb:
-            s3_response_content = self._download_with_progress_cb(s3_url_suffix, download_progress_cb)
-        else:
-            s3_response = self._send_request("GET", API.S3, s3_url_suffix, is_long_running=True)
-            if s3_response.status_code != 200:
-                raise AnkiHubHTTPError(s3_response)
-            s3_response_content = s3_response.content
-
         csv_filename = s3_url_suffix[1:].split("?", maxsplit=1)[0]
-        if csv_filename.endswith(".gz"):
-            deck_csv_content = gzip.decompress(s3_response_content).decode("utf-8")
-        else:
-            deck_csv_content = s3_response_content.decode("utf-8")
-
-        reader = csv.DictReader(deck_csv_content.splitlines(), delimiter=CSV_DELIMITER, quotechar="'")
-        # TODO Validate .csv
-        notes_data_raw = [row for row in reader]
-        notes_data_raw = _transform_notes_data(notes_data_raw)
-        notes_data = [NoteInfo.from_dict(row) for row in notes_data_raw]
-
-        return notes_data
 
-    def _download_with_progress_cb(self, s3_url_suffix: str, progress_cb: Callable[[int], None]) -> bytes:
         with self._send_request("GET", API.S3, s3_url_suffix, stream=True, is_long_running=True) as response:
             if response.status_code != 200:
                 raise AnkiHubHTTPError(response)
 
-            total_size = int(response.headers.get("content-length"))
-            if total_size == 0:
-                return response.content
+            byte_chunks: Iterator[bytes]
+            total_size = int(response.headers.get("content-length") or 0)
+            if download_progress_cb and total_size:
+                chunk_size = max(int(min(total_size * 0.05, DECK_DOWNLOAD_CHUNK_SIZE)), 1)
+                byte_chunks = _chunks_with_progress_cb(
+                    response.iter_content(chunk_size=chunk_size),
+                    total_size=total_size,
+                    progress_cb=download_progress_cb,
+                )
+            else:
+                byte_chunks = response.iter_content(chunk_size=DECK_DOWNLOAD_CHUNK_SIZE)
 
-            content = b""
-            chunk_size = int(min(total_size * 0.05, 10**6))
-            for i, chunk in enumerate(response.iter_content(chunk_size=chunk_size), start=1):
-                if chunk:
-                    percent = int(i * chunk_size / total_size * 100)
-                    progress_cb(percent)
-                    content += chunk
-        return content
+            if csv_filename.endswith(".gz"):
+                byte_chunks = _gunzipped_chunks(byte_chunks)
+
+            reader = csv.DictReader(_decoded_lines(byte_chunks), delimiter=CSV_DELIMITER, quotechar="'")
+            # TODO Validate .csv
+            rows: List[Dict] = []
+            for row in reader:
+                rows.append(row)
+                if len(rows) >= batch_size:
+                    yield [NoteInfo.from_dict(row) for row in _transform_notes_data(rows)]
+                    rows = []
+
+            if rows:
+                yield [NoteInfo.from_dict(row) for row in _transform_notes_data(rows)]
 
     def get_deck_updates(
         self,
@@ -798,7 +919,7 @@ class AnkiHubClient(AnkiWebClientMixin):
         notes_data_from_csv = []
         notes_data_from_json = []
         latest_update = None
-        for chunk in self._get_deck_updates_inner(
+        for chunk in self.get_deck_updates_chunks(
             ah_did,
             since,
             download_full_deck,
@@ -812,8 +933,7 @@ class AnkiHubClient(AnkiWebClientMixin):
                 continue
 
             if chunk.from_csv:
-                # The CSV contains all notes, so we assign instead of extending
-                notes_data_from_csv = chunk.notes
+                notes_data_from_csv.extend(chunk.notes)
             else:
                 notes_data_from_json.extend(chunk.notes)
 
@@ -833,6 +953,32 @@ class AnkiHubClient(AnkiWebClientMixin):
             protected_tags=chunk.protected_tags,
         )
 
+    def get_deck_updates_chunks(
+        self,
+        ah_did: uuid.UUID,
+        since: datetime,
+        download_full_deck: bool = False,
+        updates_download_progress_cb: Optional[Callable[[int], None]] = None,
+        deck_download_progress_cb: Optional[Callable[[int], None]] = None,
+    ) -> Iterator[DeckUpdatesChunk]:
+        """
+        Lazily fetches updates for a specific deck from the AnkiHub server, one page at a time.
+        Unlike get_deck_updates, this doesn't hold all updates in memory at once.
+
+        If the deck CSV is downloaded, its notes are yielded in chunks with from_csv set to True,
+        followed by the chunks of updates which were made after the CSV was created.
+        When a note is contained in multiple chunks, the version in the later chunk is the more recent one.
+
+        The arguments are the same as for get_deck_updates.
+        """
+        yield from self._get_deck_updates_inner(
+            ah_did,
+            since,
+            download_full_deck,
+            updates_download_progress_cb,
+            deck_download_progress_cb,
+        )
+
     def _get_deck_updates_inner(
         self,
         ah_did: uuid.UUID,
@@ -872,14 +1018,13 @@ class AnkiHubClient(AnkiWebClientMixin):
             url_suffix = data["next"].split("/api", maxsplit=1)[1] if data["next"] else None
 
             if data["external_notes_url"]:
-                notes_data_deck = self.download_deck(
+                chunk = DeckUpdatesChunk.from_dict({**data, "from_csv": True})
+                for notes_data_batch in self.download_deck_in_batches(
                     ah_did,
                     deck_download_progress_cb,
                     s3_presigned_url=data["external_notes_url"],
-                )
-                chunk = DeckUpdatesChunk.from_dict({**data, "from_csv": True})
-                chunk.notes = notes_data_deck
-                yield chunk
+                ):
+                    yield dataclasses.replace(chunk, notes=notes_data_batch)
 
                 # Get the rest of the updates, because the CSV is most likely not completely up to date
                 yield from self._get_deck_updates_inner(
@@ -1037,9 +1182,22 @@ class AnkiHubClient(AnkiWebClientMixin):
     def _create_suggestion_in_bulk_inner(
         self, suggestions: Sequence[NoteSuggestion], url: str, auto_accept: bool
     ) -> Dict[int, Dict[str, List[str]]]:
-        if not suggestions:
-            return {}
+        # The suggestions are sent in pages, so that large bulk suggestions don't result in huge requests
+        # which take long for the server to process.
+        errors_by_anki_nid: Dict[int, Dict[str, List[str]]] = {}
+        for page_start in range(0, len(suggestions), SUGGESTIONS_BULK_PAGE_SIZE):
+            errors_by_anki_nid.update(
+                self._create_suggestions_page(
+                    suggestions=suggestions[page_start : page_start + SUGGESTIONS_BULK_PAGE_SIZE],
+                    url=url,
+                    auto_accept=auto_accept,
+                )
+            )
+        return errors_by_anki_nid
 
+    def _create_suggestions_page(
+        self, suggestions: Sequence[NoteSuggestion], url: str, auto_accept: bool
+    ) -> Dict[int, Dict[str, List[str]]]:
         response = self._send_request(
             "POST",
             API.ANKIHUB,
@@ -1377,15 +1535,212 @@ class AnkiHubClient(AnkiWebClientMixin):
 
 
 class ThreadLocalSession:
-    def __init__(self):
+    def __init__(self, pool_maxsize: int = DEFAULT_POOLSIZE):
         self.local = threading.local()
+        self.pool_maxsize = pool_maxsize
 
     def get(self) -> Session:
         if not hasattr(self.local, "session"):
-            self.local.session = Session()
+            session = Session()
+            adapter = HTTPAdapter(pool_maxsize=self.pool_maxsize)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self.local.session = session
         return self.local.session
 
 
+def _media_path_chunks(media_paths: Iterable[Path]) -> List[List[Path]]:
+    """Divides the media files into chunks, so that each chunk can be zipped and uploaded individually.
+    A chunk is closed as soon as the size of its files exceeds CHUNK_BYTES_THRESHOLD, to create chunks of
+    similar size. Files which don't exist are skipped."""
+    result: List[List[Path]] = []
+    chunk: List[Path] = []
+    current_chunk_size_bytes = 0
+    for media_path in media_paths:
+        if not media_path.is_file():
+            continue
+
+        current_chunk_size_bytes += media_path.stat().st_size
+        chunk.append(media_path)
+        if current_chunk_size_bytes > CHUNK_BYTES_THRESHOLD:
+            result.append(chunk)
+            current_chunk_size_bytes = 0
+            chunk = []
+
+    # The last chunk can be smaller than the threshold
+    if chunk:
+        result.append(chunk)
+
+    return result
+
+
+class _ZippedMediaFormData:
+    """A multipart/form-data request body for uploading media files as a zip file to S3.
+
+    The zip file is created while the body is read, so that only a small part of it is held in memory at once.
+    S3 doesn't accept chunked uploads, so the size of the body is computed in advance. This is possible because
+    the files are stored in the zip file without compression.
+    """
+
+    def __init__(self, fields: Dict[str, str], zip_name: str, media_paths: List[Path]):
+        boundary = choose_boundary()
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+
+        header_parts: List[bytes] = []
+        for name, value in fields.items():
+            field = RequestField(name=name, data=value)
+            field.make_multipart()
+            header_parts.extend(
+                [f"--{boundary}\r\n".encode(), field.render_headers().encode(), value.encode(), b"\r\n"]
+            )
+        file_field = RequestField(name="file", data=b"", filename=zip_name)
+        file_field.make_multipart()
+        header_parts.extend([f"--{boundary}\r\n".encode(), file_field.render_headers().encode()])
+        self._header = b"".join(header_parts)
+        self._footer = f"\r\n--{boundary}--\r\n".encode()
+
+        self._media_paths = media_paths
+        self._media_sizes = [media_path.stat().st_size for media_path in media_paths]
+        self._length = len(self._header) + _stored_zip_size(media_paths, self._media_sizes) + len(self._footer)
+
+        self._parts = self._generate_parts()
+        self._current_part = b""
+        self._position_in_current_part = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            result = self._current_part[self._position_in_current_part :] + b"".join(self._parts)
+            self._current_part = b""
+            self._position_in_current_part = 0
+            return result
+
+        while self._position_in_current_part >= len(self._current_part):
+            next_part = next(self._parts, None)
+            if next_part is None:
+                return b""
+            self._current_part = next_part
+            self._position_in_current_part = 0
+
+        result = self._current_part[self._position_in_current_part : self._position_in_current_part + size]
+        self._position_in_current_part += len(result)
+        return result
+
+    def _generate_parts(self) -> Iterator[bytes]:
+        yield self._header
+
+        buffer = _WriteBuffer()
+        with ZipFile(buffer, "w") as media_zip:
+            for media_path, media_size in zip(self._media_paths, self._media_sizes):
+                zip_info = ZipInfo.from_file(media_path, arcname=media_path.name)
+                if zip_info.file_size != media_size:
+                    raise ValueError(f"Media file was changed while it was uploaded: {media_path}")
+
+                with open(media_path, "rb") as media_file, media_zip.open(zip_info, "w") as zip_entry:
+                    while data := media_file.read(MEDIA_UPLOAD_READ_CHUNK_SIZE):
+                        zip_entry.write(data)
+                        yield buffer.take()
+                yield buffer.take()
+        yield buffer.take()
+
+        yield self._footer
+
+
+class _WriteBuffer:
+    """A minimal non-seekable file object which collects the data written to it until it is taken."""
+
+    def __init__(self) -> None:
+        self._data: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._data.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        result = b"".join(self._data)
+        self._data = []
+        return result
+
+
+def _stored_zip_size(media_paths: List[Path], media_sizes: List[int]) -> int:
+    """Returns the size of a zip file created by ZipFile from the files without compression,
+    when it is written to a non-seekable file object."""
+    result = ZIP_END_OF_CENTRAL_DIRECTORY_SIZE
+    for media_path, media_size in zip(media_paths, media_sizes):
+        name_size = len(media_path.name.encode("utf-8"))
+        result += (
+            ZIP_LOCAL_FILE_HEADER_SIZE
+            + name_size
+            + media_size
+            + ZIP_DATA_DESCRIPTOR_SIZE
+            + ZIP_CENTRAL_DIRECTORY_HEADER_SIZE
+            + name_size
+        )
+
+    if result > ZIP64_LIMIT:
+        # ZipFile would add zip64 records, which are not included in the calculation
+        raise ValueError("Zip files larger than 2 GB are not supported.")
+
+    return result
+
+
+def _media_file_hashes(media_paths: Sequence[Path]) -> Dict[Path, str]:
+    return {media_path: md5_file_content_hash(media_path) for media_path in media_paths if media_path.is_file()}
+
+
+def _chunks_with_progress_cb(
+    chunks: Iterable[bytes], total_size: int, progress_cb: Callable[[int], None]
+) -> Iterator[bytes]:
+    """Passes the chunks through and calls progress_cb with the percentage of total_size received so far."""
+    received_size = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        received_size += len(chunk)
+        progress_cb(min(int(received_size / total_size * 100), 100))
+        yield chunk
+
+
+def _gunzipped_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Decompresses gzipped data incrementally. Like gzip.decompress, it supports multiple concatenated members."""
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    received_data = False
+    for chunk in chunks:
+        while chunk:
+            received_data = True
+            yield decompressor.decompress(chunk)
+            chunk = b""
+            if decompressor.eof:
+                # The rest of the chunk belongs to the next member (if there is one).
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+                received_data = False
+
+    if received_data and not decompressor.eof:
+        raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+    yield decompressor.flush()
+
+
+def _decoded_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Decodes UTF-8 encoded chunks and yields the lines of the text without line endings,
+    the same way str.splitlines would."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    incomplete_line = ""
+    for chunk in chunks:
+        lines = (incomplete_line + decoder.decode(chunk)).splitlines(keepends=True)
+        # The last line is held back because it can continue in the next chunk.
+        incomplete_line = lines.pop() if lines else ""
+        for line in lines:
+            yield from line.splitlines()
+
+    yield from (incomplete_line + decoder.decode(b"", final=True)).splitlines()
+
+
 def _transform_notes_data(notes_data: List[Dict]) -> List[Dict]:
     # TODO Fix differences between csv (used when installing for the first time) vs.
     # json in responses (used when getting updates).
@@ -13,7 +13,7 @@ from mashumaro import field_options
 from mashumaro.config import BaseConfig
 from mashumaro.mixins.json import DataClassJSONMixin
 
-from ..common_utils import get_media_names_from_note_field, get_media_names_from_note_type
+from ..common_utils import get_media_names_from_note_fields, get_media_names_from_note_type
 
 ANKIHUB_DATETIME_FORMAT_STR = "%Y-%m-%dT%H:%M:%S.%f%z"
 
@@ -347,10 +347,10 @@ def get_media_names_from_suggestions(
 
 
 def get_media_names_from_suggestion(suggestion: NoteSuggestion, note_type: Dict[str, Any]) -> Set[str]:
-    result = {name for field in suggestion.fields for name in get_media_names_from_note_field(field.value, note_type)}
+    result = get_media_names_from_note_fields((field.value for field in suggestion.fields), note_type)
     return result
 
 
 def get_media_names_from_note_info(note_info: NoteInfo, note_type: Dict[str, Any]) -> Set[str]:
-    result = {name for field in note_info.fields for name in get_media_names_from_note_field(field.value, note_type)}
+    result = get_media_names_from_note_fields((field.value for field in note_info.fields), note_type)
     return result
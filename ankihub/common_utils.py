@@ -3,13 +3,24 @@
 import hashlib
 import html
 import re
-from typing import Set
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import FrozenSet, Iterable, Set, Tuple
 
 from anki.models import NotetypeDict
 from anki.utils import strip_html
 
+# Size of the chunks in which files are read when hashing them, so that large files are not loaded into memory at once
+FILE_HASH_CHUNK_SIZE = 1024 * 1024
+
 # Media extraction logic is ported from Anki - see rslib/src/text.rs
 
+# The media names of field contents are cached, because the same fields are processed several times, e.g. when
+# notes are imported and when the media of their deck is synced. The cache is keyed by a hash of the field content,
+# so that the field contents themselves are not kept in memory.
+MEDIA_NAMES_CACHE_MAX_SIZE = 50_000
+
 HTML_MEDIA_TAGS = re.compile(
     r"""(?xsi)
     # the start of the image, audio, object, or source tag
@@ -213,9 +224,55 @@ def get_media_names_from_note_type(note_type: NotetypeDict) -> Set[str]:
 
 def get_media_names_from_note_field(html_content: str, note_type: NotetypeDict) -> Set[str]:
     """Gather local media filenames from field content."""
-    result: Set[str] = set()
-    result.update(_extract_html_media_refs(html_content))
-    result.update(_extract_av_tags(html_content))
-    result.update(_extract_latex(html_content, _prefers_svg_latex(note_type)))
+    return set(_media_names_from_field(html_content, _prefers_svg_latex(note_type)))
 
+
+def get_media_names_from_note_fields(html_contents: Iterable[str], note_type: NotetypeDict) -> Set[str]:
+    """Gather local media filenames from the contents of multiple fields of notes of the given note type."""
+    svg = _prefers_svg_latex(note_type)
+    result: Set[str] = set()
+    for html_content in html_contents:
+        result.update(_media_names_from_field(html_content, svg))
     return result
+
+
+_media_names_cache: "OrderedDict[Tuple[bytes, bool], FrozenSet[str]]" = OrderedDict()
+_media_names_cache_lock = threading.Lock()
+
+
+def _media_names_from_field(html_content: str, svg: bool) -> FrozenSet[str]:
+    # Media references start with "<" (HTML tags) or "[" (sound and LaTeX tags), so fields without these
+    # characters, which are most fields, don't need to be searched or cached.
+    if "<" not in html_content and "[" not in html_content:
+        return frozenset()
+
+    key = (hashlib.md5(html_content.encode()).digest(), svg)
+    with _media_names_cache_lock:
+        if (cached_result := _media_names_cache.get(key)) is not None:
+            _media_names_cache.move_to_end(key)
+            return cached_result
+
+    result: Set[str] = set()
+    if "<" in html_content:
+        result.update(_extract_html_media_refs(html_content))
+    if "[sound:" in html_content:
+        result.update(_extract_av_tags(html_content))
+    if "[" in html_content:
+        result.update(_extract_latex(html_content, svg))
+    frozen_result = frozenset(result)
+
+    with _media_names_cache_lock:
+        _media_names_cache[key] = frozen_result
+        if len(_media_names_cache) > MEDIA_NAMES_CACHE_MAX_SIZE:
+            _media_names_cache.popitem(last=False)
+
+    return frozen_result
+
+
+def md5_file_content_hash(file_path: Path) -> str:
+    """Return the md5 hash of the content of the file. The file is read in chunks."""
+    file_content_hash = hashlib.md5()
+    with file_path.open("rb") as file:
+        while chunk := file.read(FILE_HASH_CHUNK_SIZE):
+            file_content_hash.update(chunk)
+    return file_content_hash.hexdigest()
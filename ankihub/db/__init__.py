@@ -1,6 +1,8 @@
 from .db import (  # noqa: F401
     NOTE_NOT_DELETED_CONDITION,
     ankihub_db,
+    ankihub_rows_json,
+    ankihub_rows_table,
     execute_list_query_in_chunks,
     flat,
 )
@@ -11,7 +11,9 @@ Some differences between data stored in the AnkiHub database and the Anki databa
 - decks, notes and note types can be missing from the Anki database or be modified.
 """
 
+import json
 import logging
+import stat
 import time
 import uuid
 from pathlib import Path
@@ -35,17 +37,25 @@ from anki.models import NotetypeDict, NotetypeId
 from anki.notes import NoteId
 from anki.utils import ids2str
 from peewee import DQ, SqliteDatabase
+from peewee import Field as PeeweeField
 
 from ..ankihub_client import Field, NoteInfo, suggestion_type_from_str
 from ..ankihub_client.models import DeckMedia as DeckMediaClientModel
 from ..ankihub_client.models import SuggestionType
-from ..common_utils import get_media_names_from_note_field, get_media_names_from_note_type
+from ..common_utils import (
+    get_media_names_from_note_fields,
+    get_media_names_from_note_type,
+    md5_file_content_hash,
+)
 from ..settings import ANKIHUB_NOTE_TYPE_FIELD_NAME
 from .exceptions import IntegrityError, MissingValueError
 from .models import (
     AnkiHubNote,
     AnkiHubNoteType,
     DeckMedia,
+    MediaFileHash,
+    NoteMedia,
+    NoteTag,
     bind_peewee_models,
     create_tables,
     get_peewee_database,
@@ -65,7 +75,8 @@ DEFAULT_CHUNK_SIZE = 30_000
 # Timeout duration for the write lock. We use a timeout to make sure that deadlocks don't occur.
 WRITE_LOCK_TIMEOUT_SECONDS = 10
 
-NOTE_NOT_DELETED_CONDITION = DQ(last_update_type__is=None) | DQ(last_update_type__ne=SuggestionType.DELETE.value[0])
+NOTE_NOT_DELETED_CONDITION = DQ(is_deleted=False)
+
 
 
 class _AnkiHubDB:
@@ -83,7 +94,7 @@ class _AnkiHubDB:
         if self.schema_version() == 0:
             bind_peewee_models()
             create_tables()
-            get_peewee_database().pragma("user_version", 13)
+            get_peewee_database().pragma("user_version", 18)
         else:
             from .db_migrations import migrate_ankihub_db
 
@@ -150,16 +161,45 @@ class _AnkiHubDB:
                     "last_update_type": (
                         note_data.last_update_type.value[0] if note_data.last_update_type is not None else None
                     ),
+                    "is_deleted": note_data.last_update_type == SuggestionType.DELETE,
                 }
             )
             upserted_notes.append(note_data)
 
+        # Determine the media references of the notes, so that they don't have to be extracted from the
+        # note fields every time they are needed.
+        note_types: Dict[int, NotetypeDict] = dict(
+            AnkiHubNoteType.select(AnkiHubNoteType.anki_note_type_id, AnkiHubNoteType.note_type_dict)
+            .filter(anki_note_type_id__in=mids_of_notes)
+            .tuples()
+        )
+        note_media_dicts = [
+            note_media_dict
+            for note_dict in note_dicts
+            for note_media_dict in _note_media_dicts(note_dict, note_types[note_dict["anki_note_type_id"]])
+        ]
+        note_tag_dicts = [note_tag_dict for note_dict in note_dicts for note_tag_dict in _note_tag_dicts(note_dict)]
+
         # The chunk size is chosen as 1/10 of the default chunk size, because we need < 10 SQL variables
         # for each deck media entry. The purpose is to avoid the "too many SQL variables" error.
         with self.write_lock, self.db.atomic():
             for chunk in chunks(note_dicts, int(DEFAULT_CHUNK_SIZE / 10)):
                 AnkiHubNote.insert_many(chunk).on_conflict_replace().execute()
 
+            execute_modifying_query_in_chunks(
+                lambda ah_nids: NoteMedia.delete().where(NoteMedia.ankihub_note_id.in_(ah_nids)).execute(),
+                ids=[note_dict["ankihub_note_id"] for note_dict in note_dicts],
+            )
+            for chunk in chunks(note_media_dicts, int(DEFAULT_CHUNK_SIZE / 10)):
+                NoteMedia.insert_many(chunk).on_conflict_ignore().execute()
+
+            execute_modifying_query_in_chunks(
+                lambda ah_nids: NoteTag.delete().where(NoteTag.ankihub_note_id.in_(ah_nids)).execute(),
+                ids=[note_dict["ankihub_note_id"] for note_dict in note_dicts],
+            )
+            for chunk in chunks(note_tag_dicts, int(DEFAULT_CHUNK_SIZE / 10)):
+                NoteTag.insert_many(chunk).on_conflict_ignore().execute()
+
         return tuple(upserted_notes), tuple(skipped_notes)
 
     def _determine_notes_to_skip(self, notes_data: List[NoteInfo], ankihub_did: uuid.UUID) -> List[NoteInfo]:
@@ -207,6 +247,14 @@ class _AnkiHubDB:
                 lambda ah_nids: (AnkiHubNote.delete().where(AnkiHubNote.ankihub_note_id.in_(ah_nids)).execute(),),
                 ids=ah_nids,
             )
+            execute_modifying_query_in_chunks(
+                lambda ah_nids: NoteMedia.delete().where(NoteMedia.ankihub_note_id.in_(ah_nids)).execute(),
+                ids=ah_nids,
+            )
+            execute_modifying_query_in_chunks(
+                lambda ah_nids: NoteTag.delete().where(NoteTag.ankihub_note_id.in_(ah_nids)).execute(),
+                ids=ah_nids,
+            )
 
     def update_mod_values_based_on_anki_db(self, notes_data: Sequence[NoteInfo]) -> None:
         """Updates the 'mod' values of notes in the AnkiHub database based on
@@ -382,6 +430,24 @@ class _AnkiHubDB:
         not_existing = set(ankihub_nids) - set(ah_nid_to_anki_nid.keys())
         return ah_nid_to_anki_nid | dict.fromkeys(not_existing)
 
+    def anki_nids_to_ankihub_nids(self, anki_nids: List[NoteId]) -> Dict[NoteId, Optional[uuid.UUID]]:
+        anki_nid_to_ah_nid = dict(
+            execute_list_query_in_chunks(
+                lambda anki_nids: (
+                    AnkiHubNote.select(AnkiHubNote.anki_note_id, AnkiHubNote.ankihub_note_id)
+                    .filter(
+                        NOTE_NOT_DELETED_CONDITION,
+                        anki_note_id__in=anki_nids,
+                    )
+                    .tuples()
+                ),
+                ids=anki_nids,
+            )
+        )
+
+        not_existing = set(anki_nids) - set(anki_nid_to_ah_nid.keys())
+        return anki_nid_to_ah_nid | dict.fromkeys(not_existing)
+
     def anki_nid_for_ankihub_nid(self, ankihub_id: uuid.UUID) -> Optional[NoteId]:
         return (
             AnkiHubNote.select(AnkiHubNote.anki_note_id)
@@ -393,12 +459,28 @@ class _AnkiHubDB:
         """Removes all data for the given deck from the AnkiHub DB"""
         with self.write_lock, self.db.atomic():
             AnkiHubNote.delete().where(AnkiHubNote.ankihub_deck_id == ankihub_did).execute()
+            NoteMedia.delete().where(NoteMedia.ankihub_deck_id == ankihub_did).execute()
+            NoteTag.delete().where(NoteTag.ankihub_deck_id == ankihub_did).execute()
             self.remove_note_types_of_deck(ankihub_did)
             DeckMedia.delete().where(DeckMedia.ankihub_deck_id == ankihub_did).execute()
 
     def last_sync(self, ankihub_note_id: uuid.UUID) -> Optional[int]:
         return AnkiHubNote.select(AnkiHubNote.mod).filter(ankihub_note_id=ankihub_note_id).scalar()
 
+    def last_syncs(self, ankihub_note_ids: Iterable[uuid.UUID]) -> Dict[uuid.UUID, Optional[int]]:
+        """Returns a dict mapping ankihub note ids to the last_sync values of the notes.
+        Not found ids are omitted from the dict."""
+        return dict(
+            execute_list_query_in_chunks(
+                lambda ankihub_note_ids: (
+                    AnkiHubNote.select(AnkiHubNote.ankihub_note_id, AnkiHubNote.mod)
+                    .filter(ankihub_note_id__in=ankihub_note_ids)
+                    .tuples()
+                ),
+                ids=list(ankihub_note_ids),
+            )
+        )
+
     def ankihub_dids_of_decks_with_missing_values(self) -> List[uuid.UUID]:
         # currently only checks the guid, fields and tags columns
         return (
@@ -448,26 +530,25 @@ class _AnkiHubDB:
 
     def media_names_for_ankihub_deck(self, ah_did: uuid.UUID) -> Set[str]:
         """Returns the names of all media files which are referenced on notes in the given deck."""
-        notes = AnkiHubNote.select(AnkiHubNote.anki_note_type_id, AnkiHubNote.fields).filter(
-            NOTE_NOT_DELETED_CONDITION,
-            ankihub_deck_id=ah_did,
-        )
-        note_type_ids = set(note.anki_note_type_id for note in notes)
-        note_types: Dict[int, NotetypeDict] = {
-            nt.anki_note_type_id: nt.note_type_dict
-            for nt in AnkiHubNoteType.select(AnkiHubNoteType.anki_note_type_id, AnkiHubNoteType.note_type_dict).filter(
-                anki_note_type_id__in=note_type_ids
+        note_type_ids = set(
+            AnkiHubNote.select(AnkiHubNote.anki_note_type_id)
+            .distinct()
+            .filter(
+                NOTE_NOT_DELETED_CONDITION,
+                ankihub_deck_id=ah_did,
             )
-        }
+            .objects(flat)
+        )
         note_type_refs = {
-            name for note_type in note_types.values() for name in get_media_names_from_note_type(note_type)
-        }
-        note_refs = {
-            media_name
-            for note in notes
-            for field_value in (note.fields.values() if note.fields else [])
-            for media_name in get_media_names_from_note_field(field_value, note_types[note.anki_note_type_id])
+            name
+            for note_type in AnkiHubNoteType.select(AnkiHubNoteType.note_type_dict)
+            .filter(anki_note_type_id__in=note_type_ids)
+            .objects(flat)
+            for name in get_media_names_from_note_type(note_type)
         }
+        note_refs = set(
+            NoteMedia.select(NoteMedia.media_name).distinct().filter(ankihub_deck_id=ah_did).objects(flat)
+        )
 
         return {*note_type_refs, *note_refs}
 
@@ -531,6 +612,78 @@ class _AnkiHubDB:
             if (matching_media := hash_to_media.get(media_hash)) is not None
         }
 
+    def media_file_hashes(self, media_paths: Iterable[Path]) -> Dict[Path, str]:
+        """Returns the md5 hashes of the content of the given media files.
+        The hashes are cached in the AnkiHub DB together with the size and modification time of the files.
+        Only files which changed since they were last hashed are read, for all others a stat call is enough.
+        Paths which don't point to an existing file are not included in the result.
+        """
+        stat_results: Dict[Path, Tuple[int, int]] = {}
+        missing_paths: List[str] = []
+        for media_path in media_paths:
+            try:
+                stat_result = media_path.stat()
+            except OSError:
+                missing_paths.append(str(media_path))
+                continue
+            if not stat.S_ISREG(stat_result.st_mode):
+                missing_paths.append(str(media_path))
+                continue
+            stat_results[media_path] = (stat_result.st_size, stat_result.st_mtime_ns)
+
+        cached_hashes: Dict[str, Tuple[int, int, str]] = {
+            path: (size, mtime_ns, file_content_hash)
+            for path, size, mtime_ns, file_content_hash in execute_list_query_in_chunks(
+                lambda paths: (
+                    MediaFileHash.select(
+                        MediaFileHash.path,
+                        MediaFileHash.size,
+                        MediaFileHash.mtime_ns,
+                        MediaFileHash.file_content_hash,
+                    )
+                    .filter(path__in=paths)
+                    .tuples()
+                ),
+                ids=[str(media_path) for media_path in stat_results],
+            )
+        }
+
+        result: Dict[Path, str] = {}
+        new_hash_dicts: List[Dict[str, Any]] = []
+        for media_path, (size, mtime_ns) in stat_results.items():
+            cached_hash = cached_hashes.get(str(media_path))
+            if cached_hash is not None and cached_hash[:2] == (size, mtime_ns):
+                result[media_path] = cached_hash[2]
+                continue
+
+            try:
+                file_content_hash = md5_file_content_hash(media_path)
+            except FileNotFoundError:
+                # The file was removed after it was checked
+                missing_paths.append(str(media_path))
+                continue
+
+            result[media_path] = file_content_hash
+            new_hash_dicts.append(
+                {
+                    "path": str(media_path),
+                    "size": size,
+                    "mtime_ns": mtime_ns,
+                    "file_content_hash": file_content_hash,
+                }
+            )
+
+        if new_hash_dicts or missing_paths:
+            with self.write_lock, self.db.atomic():
+                for chunk in chunks(new_hash_dicts, int(DEFAULT_CHUNK_SIZE / 10)):
+                    MediaFileHash.insert_many(chunk).on_conflict_replace().execute()
+                execute_modifying_query_in_chunks(
+                    lambda paths: MediaFileHash.delete().where(MediaFileHash.path.in_(paths)).execute(),
+                    ids=missing_paths,
+                )
+
+        return result
+
     # note types
     def upsert_note_type(self, ankihub_did: uuid.UUID, note_type: NotetypeDict) -> None:
         with self.write_lock:
@@ -599,6 +752,54 @@ class _AnkiHubDB:
 ankihub_db = _AnkiHubDB()
 
 
+def ankihub_rows_table(fields: Sequence[PeeweeField]) -> str:
+    """Returns an SQL table expression with a column for each of the given fields of the AnkiHub DB, for use in
+    queries on the Anki DB. The rows of the table are passed to the query as a parameter, which is created with
+    ankihub_rows_json. This way queries on the Anki DB can join data of the AnkiHub DB without passing long lists of
+    ids as literals and without attaching the AnkiHub DB to the connection of the Anki DB.
+    Queries which use the table should start with SELECT, because Anki treats other statements (e.g. WITH)
+    as modifications of the collection and clears the undo queue."""
+    columns = ", ".join(f"json_extract(value, '$[{i}]') AS {field.column_name}" for i, field in enumerate(fields))
+    return f"(SELECT {columns} FROM json_each(?))"
+
+
+def ankihub_rows_json(rows: Iterable[Sequence[Any]]) -> str:
+    """Returns the parameter for a table expression of ankihub_rows_table, the values of each row have to be
+    in the order of the fields of the table."""
+    return json.dumps([list(row) for row in rows], default=str)
+
+
+def _note_media_dicts(note_dict: Dict[str, Any], note_type: NotetypeDict) -> List[Dict[str, Any]]:
+    """Returns the rows of the note_media table for a row of the notes table."""
+    if note_dict["last_update_type"] == SuggestionType.DELETE.value[0] or not note_dict["fields"]:
+        return []
+
+    media_names = get_media_names_from_note_fields(note_dict["fields"].values(), note_type)
+    return [
+        {
+            "ankihub_note_id": note_dict["ankihub_note_id"],
+            "ankihub_deck_id": note_dict["ankihub_deck_id"],
+            "media_name": media_name,
+        }
+        for media_name in media_names
+    ]
+
+
+def _note_tag_dicts(note_dict: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Returns the rows of the note_tags table for a row of the notes table."""
+    if note_dict["last_update_type"] == SuggestionType.DELETE.value[0] or not note_dict["tags"]:
+        return []
+
+    return [
+        {
+            "ankihub_note_id": note_dict["ankihub_note_id"],
+            "ankihub_deck_id": note_dict["ankihub_deck_id"],
+            "tag": tag,
+        }
+        for tag in set(note_dict["tags"].split())
+    ]
+
+
 def flat(**row_data: Dict[str, Any]) -> Any:
     """Return the value from a single-item dictionary."""
     [(_, field_value)] = row_data.items()
@@ -4,8 +4,18 @@ from anki.utils import split_fields
 from peewee import Database, IntegerField, Model, TextField, UUIDField
 
 from .. import LOGGER
-from .db import ankihub_db, flat
-from .models import AnkiHubNote, AnkiHubNoteType, DeckMedia, get_peewee_database
+from .db import DEFAULT_CHUNK_SIZE, _note_media_dicts, _note_tag_dicts, ankihub_db, chunks, flat
+from .models import (
+    AnkiHubNote,
+    AnkiHubNoteType,
+    DeckMedia,
+    JSONField,
+    MediaFileHash,
+    NoteMedia,
+    NoteTag,
+)
+from .models import UUIDField as AnkiHubUUIDField
+from .models import get_peewee_database
 
 
 def migrate_ankihub_db():
@@ -210,9 +220,9 @@ def migrate_ankihub_db():
             notes.append(note)
 
         if notes:
-            AnkiHubNote.bind(peewee_db)
+            AnkiHubNoteV17.bind(peewee_db)
             with peewee_db.atomic():
-                AnkiHubNote.bulk_update(notes, fields=["fields"], batch_size=1000)
+                AnkiHubNoteV17.bulk_update(notes, fields=["fields"], batch_size=1000)
 
         peewee_db.pragma("user_version", 13)
 
@@ -221,6 +231,119 @@ def migrate_ankihub_db():
             schema_version=ankihub_db.schema_version(),
         )
 
+    if schema_version < 14:
+        # Add a table for caching the content hashes of local media files
+        with peewee_db.atomic():
+            MediaFileHash.bind(peewee_db)
+            MediaFileHash.create_table()
+            peewee_db.pragma("user_version", 14)
+
+        LOGGER.info(
+            "AnkiHub DB migrated to schema version",
+            schema_version=ankihub_db.schema_version(),
+        )
+
+    if schema_version < 15:
+        # Add a table for the media references of notes and fill it based on the fields of the existing notes
+        with peewee_db.atomic():
+            NoteMedia.bind(peewee_db)
+            NoteMedia.create_table()
+
+            AnkiHubNoteV17.bind(peewee_db)
+            AnkiHubNoteType.bind(peewee_db)
+            note_types = dict(
+                AnkiHubNoteType.select(AnkiHubNoteType.anki_note_type_id, AnkiHubNoteType.note_type_dict).tuples()
+            )
+            note_media_dicts = [
+                note_media_dict
+                for note_dict in AnkiHubNoteV17.select(
+                    AnkiHubNoteV17.ankihub_note_id,
+                    AnkiHubNoteV17.ankihub_deck_id,
+                    AnkiHubNoteV17.anki_note_type_id,
+                    AnkiHubNoteV17.fields,
+                    AnkiHubNoteV17.last_update_type,
+                ).dicts()
+                for note_media_dict in _note_media_dicts(note_dict, note_types.get(note_dict["anki_note_type_id"], {}))
+            ]
+            for chunk in chunks(note_media_dicts, int(DEFAULT_CHUNK_SIZE / 10)):
+                NoteMedia.insert_many(chunk).on_conflict_ignore().execute()
+
+            peewee_db.pragma("user_version", 15)
+
+        LOGGER.info(
+            "AnkiHub DB migrated to schema version",
+            schema_version=ankihub_db.schema_version(),
+        )
+
+    if schema_version < 16:
+        # Add the is_deleted column and indexes for frequent queries on the notes table
+        with peewee_db.atomic():
+            # The column already exists if the notes table was recreated with the current model
+            # by the migration to schema version 11.
+            column_names = [row[1] for row in peewee_db.execute_sql("PRAGMA table_info(notes)").fetchall()]
+            if "is_deleted" not in column_names:
+                peewee_db.execute_sql("""ALTER TABLE "notes" ADD COLUMN "is_deleted" INTEGER NOT NULL DEFAULT 0""")
+            peewee_db.execute_sql("UPDATE notes SET is_deleted = (last_update_type IS 'delete')")
+
+            # The table already exists, so this only creates the indexes which don't exist yet
+            AnkiHubNote.bind(peewee_db)
+            AnkiHubNote.create_table()
+
+            peewee_db.pragma("user_version", 16)
+
+        LOGGER.info(
+            "AnkiHub DB migrated to schema version",
+            schema_version=ankihub_db.schema_version(),
+        )
+
+    if schema_version < 17:
+        # Add a table for the tags of notes and fill it based on the tags of the existing notes
+        with peewee_db.atomic():
+            NoteTag.bind(peewee_db)
+            NoteTag.create_table()
+
+            AnkiHubNote.bind(peewee_db)
+            note_tag_dicts = [
+                note_tag_dict
+                for note_dict in AnkiHubNote.select(
+                    AnkiHubNote.ankihub_note_id,
+                    AnkiHubNote.ankihub_deck_id,
+                    AnkiHubNote.tags,
+                    AnkiHubNote.last_update_type,
+                ).dicts()
+                for note_tag_dict in _note_tag_dicts(note_dict)
+            ]
+            for chunk in chunks(note_tag_dicts, int(DEFAULT_CHUNK_SIZE / 10)):
+                NoteTag.insert_many(chunk).on_conflict_ignore().execute()
+
+            peewee_db.pragma("user_version", 17)
+
+        LOGGER.info(
+            "AnkiHub DB migrated to schema version",
+            schema_version=ankihub_db.schema_version(),
+        )
+
+    if schema_version < 18:
+        # Change how note field values are stored in the database
+        # from JSON dictionaries to field names and values joined with the field separator of Anki.
+        with peewee_db.atomic():
+            AnkiHubNoteV17.bind(peewee_db)
+            AnkiHubNote.bind(peewee_db)
+            notes = [
+                AnkiHubNote(ankihub_note_id=ah_nid, fields=fields)
+                for ah_nid, fields in AnkiHubNoteV17.select(AnkiHubNoteV17.ankihub_note_id, AnkiHubNoteV17.fields)
+                .where(AnkiHubNoteV17.fields.is_null(False))
+                .tuples()
+            ]
+            AnkiHubNote.bulk_update(notes, fields=[AnkiHubNote.fields], batch_size=int(DEFAULT_CHUNK_SIZE / 10))
+
+            peewee_db.pragma("user_version", 18)
+
+        LOGGER.info(
+            "AnkiHub DB migrated to schema version",
+            schema_version=ankihub_db.schema_version(),
+        )
+
 
 def _recreate_peewee_table(model: Model, on_conflict: str = "ABORT") -> None:
     """
@@ -256,8 +379,18 @@ def _recreate_peewee_table(model: Model, on_conflict: str = "ABORT") -> None:
     model.bind(get_peewee_database())
     model.create_table()
 
-    # Copy the data to the new table
-    get_peewee_database().execute_sql(f"INSERT OR {on_conflict} INTO {table_name} SELECT * FROM {temp_table_name}")
+    # Copy the data to the new table. Columns which were added to the model later are filled with their defaults.
+    temp_table_column_names = {
+        row[1] for row in get_peewee_database().execute_sql(f"PRAGMA table_info({temp_table_name})").fetchall()
+    }
+    column_names = ", ".join(
+        f'"{field.column_name}"'
+        for field in model._meta.sorted_fields
+        if field.column_name in temp_table_column_names
+    )
+    get_peewee_database().execute_sql(
+        f"INSERT OR {on_conflict} INTO {table_name} ({column_names}) SELECT {column_names} FROM {temp_table_name}"
+    )
 
     # Drop the old table
     get_peewee_database().execute_sql(f"DROP TABLE {temp_table_name}")
@@ -336,3 +469,20 @@ class AnkiHubNoteV12(Model):
 
     class Meta:
         table_name = "notes"
+
+
+class AnkiHubNoteV17(Model):
+    """AnkiHubNote model at schema version 17, which stored the note fields as JSON."""
+
+    ankihub_note_id = AnkiHubUUIDField(primary_key=True)
+    ankihub_deck_id = AnkiHubUUIDField(index=True, null=True)
+    anki_note_id = IntegerField(unique=True, null=True)
+    anki_note_type_id = IntegerField(index=True, null=True)
+    mod = IntegerField(null=True)
+    guid = TextField(null=True)
+    fields = JSONField(null=True)
+    tags = TextField(null=True)
+    last_update_type = TextField(null=True)
+
+    class Meta:
+        table_name = "notes"
@@ -2,9 +2,11 @@ import json
 import uuid
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional
 
+from anki.utils import join_fields, split_fields
 from peewee import (
+    SQL,
     BooleanField,
     CompositeKey,
     Field,
@@ -66,6 +68,32 @@ class JSONField(Field):
         return json.loads(value)
 
 
+class NoteFieldsField(Field):
+    """A field for dictionaries from note field names to note field values.
+
+    The names and values are stored alternately and joined with the field separator that Anki uses for the
+    flds column of its notes table. Storing them this way is more compact and faster to decode than JSON,
+    because nothing has to be escaped. The values are stored together with their names instead of in the order
+    of the fields of the note type, so that they stay valid when fields of the note type are reordered.
+    Field names and values can't contain the separator, because Anki can't store it in note fields either.
+    """
+
+    field_type = "TEXT"
+
+    def db_value(self, value: Optional[Dict[str, str]]) -> Optional[str]:
+        if value is None:
+            return None
+        return join_fields([item for field_name_and_value in value.items() for item in field_name_and_value])
+
+    def python_value(self, value: Optional[str]) -> Optional[Dict[str, str]]:
+        if value is None:
+            return None
+        if not value:
+            return {}
+        items = split_fields(value)
+        return dict(zip(items[::2], items[1::2]))
+
+
 class AnkiHubNote(Model):
     ankihub_note_id = UUIDField(primary_key=True)
     ankihub_deck_id = UUIDField(index=True, null=True)
@@ -73,9 +101,12 @@ class AnkiHubNote(Model):
     anki_note_type_id = IntegerField(index=True, null=True)
     mod = IntegerField(null=True)
     guid = TextField(null=True)
-    fields = JSONField(null=True)
+    fields = NoteFieldsField(null=True)
     tags = TextField(null=True)
     last_update_type = TextField(null=True)
+    # Whether last_update_type is delete, so that notes which are not deleted can be looked up in indexes.
+    # Kept up to date by upsert_notes_data.
+    is_deleted = BooleanField(default=False, constraints=[SQL("DEFAULT 0")])
 
     class Meta:
         table_name = "notes"
@@ -84,6 +115,23 @@ class AnkiHubNote(Model):
         return self.last_update_type == SuggestionType.DELETE.value[0]
 
 
+AnkiHubNote.add_index(
+    AnkiHubNote.index(
+        AnkiHubNote.ankihub_deck_id,
+        AnkiHubNote.is_deleted,
+        AnkiHubNote.anki_note_id,
+        name="notes_ankihub_deck_id_is_deleted_anki_note_id",
+    )
+)
+AnkiHubNote.add_index(
+    AnkiHubNote.index(
+        AnkiHubNote.ankihub_deck_id,
+        AnkiHubNote.is_deleted,
+        name="notes_with_missing_values_ankihub_deck_id_is_deleted",
+    ).where(SQL('"guid" IS NULL OR "fields" IS NULL OR "tags" IS NULL'))
+)
+
+
 class AnkiHubNoteType(Model):
     anki_note_type_id = IntegerField(primary_key=True)
     ankihub_deck_id = UUIDField()
@@ -109,6 +157,47 @@ class DeckMedia(Model):
         indexes = ((("ankihub_deck_id", "file_content_hash"), False),)
 
 
+class NoteMedia(Model):
+    """Names of the media files referenced in the fields of the notes in the notes table.
+    References of deleted notes are not stored."""
+
+    ankihub_note_id = UUIDField()
+    ankihub_deck_id = UUIDField()
+    media_name = TextField()
+
+    class Meta:
+        table_name = "note_media"
+        primary_key = CompositeKey("ankihub_note_id", "media_name")
+        indexes = ((("ankihub_deck_id", "media_name"), False),)
+
+
+class NoteTag(Model):
+    """Tags of the notes in the notes table, so that notes can be looked up by their tags.
+    Tags are compared case-insensitively, like in Anki. Tags of deleted notes are not stored."""
+
+    ankihub_note_id = UUIDField()
+    ankihub_deck_id = UUIDField()
+    tag = TextField(collation="NOCASE")
+
+    class Meta:
+        table_name = "note_tags"
+        primary_key = CompositeKey("ankihub_note_id", "tag")
+        indexes = ((("ankihub_deck_id", "tag"), False),)
+
+
+class MediaFileHash(Model):
+    """Cache of the content hashes of local media files.
+    A cached hash is only valid if the size and modification time of the file didn't change."""
+
+    path = TextField(primary_key=True)
+    size = IntegerField()
+    mtime_ns = IntegerField()
+    file_content_hash = TextField()
+
+    class Meta:
+        table_name = "media_file_hashes"
+
+
 def set_peewee_database(db_path: Path) -> None:
     global _ankihub_db
     _ankihub_db = SqliteDatabase(db_path, pragmas={"journal_mode": "wal"})
@@ -119,8 +208,8 @@ def get_peewee_database() -> SqliteDatabase:
 
 
 def create_tables() -> None:
-    _ankihub_db.create_tables([AnkiHubNote, AnkiHubNoteType, DeckMedia])
+    _ankihub_db.create_tables([AnkiHubNote, AnkiHubNoteType, DeckMedia, NoteMedia, NoteTag, MediaFileHash])
 
 
 def bind_peewee_models() -> None:
-    _ankihub_db.bind([AnkiHubNote, AnkiHubNoteType, DeckMedia])
+    _ankihub_db.bind([AnkiHubNote, AnkiHubNoteType, DeckMedia, NoteMedia, NoteTag, MediaFileHash])
@@ -1,5 +1,6 @@
 """Code to be run on Anki start up."""
 
+import hashlib
 import platform
 import re
 import time
@@ -8,6 +9,7 @@ from pathlib import Path
 import aqt
 from anki.errors import CardTypeError
 from anki.hooks import wrap
+from anki.utils import ids2str
 from aqt.gui_hooks import profile_did_open, profile_will_close, sync_did_finish
 from aqt.main import AnkiQt
 
@@ -37,7 +39,7 @@ from .gui.menu import menu_state, refresh_ankihub_menu, setup_ankihub_menu, setu
 from .gui.operations.ankihub_sync import setup_full_sync_patch
 from .gui.optimize_fsrs_dialog import maybe_show_fsrs_optimization_reminder
 from .gui.subdeck_due_date_dialog import maybe_show_subdeck_due_date_reminders
-from .main.note_deletion import handle_notes_deleted_from_webapp
+from .main.note_deletion import DELETED_NOTES_FILE, handle_notes_deleted_from_webapp
 from .main.utils import modify_note_type_templates
 from .settings import (
     ADDON_VERSION,
@@ -48,6 +50,7 @@ from .settings import (
     setup_native_ankihub_token_hook,
     setup_profile_data_folder,
 )
+from .startup_tasks import StartupTask, fingerprint_of, run_startup_tasks
 from .user_state import (
     refresh_user_state_in_background,
     setup_periodic_user_state_refresh,
@@ -173,28 +176,47 @@ def _profile_setup() -> bool:
         refresh_ankihub_menu()
         LOGGER.info("Refreshed AnkiHub menu.")
 
-    _copy_web_media_to_media_folder()
-    LOGGER.info("Copied web media to media folder.")
-
     return True
 
 
 def _after_profile_setup() -> None:
     _log_enabled_addons()
 
-    # This deletes broken notetypes with no fields or templates created by a previous version of the add-on.
-    _delete_broken_note_types()
-
-    # This adjusts note type templates of note types used by AnkiHub notes when the profile is opened.
-    # If this wouldn't be called here the templates would only be adjusted when syncing with AnkiHub.
-    # We want the modifications to be present even if the user doesn't sync with AnkiHub, so we call
-    # this here.
-    _adjust_ankihub_note_type_templates()
-
-    # This deletes notes that were deleted from the web app. This is not a general solution,
-    # just a temporary fix for notes that were already manually deleted on the webapp.
-    # Later we should handle note deletion in the sync process.
-    handle_notes_deleted_from_webapp()
+    # The tasks are skipped when their inputs didn't change since they last ran for the profile.
+    media_dir = Path(aqt.mw.col.media.dir())
+    run_startup_tasks(
+        [
+            StartupTask(
+                name="copy_web_media_to_media_folder",
+                run=lambda: _copy_web_media_to_media_folder(media_dir),
+                fingerprint=lambda: _web_media_fingerprint(media_dir),
+                in_background=True,
+            ),
+            # This deletes broken notetypes with no fields or templates created by a previous version of the add-on.
+            StartupTask(
+                name="delete_broken_note_types",
+                run=_delete_broken_note_types,
+                fingerprint=_note_types_structure_fingerprint,
+            ),
+            # This adjusts note type templates of note types used by AnkiHub notes when the profile is opened.
+            # If this wouldn't be called here the templates would only be adjusted when syncing with AnkiHub.
+            # We want the modifications to be present even if the user doesn't sync with AnkiHub, so we call
+            # this here.
+            StartupTask(
+                name="adjust_ankihub_note_type_templates",
+                run=_adjust_ankihub_note_type_templates,
+                fingerprint=_ankihub_note_types_fingerprint,
+            ),
+            # This deletes notes that were deleted from the web app. This is not a general solution,
+            # just a temporary fix for notes that were already manually deleted on the webapp.
+            # Later we should handle note deletion in the sync process.
+            StartupTask(
+                name="handle_notes_deleted_from_webapp",
+                run=handle_notes_deleted_from_webapp,
+                fingerprint=_notes_deleted_from_webapp_fingerprint,
+            ),
+        ]
+    )
 
     if config.ankiweb_url != DEFAULT_ANKIWEB_URL:  # For testing
         aqt.mw.pm.set_custom_sync_url(config.ankiweb_url)
@@ -303,17 +325,56 @@ def _general_setup() -> None:
     LOGGER.info("Set up tutorial.")
 
 
-def _copy_web_media_to_media_folder() -> None:
+def _copy_web_media_to_media_folder(media_dir: Path) -> None:
     """Copy media files from the web folder to the media folder. Existing files with the same name
     will be overwritten.
     The media file names should start with '_' so that Anki doesn't remove them when checking for unused media.
     """
     for file in WEB_MEDIA_PATH.glob("*"):
         file_name = file.name
-        file_path = Path(aqt.mw.col.media.dir()) / file_name
+        file_path = media_dir / file_name
         file_path.write_bytes(file.read_bytes())
 
 
+def _web_media_fingerprint(media_dir: Path) -> str:
+    # The sizes of the copies in the media folder are included, so that the files are copied again
+    # if they were removed from the media folder.
+    files_info = []
+    for file in sorted(WEB_MEDIA_PATH.glob("*")):
+        file_stat = file.stat()
+        copy_path = media_dir / file.name
+        copy_size = copy_path.stat().st_size if copy_path.exists() else None
+        files_info.append((file.name, file_stat.st_size, file_stat.st_mtime_ns, copy_size))
+    return fingerprint_of(str(media_dir), files_info)
+
+
+def _note_types_structure_fingerprint() -> str:
+    rows = aqt.mw.col.db.all(
+        """
+        SELECT nt.id,
+            EXISTS(SELECT 1 FROM templates WHERE ntid = nt.id),
+            EXISTS(SELECT 1 FROM fields WHERE ntid = nt.id)
+        FROM notetypes AS nt
+        ORDER BY nt.id
+        """
+    )
+    return fingerprint_of(rows)
+
+
+def _ankihub_note_types_fingerprint() -> str:
+    # The templates depend on the add-on version, the app url and the user id, besides the note types themselves.
+    mids = ankihub_db.ankihub_note_type_ids()
+    rows = aqt.mw.col.db.all(f"SELECT id, mtime_secs, usn FROM notetypes WHERE id IN {ids2str(mids)} ORDER BY id")
+    return fingerprint_of(ADDON_VERSION, config.app_url, config.user_id(), rows)
+
+
+def _notes_deleted_from_webapp_fingerprint() -> str:
+    # Notes are only added to the AnkiHub DB when decks are installed or updated, which changes
+    # the latest update of the deck.
+    deck_updates = sorted((str(ah_did), str(config.deck_config(ah_did).latest_update)) for ah_did in config.deck_ids())
+    return fingerprint_of(hashlib.md5(DELETED_NOTES_FILE.read_bytes()).hexdigest(), deck_updates)
+
+
 def _log_enabled_addons() -> None:
     enabled_addons = [
         {"dir_name": x.dir_name, "human_version": x.human_version}
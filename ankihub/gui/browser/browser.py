@@ -7,7 +7,7 @@ from dataclasses import dataclass
 from typing import Callable, List, Optional, Sequence
 
 import aqt
-from anki.collection import SearchNode
+from anki.collection import OpChanges, SearchNode
 from anki.hooks import wrap
 from anki.notes import NoteId
 from anki.utils import is_mac
@@ -32,6 +32,8 @@ from aqt.gui_hooks import (
     browser_will_show,
     browser_will_show_context_menu,
     dialog_manager_did_open_dialog,
+    operation_did_execute,
+    state_did_reset,
 )
 from aqt.qt import (
     QAction,
@@ -51,10 +53,10 @@ from ... import LOGGER
 from ...ankihub_client import SuggestionType
 from ...db import ankihub_db
 from ...gui.webview import AnkiHubWebViewDialog
-from ...main.importing import get_fields_protected_by_tags
 from ...main.note_conversion import (
     TAG_FOR_PROTECTING_ALL_FIELDS,
     TAG_FOR_PROTECTING_FIELDS,
+    get_fields_protected_by_tags,
     is_protect_tag,
     optional_tag_prefix_for_group,
     protection_tag_for_field,
@@ -81,6 +83,7 @@ from ..utils import (
 )
 from .custom_columns import (
     AnkiHubIdColumn,
+    ColumnDataProvider,
     EditedAfterSyncColumn,
     UpdatedSinceLastReviewColumn,
 )
@@ -126,6 +129,9 @@ custom_columns = [
     UpdatedSinceLastReviewColumn(),
 ]
 
+# caches the data of the custom columns for the current search
+column_data_provider = ColumnDataProvider()
+
 # stores the custom search nodes for the current search
 custom_search_nodes: List[CustomSearchNode] = []
 
@@ -415,6 +421,7 @@ def _on_protect_fields_action(browser: Browser, nids: Sequence[NoteId]) -> None:
         aqt.mw.update_undo_actions()
 
         # without this the tags in the browser editor are not updated until you switch away from the note
+        column_data_provider.invalidate()
         browser.table.reset()
         tooltip("Updated tags for protecting fields")
 
@@ -506,6 +513,7 @@ def _on_reset_local_changes_action(browser: Browser, nids: Sequence[NoteId]) ->
     def on_done(future: Future) -> None:
         future.result()  # raise exception if there was one
 
+        column_data_provider.invalidate()
         browser.table.reset()
         tooltip("Reset local changes for selected notes.", parent=browser)
 
@@ -744,6 +752,17 @@ def _setup_custom_columns():
     browser_did_fetch_columns.append(_on_browser_did_fetch_columns)
     browser_did_fetch_row.append(_on_browser_did_fetch_row)
 
+    # The cached column data can be outdated after a new search, after notes were changed or reviewed
+    # and after an AnkiHub sync (which resets the main window).
+    browser_did_search.append(lambda _: column_data_provider.invalidate())
+    operation_did_execute.append(_on_operation_did_execute_invalidate_column_data)
+    state_did_reset.append(column_data_provider.invalidate)
+
+
+def _on_operation_did_execute_invalidate_column_data(changes: OpChanges, handler: Optional[object]) -> None:
+    if changes.note_text or changes.card or changes.browser_table:
+        column_data_provider.invalidate()
+
 
 def _on_browser_did_fetch_columns(columns: dict[str, Column]):
     for column in custom_columns:
@@ -760,8 +779,10 @@ def _on_browser_did_fetch_row(
         column.on_browser_did_fetch_row(
             browser=browser,
             item_id=item_id,
+            is_notes_mode=is_notes_mode,
             row=row,
             active_columns=active_columns,
+            column_data_provider=column_data_provider,
         )
 
 
@@ -2,14 +2,143 @@
 
 import uuid
 from abc import abstractmethod
-from typing import Sequence
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
 
 import aqt
 from anki.collection import BrowserColumns
-from anki.notes import Note
+from anki.models import NotetypeId
+from anki.utils import ids2str, split_fields
 from aqt.browser import Browser, CellRow, Column, ItemId
 
 from ...db import ankihub_db
+from ...db.db import DEFAULT_CHUNK_SIZE, chunks
+from ...settings import ANKIHUB_NOTE_TYPE_FIELD_NAME
+
+# How many rows of the browser table the values of the custom columns are loaded for at once.
+# The browser fetches rows while the table is scrolled, so the values for the following rows are loaded in advance.
+COLUMN_DATA_PAGE_SIZE = 500
+
+
+@dataclass(frozen=True)
+class ColumnData:
+    """The data of a note which the values of the custom columns are computed from."""
+
+    # None if the note type of the note has no ankihub_id field
+    ankihub_id: Optional[str]
+    mod: int
+    # The modification time of the note in the AnkiHub DB, None if it's unknown
+    last_sync: Optional[int]
+    # The id of the last review of a card of the note in milliseconds, None if there is no review
+    last_review_ms: Optional[int]
+
+
+class ColumnDataProvider:
+    """Loads the data for the custom columns for pages of rows of the browser table with two queries per page,
+    instead of loading notes one by one while the rows are fetched.
+
+    The data is cached until invalidate is called, which should happen when a new search is made and when notes
+    could have been changed.
+    """
+
+    def __init__(self) -> None:
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        self._data_by_item_id: Dict[ItemId, ColumnData] = {}
+        self._item_index_by_id: Optional[Dict[ItemId, int]] = None
+        self._is_notes_mode: Optional[bool] = None
+        self._ankihub_id_field_index_by_mid: Dict[NotetypeId, Optional[int]] = {}
+
+    def data(self, browser: Browser, item_id: ItemId, is_notes_mode: bool) -> Optional[ColumnData]:
+        """Returns the data for the row of the item. Returns None if the item doesn't exist anymore."""
+        if is_notes_mode != self._is_notes_mode:
+            self.invalidate()
+            self._is_notes_mode = is_notes_mode
+
+        if item_id not in self._data_by_item_id:
+            self._load_page(browser, item_id)
+
+        return self._data_by_item_id.get(item_id)
+
+    def _load_page(self, browser: Browser, item_id: ItemId) -> None:
+        items: Sequence[ItemId] = browser.table._model._items
+        if self._item_index_by_id is None:
+            self._item_index_by_id = {item: index for index, item in enumerate(items)}
+
+        if (index := self._item_index_by_id.get(item_id)) is None:
+            page = [item_id]
+        else:
+            page = [item for item in items[index : index + COLUMN_DATA_PAGE_SIZE] if item not in self._data_by_item_id]
+
+        self._data_by_item_id.update(self._load_data(page))
+
+    def _load_data(self, item_ids: List[ItemId]) -> Dict[ItemId, ColumnData]:
+        if self._is_notes_mode:
+            from_clause = "notes AS n"
+            item_id_column = "n.id"
+        else:
+            from_clause = "cards AS c JOIN notes AS n ON n.id = c.nid"
+            item_id_column = "c.id"
+
+        rows = []
+        for item_ids_chunk in chunks(item_ids, DEFAULT_CHUNK_SIZE):
+            rows.extend(
+                aqt.mw.col.db.all(
+                    f"""
+                    SELECT {item_id_column}, n.mid, n.flds, n.mod, (
+                        SELECT max(revlog.id) FROM revlog, cards
+                        WHERE cards.nid = n.id AND revlog.cid = cards.id
+                    )
+                    FROM {from_clause}
+                    WHERE {item_id_column} IN {ids2str(item_ids_chunk)}
+                    """
+                )
+            )
+
+        ankihub_id_by_item_id: Dict[ItemId, Optional[str]] = {}
+        for item_id, mid, flds, _, _ in rows:
+            field_index = self._ankihub_id_field_index(NotetypeId(mid))
+            try:
+                ankihub_id_by_item_id[item_id] = None if field_index is None else split_fields(flds)[field_index]
+            except IndexError:
+                # The note has fewer fields than its note type
+                ankihub_id_by_item_id[item_id] = None
+
+        ah_nids = set()
+        for ankihub_id in ankihub_id_by_item_id.values():
+            try:
+                ah_nids.add(uuid.UUID(ankihub_id))
+            except (TypeError, ValueError):
+                pass
+        last_sync_by_ah_nid = ankihub_db.last_syncs(ah_nids)
+
+        result = {}
+        for item_id, _, _, mod, last_review_ms in rows:
+            ankihub_id = ankihub_id_by_item_id[item_id]
+            try:
+                last_sync = last_sync_by_ah_nid.get(uuid.UUID(ankihub_id))
+            except (TypeError, ValueError):
+                last_sync = None
+            result[item_id] = ColumnData(
+                ankihub_id=ankihub_id,
+                mod=mod,
+                last_sync=last_sync,
+                last_review_ms=last_review_ms,
+            )
+        return result
+
+    def _ankihub_id_field_index(self, mid: NotetypeId) -> Optional[int]:
+        if mid not in self._ankihub_id_field_index_by_mid:
+            if (note_type := aqt.mw.col.models.get(mid)) is None:
+                # The note type of the note doesn't exist
+                field_names = []
+            else:
+                field_names = [field["name"] for field in note_type["flds"]]
+            self._ankihub_id_field_index_by_mid[mid] = (
+                field_names.index(ANKIHUB_NOTE_TYPE_FIELD_NAME) if ANKIHUB_NOTE_TYPE_FIELD_NAME in field_names else None
+            )
+        return self._ankihub_id_field_index_by_mid[mid]
 
 
 class CustomColumn:
@@ -19,15 +148,19 @@ class CustomColumn:
         self,
         browser: Browser,
         item_id: ItemId,
+        is_notes_mode: bool,
         row: CellRow,
         active_columns: Sequence[str],
+        column_data_provider: ColumnDataProvider,
     ) -> None:
         if (index := active_columns.index(self.key) if self.key in active_columns else None) is None:
             return
 
-        note = browser.table._state.get_note(item_id)
         try:
-            value = self._display_value(note)
+            data = column_data_provider.data(browser, item_id, is_notes_mode)
+            if data is None:
+                return
+            value = self._display_value(data)
             row.cells[index].text = value
         except Exception as error:
             row.cells[index].text = str(error)
@@ -39,7 +172,7 @@ class CustomColumn:
     @abstractmethod
     def _display_value(
         self,
-        note: Note,
+        data: ColumnData,
     ) -> str:
         raise NotImplementedError
 
@@ -55,11 +188,11 @@ class AnkiHubIdColumn(CustomColumn):
 
     def _display_value(
         self,
-        note: Note,
+        data: ColumnData,
     ) -> str:
-        if "ankihub_id" in note:
-            if note["ankihub_id"]:
-                return note["ankihub_id"]
+        if data.ankihub_id is not None:
+            if data.ankihub_id:
+                return data.ankihub_id
             else:
                 return "Not on AnkiHub"
         else:
@@ -78,17 +211,16 @@ class EditedAfterSyncColumn(CustomColumn):
 
     def _display_value(
         self,
-        note: Note,
+        data: ColumnData,
     ) -> str:
-        if "ankihub_id" not in note or not note["ankihub_id"]:
+        if not data.ankihub_id:
             return "N/A"
 
-        last_sync = ankihub_db.last_sync(uuid.UUID(note["ankihub_id"]))
-        if last_sync is None:
+        if data.last_sync is None:
             # The sync_mod value can be None if the note was synced with an early version of the AnkiHub add-on
             return "Unknown"
 
-        return "Yes" if note.mod > last_sync else "No"
+        return "Yes" if data.mod > data.last_sync else "No"
 
 
 class UpdatedSinceLastReviewColumn(CustomColumn):
@@ -102,25 +234,18 @@ class UpdatedSinceLastReviewColumn(CustomColumn):
 
     def _display_value(
         self,
-        note: Note,
+        data: ColumnData,
     ) -> str:
-        if "ankihub_id" not in note or not note["ankihub_id"]:
+        if not data.ankihub_id:
             return "N/A"
 
-        last_sync = ankihub_db.last_sync(uuid.UUID(note["ankihub_id"]))
-        if last_sync is None:
+        if data.last_sync is None:
             # The sync_mod value can be None if the note was synced with an early version of the AnkiHub add-on
             return "Unknown"
 
-        last_review_ms = aqt.mw.col.db.scalar(
-            f"""
-            SELECT max(revlog.id) FROM revlog, cards
-            WHERE {note.id} = cards.nid AND cards.id = revlog.cid
-            """,
-        )
-        if last_review_ms is None:
+        if data.last_review_ms is None:
             return "No"
 
-        last_review = last_review_ms // 1000
+        last_review = data.last_review_ms // 1000
 
-        return "Yes" if last_sync > last_review else "No"
+        return "Yes" if data.last_sync > last_review else "No"
@@ -1,10 +1,9 @@
 """Custom search nodes for the browser.
 Search nodes are used to define search parameters for the Anki browser search bar."""
 
-import operator
 from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
-from typing import Dict, List, Sequence, cast
+from typing import Any, List, Sequence, cast
 
 import aqt
 from anki.notes import NoteId
@@ -12,14 +11,14 @@ from anki.utils import ids2str
 from aqt.browser import Browser, ItemId
 
 from ...ankihub_client import suggestion_type_from_str
-from ...db import NOTE_NOT_DELETED_CONDITION, execute_list_query_in_chunks, flat
+from ...db import ankihub_db, ankihub_rows_json, ankihub_rows_table, execute_list_query_in_chunks
 from ...db.models import AnkiHubNote
-from ...main.utils import retain_nids_with_ah_note_type
 
 
 class CustomSearchNode(ABC):
     parameter_name: str = None
     browser: Browser = None
+    value: str = None
 
     @classmethod
     def from_parameter_type_and_value(cls, browser: Browser, parameter_name: str, value: str) -> "CustomSearchNode":
@@ -41,10 +40,37 @@ class CustomSearchNode(ABC):
     @abstractmethod
     def filter_ids(self, ids: Sequence[ItemId]) -> Sequence[ItemId]:
         # Filters the given ids to only those that match the custom search node.
-        # Expects the ankihub database to be attached to the anki database connection.
         # Ids can be either note ids or card ids.
         pass
 
+    def _filter_ids(self, ids: Sequence[ItemId], note_condition: str, *args: Any) -> Sequence[ItemId]:
+        """Returns the ids whose notes match the given SQL condition, in the order of the given ids.
+        The condition is evaluated in a single query on the Anki DB. It can refer to the columns of the notes table
+        of the Anki DB, conditions on the AnkiHub DB entries of the notes can be created with
+        _ankihub_note_exists_condition."""
+        self.browser = cast(Browser, self.browser)
+        if self.browser.table.is_notes_mode():
+            query = f"SELECT id FROM notes WHERE id IN {ids2str(ids)} AND ({note_condition})"
+        else:
+            query = f"""
+                SELECT cards.id FROM cards
+                JOIN notes ON notes.id = cards.nid
+                WHERE cards.id IN {ids2str(ids)} AND ({note_condition})
+                """
+
+        retained_ids = set(aqt.mw.col.db.list(query, *args))
+        result = [id for id in ids if id in retained_ids]
+        return result
+
+    def _ankihub_notes_json(self, ids: Sequence[ItemId]) -> str:
+        """Returns the AnkiHub DB entries of the notes of the given ids, as the parameter for
+        _ankihub_note_exists_condition."""
+        rows = execute_list_query_in_chunks(
+            lambda nids: AnkiHubNote.select(*_AH_NOTES_FIELDS).filter(anki_note_id__in=nids).tuples(),
+            ids=self._note_ids(ids),
+        )
+        return ankihub_rows_json(rows)
+
     def _note_ids(self, ids: Sequence[ItemId]) -> List[NoteId]:
         """Converts the given card ids to note ids if the browser is in card mode.
         Otherwise returns the given note ids."""
@@ -55,15 +81,22 @@ class CustomSearchNode(ABC):
             result = aqt.mw.col.db.list(f"SELECT DISTINCT nid FROM cards WHERE id IN {ids2str(ids)}")
         return list(result)
 
-    def _output_ids(self, note_ids: Sequence[NoteId]) -> Sequence[ItemId]:
-        """Converts the given note ids to card ids if the browser is in card mode.
-        Otherwise returns the given note ids."""
-        self.browser = cast(Browser, self.browser)
-        if self.browser.table.is_notes_mode():
-            return note_ids
 
-        result = aqt.mw.col.db.list(f"SELECT id from cards WHERE nid in {ids2str(note_ids)}")
-        return result
+# The columns of the AnkiHub DB entries of notes which can be used in _ankihub_note_exists_condition
+_AH_NOTES_FIELDS = (AnkiHubNote.anki_note_id, AnkiHubNote.mod, AnkiHubNote.is_deleted, AnkiHubNote.last_update_type)
+
+
+def _ankihub_note_exists_condition(condition: str = "1") -> str:
+    """Returns an SQL condition that is true for notes of the Anki DB which have an entry in the AnkiHub DB
+    matching the given condition. The entry can be referred to as ah_notes in the condition.
+    The entries are passed to the query as the first parameter of the condition, see
+    CustomSearchNode._ankihub_notes_json."""
+    return f"""
+        notes.id IN (
+            SELECT ah_notes.anki_note_id FROM {ankihub_rows_table(_AH_NOTES_FIELDS)} AS ah_notes
+            WHERE {condition}
+        )
+        """
 
 
 class ModifiedAfterSyncSearchNode(CustomSearchNode):
@@ -77,43 +110,20 @@ class ModifiedAfterSyncSearchNode(CustomSearchNode):
         self.value = value
 
     def filter_ids(self, ids: Sequence[ItemId]) -> Sequence[ItemId]:
-        if self.value not in ("yes", "no"):
-            raise ValueError(f"Invalid value for {self.parameter_name}: {self.value}. Options are 'yes' and 'no'.")
-
-        nids = self._note_ids(ids)
-
-        nid_to_ah_mod: Dict[NoteId, int] = dict(
-            execute_list_query_in_chunks(
-                lambda nids: (
-                    AnkiHubNote.select(AnkiHubNote.anki_note_id, AnkiHubNote.mod)
-                    .filter(
-                        NOTE_NOT_DELETED_CONDITION,
-                        anki_note_id__in=nids,
-                    )
-                    .tuples()
-                ),
-                ids=nids,
-            ),
-        )
+        _check_yes_or_no_value(self)
 
-        nid_to_anki_mod: Dict[NoteId, int] = dict(
-            aqt.mw.col.db.all(  # type: ignore
+        op = ">" if self.value == "yes" else "<="
+        result = self._filter_ids(
+            ids,
+            _ankihub_note_exists_condition(
                 f"""
-                SELECT id, mod FROM notes
-                WHERE id in {ids2str(nid_to_ah_mod.keys())}
+                NOT ah_notes.is_deleted
+                AND (SELECT anki_notes.mod FROM notes AS anki_notes WHERE anki_notes.id = ah_notes.anki_note_id)
+                    {op} ah_notes.mod
                 """
-            )
+            ),
+            self._ankihub_notes_json(ids),
         )
-
-        retain_notes_modified_after_sync = self.value == "yes"
-        op = operator.gt if retain_notes_modified_after_sync else operator.le
-        retained_nids = [
-            nid
-            for nid, anki_mod in nid_to_anki_mod.items()
-            if nid in nid_to_ah_mod and op(anki_mod, nid_to_ah_mod[nid])
-        ]
-
-        result = self._output_ids(retained_nids)
         return result
 
 
@@ -125,6 +135,14 @@ class UpdatedInTheLastXDaysSearchNode(CustomSearchNode):
         self.value = value
 
     def filter_ids(self, ids: Sequence[ItemId]) -> Sequence[ItemId]:
+        threshold_timestamp = self._threshold_timestamp()
+
+        result = self._filter_ids(
+            ids, _ankihub_note_exists_condition("ah_notes.mod >= ?"), self._ankihub_notes_json(ids), threshold_timestamp
+        )
+        return result
+
+    def _threshold_timestamp(self) -> int:
         try:
             days = int(self.value)
             if days <= 0:
@@ -132,27 +150,10 @@ class UpdatedInTheLastXDaysSearchNode(CustomSearchNode):
         except ValueError:
             raise ValueError(f"Invalid value for {self.parameter_name}: {self.value}. Must be a positive integer.")
 
-        threshold_timestamp = int(
+        return int(
             (datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days - 1)).timestamp()
         )
 
-        nids = self._note_ids(ids)
-
-        retained_nids = execute_list_query_in_chunks(
-            lambda nids: (
-                AnkiHubNote.select(AnkiHubNote.anki_note_id)
-                .filter(
-                    anki_note_id__in=nids,
-                    mod__gte=threshold_timestamp,
-                )
-                .objects(flat)
-            ),
-            ids=nids,
-        )
-
-        result = self._output_ids(retained_nids)
-        return result
-
 
 class NewNoteSearchNode(CustomSearchNode):
     parameter_name = "ankihub_new_note"
@@ -162,26 +163,11 @@ class NewNoteSearchNode(CustomSearchNode):
         self.value = value
 
     def filter_ids(self, ids: Sequence[ItemId]) -> Sequence[ItemId]:
-        if self.value.strip() != "":
-            raise ValueError(
-                f"Invalid value for {self.parameter_name}: {self.value}. This search parameter takes no values."
-            )
-
-        nids = self._note_ids(ids)
-
-        retained_nids = execute_list_query_in_chunks(
-            lambda nids: (
-                AnkiHubNote.select(AnkiHubNote.anki_note_id)
-                .filter(
-                    anki_note_id__in=nids,
-                    last_update_type__is=None,
-                )
-                .objects(flat)
-            ),
-            ids=nids,
-        )
+        _check_no_value(self)
 
-        result = self._output_ids(retained_nids)
+        result = self._filter_ids(
+            ids, _ankihub_note_exists_condition("ah_notes.last_update_type IS NULL"), self._ankihub_notes_json(ids)
+        )
         return result
 
 
@@ -193,28 +179,20 @@ class SuggestionTypeSearchNode(CustomSearchNode):
         self.value = value
 
     def filter_ids(self, ids: Sequence[ItemId]) -> Sequence[ItemId]:
+        value = self._suggestion_type_value()
+
+        result = self._filter_ids(
+            ids, _ankihub_note_exists_condition("ah_notes.last_update_type = ?"), self._ankihub_notes_json(ids), value
+        )
+        return result
+
+    def _suggestion_type_value(self) -> str:
         value = self.value.replace("_slash_", "/")
         try:
             suggestion_type_from_str(value)
         except ValueError:
             raise ValueError(f"Invalid value for {self.parameter_name}: {value}. Must be a suggestion type.")
-
-        nids = self._note_ids(ids)
-
-        retained_nids = execute_list_query_in_chunks(
-            lambda nids: (
-                AnkiHubNote.select(AnkiHubNote.anki_note_id)
-                .filter(
-                    anki_note_id__in=nids,
-                    last_update_type=value,
-                )
-                .objects(flat)
-            ),
-            ids=nids,
-        )
-
-        result = self._output_ids(retained_nids)
-        return result
+        return value
 
 
 class UpdatedSinceLastReviewSearchNode(CustomSearchNode):
@@ -225,43 +203,23 @@ class UpdatedSinceLastReviewSearchNode(CustomSearchNode):
         self.value = value
 
     def filter_ids(self, ids: Sequence[ItemId]) -> Sequence[ItemId]:
-        if self.value.strip() != "":
-            raise ValueError(
-                f"Invalid value for {self.parameter_name}: {self.value}. This search parameter takes no values."
-            )
-
-        nids = self._note_ids(ids)
-
-        nid_to_ah_mod: Dict[NoteId, int] = dict(
-            execute_list_query_in_chunks(
-                lambda nids: (
-                    AnkiHubNote.select(AnkiHubNote.anki_note_id, AnkiHubNote.mod).filter(anki_note_id__in=nids).tuples()
-                ),
-                ids=nids,
-            )
-        )
+        _check_no_value(self)
 
         # The id column of the revlog table is an epoch timestamp in milliseconds of when the review was done.
-        nid_to_last_review_timestamp_ms: Dict[NoteId, int] = dict(
-            aqt.mw.col.db.all(  # type: ignore
-                f"""
-                SELECT notes.id, max(revlog.id)
-                FROM notes
-                JOIN cards ON cards.nid = notes.id
-                JOIN revlog ON revlog.cid = cards.id
-                WHERE notes.id IN {ids2str(nid_to_ah_mod.keys())}
-                GROUP BY notes.id
+        # Notes without reviews are not retained, because the comparison with NULL is never true.
+        result = self._filter_ids(
+            ids,
+            _ankihub_note_exists_condition(
+                """
+                ah_notes.mod >= (
+                    SELECT max(revlog.id) FROM cards AS note_cards
+                    JOIN revlog ON revlog.cid = note_cards.id
+                    WHERE note_cards.nid = ah_notes.anki_note_id
+                ) / 1000.0
                 """
-            )
+            ),
+            self._ankihub_notes_json(ids),
         )
-
-        retained_nids = [
-            nid
-            for nid, ah_mod in nid_to_ah_mod.items()
-            if nid in nid_to_last_review_timestamp_ms and ah_mod >= nid_to_last_review_timestamp_ms[nid] / 1000
-        ]
-
-        result = self._output_ids(retained_nids)
         return result
 
 
@@ -276,21 +234,12 @@ class AnkiHubNoteSearchNode(CustomSearchNode):
         self.value = value
 
     def filter_ids(self, ids: Sequence[ItemId]) -> Sequence[ItemId]:
-        if self.value not in ("yes", "no"):
-            raise ValueError(f"Invalid value for {self.parameter_name}: {self.value}. Options are 'yes' and 'no'.")
-
-        nids = self._note_ids(ids)
+        _check_yes_or_no_value(self)
 
-        nids_in_ah_db = execute_list_query_in_chunks(
-            lambda nids: (AnkiHubNote.select(AnkiHubNote.anki_note_id).filter(anki_note_id__in=nids).objects(flat)),
-            ids=nids,
+        condition = _ankihub_note_exists_condition()
+        result = self._filter_ids(
+            ids, condition if self.value == "yes" else f"NOT {condition}", self._ankihub_notes_json(ids)
         )
-        if self.value == "yes":
-            retained_nids = list(nids_in_ah_db)
-        else:
-            retained_nids = list(set(nids) - set(nids_in_ah_db))
-
-        result = self._output_ids(retained_nids)
         return result
 
 
@@ -306,16 +255,20 @@ class AnkiHubNoteTypeSearchNode(CustomSearchNode):
         self.value = value
 
     def filter_ids(self, ids: Sequence[ItemId]) -> Sequence[ItemId]:
-        if self.value not in ("yes", "no"):
-            raise ValueError(f"Invalid value for {self.parameter_name}: {self.value}. Options are 'yes' and 'no'.")
+        _check_yes_or_no_value(self)
 
-        nids = self._note_ids(ids)
+        condition = f"notes.mid IN {ids2str(ankihub_db.ankihub_note_type_ids())}"
+        result = self._filter_ids(ids, condition if self.value == "yes" else f"NOT {condition}")
+        return result
 
-        nids_with_ah_note_type = set(retain_nids_with_ah_note_type(nids))
-        if self.value == "yes":
-            retained_nids = list(nids_with_ah_note_type)
-        else:
-            retained_nids = list(set(nids) - nids_with_ah_note_type)
 
-        result = self._output_ids(retained_nids)
-        return result
+def _check_yes_or_no_value(node: CustomSearchNode) -> None:
+    if node.value not in ("yes", "no"):
+        raise ValueError(f"Invalid value for {node.parameter_name}: {node.value}. Options are 'yes' and 'no'.")
+
+
+def _check_no_value(node: CustomSearchNode) -> None:
+    if node.value.strip() != "":
+        raise ValueError(
+            f"Invalid value for {node.parameter_name}: {node.value}. This search parameter takes no values."
+        )
@@ -1,20 +1,33 @@
 """Downloads updates to decks from AnkiHub and imports them."""
 
+import itertools
 import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass
 from datetime import datetime
 from functools import cached_property
-from typing import Collection, Dict, List, Optional, cast
+from typing import Collection, Dict, Iterable, Iterator, List, Optional, cast
 
 import aqt
-from anki.errors import NotFoundError
 from anki.models import NotetypeDict, NotetypeId
+from anki.notes import Note, NoteId
+from anki.utils import ids2str
 from aqt.utils import showInfo, tooltip
 
 from .. import LOGGER
 from ..addon_ankihub_client import AddonAnkiHubClient as AnkiHubClient
-from ..ankihub_client import AnkiHubHTTPError, DeckExtension
-from ..ankihub_client.models import NotesActionChoices
+from ..ankihub_client import (
+    AnkiHubHTTPError,
+    Deck,
+    DeckExtension,
+    DeckExtensionUpdateChunk,
+    DeckUpdatesChunk,
+    NoteInfo,
+)
+from ..ankihub_client.models import NotesAction, NotesActionChoices
 from ..db import ankihub_db
+from ..db.db import DEFAULT_CHUNK_SIZE, chunks
 from ..main.importing import AnkiHubImporter, AnkiHubImportResult
 from ..main.note_conversion import (
     is_tag_for_group,
@@ -23,17 +36,39 @@ from ..main.utils import create_backup
 from ..settings import config
 from .media_sync import media_sync
 from .operations.scheduling import unsuspend_notes
+from .threading_utils import prefetching
 from .utils import deck_download_progress_cb, show_error_dialog
 
 
+# How many requests for the data of decks are sent at the same time while decks are updated
+DECK_DOWNLOAD_MAX_WORKERS = 4
+
+
 class NotLoggedInError(Exception):
     pass
 
 
+@dataclass
+class _DeckDownloads:
+    """The downloads of the data which is needed to update a deck, apart from the note updates and the updates of
+    the deck extensions, which are prefetched while the deck is imported.
+    The data of all decks is downloaded concurrently, while the decks are updated one after another."""
+
+    deck: "Future[Deck]"
+    note_types: "Future[Dict[NotetypeId, NotetypeDict]]"
+    deck_extensions: "Future[List[DeckExtension]]"
+    # Pending notes actions are only downloaded for the AnKing deck
+    pending_notes_actions: "Optional[Future[List[NotesAction]]]"
+
+
 class _AnkiHubDeckUpdater:
     def __init__(self):
         self._importer = AnkiHubImporter()
         self._import_results: Optional[List[AnkiHubImportResult]] = None
+        # The deck which is currently being imported, only the download progress of this deck is shown
+        self._ah_did_being_updated: Optional[uuid.UUID] = None
+        # The deck extension whose updates are currently being applied, only its download progress is shown
+        self._deck_extension_id_being_updated: Optional[int] = None
 
     @cached_property
     def _client(self) -> AnkiHubClient:
@@ -80,80 +115,147 @@ class _AnkiHubDeckUpdater:
         return self._import_results
 
     def _update_decks(self, ah_dids: Collection[uuid.UUID]) -> None:
-        """Fetches and applies updates for the given decks and their extensions."""
+        """Fetches and applies updates for the given decks and their extensions.
+        The decks are imported one after another in this thread, because the collection can only be changed from
+        one thread at a time. The note updates of the next deck are downloaded while a deck is imported."""
         LOGGER.info("Updating decks...", ah_dids=ah_dids)
 
         create_backup()
 
-        for ah_did in ah_dids:
-            try:
-                should_continue = self._update_single_deck(ah_did)
-                if not should_continue:
-                    return
-            except AnkiHubHTTPError as e:
-                if self._handle_exception(e, ah_did):
-                    return
-                else:
-                    raise e
-
-    def _update_single_deck(self, ankihub_did: uuid.UUID) -> bool:
-        """Fetches and applies updates for a single deck. Also updates the deck extensions of the deck.
+        # The private config is updated several times per deck, it is written to its file once after all decks
+        # are updated.
+        with config.batched_private_config_updates(), ExitStack() as exit_stack:
+            executor = ThreadPoolExecutor(max_workers=DECK_DOWNLOAD_MAX_WORKERS, thread_name_prefix="deck_download")
+            # Downloads which haven't started yet are cancelled if the update is stopped early.
+            exit_stack.callback(executor.shutdown, wait=False, cancel_futures=True)
+
+            deck_downloads = {ah_did: self._start_deck_downloads(ah_did, executor) for ah_did in ah_dids}
+
+            # The note updates are only downloaded for the deck which is imported and the next one, so that the
+            # (possibly full deck) downloads of all decks don't run at the same time.
+            ah_dids = list(ah_dids)
+            deck_updates_chunks: Dict[uuid.UUID, Iterator[DeckUpdatesChunk]] = {}
+            for ah_did, next_ah_did in zip(ah_dids, ah_dids[1:] + [None]):
+                for ah_did_to_download in (ah_did, next_ah_did):
+                    if ah_did_to_download is not None and ah_did_to_download not in deck_updates_chunks:
+                        deck_updates_chunks[ah_did_to_download] = exit_stack.enter_context(
+                            prefetching(self._deck_updates_chunks(ah_did_to_download))
+                        )
+
+                self._ah_did_being_updated = ah_did
+                try:
+                    should_continue = self._update_single_deck(
+                        ah_did, deck_downloads=deck_downloads[ah_did], chunks=deck_updates_chunks[ah_did]
+                    )
+                    if not should_continue:
+                        return
+                except AnkiHubHTTPError as e:
+                    if self._handle_exception(e, ah_did):
+                        return
+                    else:
+                        raise e
+
+    def _start_deck_downloads(self, ankihub_did: uuid.UUID, executor: ThreadPoolExecutor) -> _DeckDownloads:
+        """Starts downloading everything that is needed to update a deck, apart from the note updates."""
+        return _DeckDownloads(
+            deck=executor.submit(self._client.get_deck_by_id, ankihub_did),
+            note_types=executor.submit(self._client.get_note_types_dict_for_deck, ankihub_did),
+            deck_extensions=executor.submit(self._client.get_deck_extensions_by_deck_id, ankihub_did),
+            pending_notes_actions=(
+                executor.submit(self._client.get_pending_notes_actions_for_deck, ankihub_did)
+                if ankihub_did == config.anking_deck_id
+                else None
+            ),
+        )
+
+    def _deck_updates_chunks(self, ankihub_did: uuid.UUID) -> Iterator[DeckUpdatesChunk]:
+        deck_config = config.deck_config(ankihub_did)
+
+        def is_being_updated() -> bool:
+            return self._ah_did_being_updated == ankihub_did
+
+        return self._client.get_deck_updates_chunks(
+            ankihub_did,
+            since=deck_config.latest_update,
+            download_full_deck=deck_config.download_full_deck_on_next_sync,
+            updates_download_progress_cb=lambda notes_count: (
+                _update_deck_updates_download_progress_cb(notes_count, ankihub_did=ankihub_did)
+                if is_being_updated()
+                else None
+            ),
+            deck_download_progress_cb=lambda percent: (
+                deck_download_progress_cb(percent) if is_being_updated() else None
+            ),
+        )
+
+    def _update_single_deck(
+        self, ankihub_did: uuid.UUID, deck_downloads: _DeckDownloads, chunks: Iterator[DeckUpdatesChunk]
+    ) -> bool:
+        """Applies the downloaded updates for a single deck. Also updates the deck extensions of the deck.
         Returns True if the update was successful, False if the user cancelled it."""
-        self._update_deck_config(ankihub_did)
+        config.update_deck(deck=deck_downloads.deck.result())
+        deck_extensions = deck_downloads.deck_extensions.result()
+
+        with ExitStack() as exit_stack:
+            # The updates of the deck extensions are downloaded while the note updates are imported.
+            deck_extension_updates_chunks = {
+                deck_extension.id: exit_stack.enter_context(
+                    prefetching(self._deck_extension_updates_chunks(deck_extension))
+                )
+                for deck_extension in deck_extensions
+            }
 
-        result = self._fetch_and_apply_deck_updates(ankihub_did)
-        if not result:
-            return False
+            result = self._apply_deck_updates(
+                ankihub_did,
+                chunks=chunks,
+                note_types=cast(Dict[NotetypeId, NotetypeDict], deck_downloads.note_types.result()),
+            )
+            if not result:
+                return False
 
-        result = self._fetch_and_apply_deck_extension_updates(ankihub_did)
-        if not result:
-            return False
+            result = self._apply_deck_extension_updates(ankihub_did, deck_extensions, deck_extension_updates_chunks)
+            if not result:
+                return False
 
-        if ankihub_did == config.anking_deck_id:
-            self.fetch_and_apply_pending_notes_actions_for_deck(ankihub_did)
+        if deck_downloads.pending_notes_actions is not None:
+            self._apply_pending_notes_actions(ankihub_did, deck_downloads.pending_notes_actions.result())
 
         return True
 
-    def _update_deck_config(self, ankihub_did: uuid.UUID) -> None:
-        deck = self._client.get_deck_by_id(ankihub_did)
-        config.update_deck(deck=deck)
-
-    def _fetch_and_apply_deck_updates(self, ankihub_did) -> bool:
-        """Downloads note updates from AnkiHub and imports them into Anki.
+    def _apply_deck_updates(
+        self,
+        ankihub_did: uuid.UUID,
+        chunks: Iterator[DeckUpdatesChunk],
+        note_types: Dict[NotetypeId, NotetypeDict],
+    ) -> bool:
+        """Imports note updates into Anki while they are downloaded.
+        The next page of updates is downloaded in the background while the current one is being imported.
         Returns True if the action was successful, False if the user cancelled it."""
 
         deck_config = config.deck_config(ankihub_did)
-        deck_updates = self._client.get_deck_updates(
-            ankihub_did,
-            since=deck_config.latest_update,
-            download_full_deck=deck_config.download_full_deck_on_next_sync,
-            updates_download_progress_cb=lambda notes_count: _update_deck_updates_download_progress_cb(
-                notes_count, ankihub_did=ankihub_did
-            ),
-            deck_download_progress_cb=deck_download_progress_cb,
-            should_cancel=lambda: aqt.mw.progress.want_cancel(),
-        )
-        if deck_updates is None:
+
+        # The protected fields and tags are the same for all chunks, but they are needed before
+        # the notes can be imported, so we wait for the first chunk.
+        first_chunk = next(chunks, None)
+        if aqt.mw.progress.want_cancel():
             LOGGER.info("User cancelled deck update.")
             return False
 
-        _log_if_protected_fields_shrank(ankihub_did, deck_updates.protected_fields)
-
-        note_types = cast(
-            Dict[NotetypeId, NotetypeDict],
-            self._client.get_note_types_dict_for_deck(ankihub_did),
-        )
+        protected_fields = first_chunk.protected_fields if first_chunk else {}
+        protected_tags = first_chunk.protected_tags if first_chunk else []
+        _log_if_protected_fields_shrank(ankihub_did, protected_fields)
 
+        notes = _NotesFromDeckUpdatesChunks(itertools.chain([first_chunk] if first_chunk else [], chunks))
         import_result = self._importer.import_ankihub_deck(
             ankihub_did=ankihub_did,
-            notes=deck_updates.notes,
+            notes=notes,
             note_types=note_types,
             deck_name=deck_config.name,
             is_first_import_of_deck=False,
             behavior_on_remote_note_deleted=deck_config.behavior_on_remote_note_deleted,
             anki_did=deck_config.anki_id,
-            protected_fields=deck_updates.protected_fields,
-            protected_tags=deck_updates.protected_tags,
+            protected_fields=protected_fields,
+            protected_tags=protected_tags,
             subdecks=deck_config.subdecks_enabled,
             suspend_new_cards_of_new_notes=deck_config.suspend_new_cards_of_new_notes,
             suspend_new_cards_of_existing_notes=deck_config.suspend_new_cards_of_existing_notes,
@@ -162,11 +264,17 @@ class _AnkiHubDeckUpdater:
         )
         self._import_results.append(import_result)
 
-        config.set_globally_protected_fields(ankihub_did, deck_updates.protected_fields)
+        if notes.cancelled:
+            # The updates which were imported before the user cancelled are kept. The latest update
+            # is not saved, so that all updates are downloaded again on the next sync.
+            LOGGER.info("User cancelled deck update.")
+            return False
+
+        config.set_globally_protected_fields(ankihub_did, protected_fields)
 
-        if deck_updates.latest_update:
+        if notes.latest_update:
             # latest_update is None if there were no notes in the updates
-            config.save_latest_deck_update(ankihub_did, deck_updates.latest_update)
+            config.save_latest_deck_update(ankihub_did, notes.latest_update)
 
         config.set_download_full_deck_on_next_sync(ankihub_did, False)
 
@@ -174,6 +282,9 @@ class _AnkiHubDeckUpdater:
 
     def fetch_and_apply_pending_notes_actions_for_deck(self, ankihub_did: uuid.UUID) -> None:
         pending_notes_actions = self._client.get_pending_notes_actions_for_deck(ankihub_did)
+        self._apply_pending_notes_actions(ankihub_did, pending_notes_actions)
+
+    def _apply_pending_notes_actions(self, ankihub_did: uuid.UUID, pending_notes_actions: List[NotesAction]) -> None:
         if not pending_notes_actions:
             LOGGER.info("No pending notes actions to apply for deck", ah_did=ankihub_did)
             return
@@ -185,10 +296,30 @@ class _AnkiHubDeckUpdater:
                 )
             unsuspend_notes(ah_nids=pending_note_action.note_ids)
 
-    def _fetch_and_apply_deck_extension_updates(self, ankihub_did: uuid.UUID) -> bool:
-        # returns True if the update was successful, False if the user cancelled it
-        deck_extensions = self._client.get_deck_extensions_by_deck_id(ankihub_did)
+    def _deck_extension_updates_chunks(self, deck_extension: DeckExtension) -> Iterator[DeckExtensionUpdateChunk]:
+        # The config of a new deck extension is only created when its updates are applied
+        deck_extension_config = config.deck_extension_config(deck_extension.id)
+
+        def is_being_updated() -> bool:
+            return self._deck_extension_id_being_updated == deck_extension.id
+
+        return self._client.get_deck_extension_updates(
+            deck_extension_id=deck_extension.id,
+            since=deck_extension_config.latest_update if deck_extension_config else None,
+            download_progress_cb=lambda note_customizations_count: (
+                _update_extension_download_progress_cb(note_customizations_count, deck_extension.id)
+                if is_being_updated()
+                else None
+            ),
+        )
 
+    def _apply_deck_extension_updates(
+        self,
+        ankihub_did: uuid.UUID,
+        deck_extensions: List[DeckExtension],
+        deck_extension_updates_chunks: Dict[int, Iterator[DeckExtensionUpdateChunk]],
+    ) -> bool:
+        # returns True if the update was successful, False if the user cancelled it
         self._remove_deck_extensions_gone_from_ankihub(ankihub_did, deck_extensions)
 
         if not deck_extensions:
@@ -196,7 +327,10 @@ class _AnkiHubDeckUpdater:
             return True
 
         for deck_extension in deck_extensions:
-            if not self._download_updates_for_extension(deck_extension):
+            self._deck_extension_id_being_updated = deck_extension.id
+            if not self._apply_updates_for_extension(
+                deck_extension, chunks=deck_extension_updates_chunks[deck_extension.id]
+            ):
                 return False
 
         return True
@@ -210,19 +344,15 @@ class _AnkiHubDeckUpdater:
         for extension_id in local_extension_ids - server_extension_ids:
             config.remove_deck_extension(extension_id)
 
-    def _download_updates_for_extension(self, deck_extension: DeckExtension) -> bool:
+    def _apply_updates_for_extension(
+        self, deck_extension: DeckExtension, chunks: Iterator[DeckExtensionUpdateChunk]
+    ) -> bool:
         # returns True if the update was successful, False if the user cancelled it
         config.create_or_update_deck_extension_config(deck_extension)
-        deck_extension_config = config.deck_extension_config(deck_extension.id)
         latest_update: Optional[datetime] = None
-        updated_notes = []
-        for chunk in self._client.get_deck_extension_updates(
-            deck_extension_id=deck_extension.id,
-            since=deck_extension_config.latest_update,
-            download_progress_cb=lambda note_customizations_count: _update_extension_download_progress_cb(
-                note_customizations_count, deck_extension.id
-            ),
-        ):
+        # The optional tags of a note in a later chunk replace the ones in earlier chunks
+        optional_tags_by_anki_nid: Dict[NoteId, List[str]] = {}
+        for chunk in chunks:
             if not chunk.note_customizations:
                 continue
 
@@ -230,30 +360,33 @@ class _AnkiHubDeckUpdater:
                 LOGGER.info("User cancelled extension update.")
                 return False
 
+            ah_nid_to_anki_nid = ankihub_db.ankihub_nids_to_anki_nids(
+                [customization.ankihub_nid for customization in chunk.note_customizations]
+            )
             for customization in chunk.note_customizations:
-                anki_nid = ankihub_db.anki_nid_for_ankihub_nid(customization.ankihub_nid)
-                try:
-                    note = aqt.mw.col.get_note(anki_nid)
-                except NotFoundError:
+                anki_nid = ah_nid_to_anki_nid[customization.ankihub_nid]
+                if anki_nid is None:
                     LOGGER.warning(
                         "Tried to apply customization to note but note was not found.",
                         ah_nid=customization.ankihub_nid,
                     )
                     continue
-                else:
-                    # Only tags from this tag group should be modified.
-                    tags_not_from_this_tag_group = [
-                        tag for tag in note.tags if not is_tag_for_group(tag, deck_extension.tag_group_name)
-                    ]
-                    note.tags = tags_not_from_this_tag_group + customization.tags
-                    updated_notes.append(note)
+                optional_tags_by_anki_nid[anki_nid] = customization.tags
 
             # each chunk contains the latest update timestamp of the notes in it, we need the latest one
             latest_update = max(chunk.latest_update, latest_update or chunk.latest_update)
 
+        updated_notes = _notes_with_updated_optional_tags(optional_tags_by_anki_nid, deck_extension.tag_group_name)
         if updated_notes:
             aqt.mw.col.update_notes(updated_notes)
 
+        LOGGER.info(
+            "Applied deck extension updates.",
+            deck_extension_id=deck_extension.id,
+            note_customizations_count=len(optional_tags_by_anki_nid),
+            updated_notes_count=len(updated_notes),
+        )
+
         if latest_update:
             config.save_latest_extension_update(deck_extension.id, latest_update)
 
@@ -297,6 +430,62 @@ class _AnkiHubDeckUpdater:
 ah_deck_updater = _AnkiHubDeckUpdater()
 
 
+class _NotesFromDeckUpdatesChunks:
+    """Iterates over the notes of deck updates chunks while they are downloaded.
+    Keeps track of the latest update of the chunks and stops early if the user cancels the deck update."""
+
+    def __init__(self, chunks: Iterable[DeckUpdatesChunk]):
+        self._chunks = chunks
+        self.latest_update: Optional[datetime] = None
+        self.cancelled = False
+
+    def __iter__(self) -> Iterator[NoteInfo]:
+        for chunk in self._chunks:
+            if aqt.mw.progress.want_cancel():
+                self.cancelled = True
+                return
+
+            if not chunk.notes:
+                continue
+
+            yield from chunk.notes
+
+            # Each chunk contains the latest update timestamp of the notes in it, we need the latest one
+            self.latest_update = max(chunk.latest_update, self.latest_update or chunk.latest_update)
+
+
+def _notes_with_updated_optional_tags(
+    optional_tags_by_anki_nid: Dict[NoteId, List[str]], tag_group_name: str
+) -> List[Note]:
+    """Replaces the optional tags of the tag group on the notes with the given optional tags.
+    The current tags of the notes are loaded with a query per chunk of notes, so that only notes whose tags change
+    have to be loaded and saved.
+    Returns the changed notes, which still have to be saved."""
+    tags_by_anki_nid: Dict[NoteId, str] = {}
+    for anki_nids_chunk in chunks(list(optional_tags_by_anki_nid.keys()), DEFAULT_CHUNK_SIZE):
+        tags_by_anki_nid.update(aqt.mw.col.db.all(f"SELECT id, tags FROM notes WHERE id IN {ids2str(anki_nids_chunk)}"))
+
+    result = []
+    for anki_nid, optional_tags in optional_tags_by_anki_nid.items():
+        if (tags_string := tags_by_anki_nid.get(anki_nid)) is None:
+            LOGGER.warning("Tried to apply customization to note but note was not found.", anki_nid=anki_nid)
+            continue
+
+        # Only tags from this tag group should be modified.
+        tags = aqt.mw.col.tags.split(tags_string)
+        new_tags = [tag for tag in tags if not is_tag_for_group(tag, tag_group_name)] + optional_tags
+
+        # Anki compares tags case-insensitively and doesn't keep their order
+        if {tag.lower() for tag in new_tags} == {tag.lower() for tag in tags}:
+            continue
+
+        note = aqt.mw.col.get_note(anki_nid)
+        note.tags = new_tags
+        result.append(note)
+
+    return result
+
+
 def _log_if_protected_fields_shrank(ah_did: uuid.UUID, new_protected_fields: Dict[int, List[str]]) -> None:
     """Warns when the deck updates carry less field protection than the previous sync did.
 
@@ -1,6 +1,7 @@
-import hashlib
 import json
 import os
+import threading
+import time
 import uuid
 from concurrent.futures import Future
 from datetime import datetime
@@ -10,9 +11,6 @@ from pathlib import Path
 from typing import Callable, Iterable, List, Optional, Set, Tuple
 
 import aqt
-from anki.errors import NotFoundError
-from anki.models import NotetypeId
-from anki.notes import NoteId
 from aqt.gui_hooks import theme_did_change, top_toolbar_did_redraw
 from aqt.qt import (
     QAction,
@@ -36,7 +34,6 @@ from aqt.qt import (
 from .. import LOGGER
 from ..addon_ankihub_client import AddonAnkiHubClient, CollectionNotAvailableError, collection_or_error
 from ..ankihub_client.models import DeckMedia
-from ..common_utils import get_media_names_from_note_field, get_media_names_from_note_type
 from ..db import ankihub_db
 from ..settings import config, get_anki_profile_id
 from .operations import AddonQueryOp
@@ -50,6 +47,10 @@ from .utils import (
 
 SHOW_MEDIA_PROGRESS_PYCMD = "ankihub_show_media_progress"
 TOOLBAR_BUTTON_ID = "ankihub_media_sync"
+
+# How often the download speed shown in the media sync progress dialog is updated
+DOWNLOAD_SPEED_UPDATE_INTERVAL_SECONDS = 1.0
+
 # Gates the media sync progress UI, i.e. the progress dialog and the toolbar button.
 # While it's off, the media sync only reports its status as text on the menu action.
 MEDIA_SYNC_PROGRESS_UI_FEATURE_FLAG = "media_sync_progress_ui"
@@ -97,6 +98,10 @@ class _AnkiHubMediaSync:
         self._errors: list[Exception] = []
         # Used for retry
         self._last_op_callback: Optional[Callable] = None
+        # Used to measure the download speed
+        self._download_speed_lock = threading.Lock()
+        self._downloaded_bytes_since_speed_update = 0
+        self._last_download_speed_update = time.monotonic()
 
     def setup_hooks(self) -> None:
         top_toolbar_did_redraw.append(lambda _: self.refresh_sync_status(False))
@@ -247,6 +252,10 @@ class _AnkiHubMediaSync:
         if (dialog := self._dialog_if_enabled()) is not None:
             dialog.increment_progress(increment)
 
+    def _update_dialog_download_speed(self, bytes_per_second: float) -> None:
+        if (dialog := self._dialog_if_enabled()) is not None:
+            dialog.update_download_speed(bytes_per_second)
+
     def _media_paths_for_media_names(self, media_names: Iterable[str]) -> Set[Path]:
         media_dir_path = Path(collection_or_error().media.dir())
         return {media_dir_path / media_name for media_name in media_names}
@@ -273,6 +282,9 @@ class _AnkiHubMediaSync:
 
         missing_media_count = sum(len(m[1]) for m in all_missing)
         aqt.mw.taskman.run_on_main(lambda: self._reset_dialog_progress(missing_media_count))
+        with self._download_speed_lock:
+            self._downloaded_bytes_since_speed_update = 0
+            self._last_download_speed_update = time.monotonic()
 
         for ah_did, missing_media_names in all_missing:
             if self._stop_background_threads:
@@ -287,7 +299,12 @@ class _AnkiHubMediaSync:
                 ah_did=ah_did,
                 missing_media_count=len(missing_media_names),
             )
-            self._client.download_media(missing_media_names, ah_did, self._on_downloaded_file)
+            self._client.download_media(
+                missing_media_names,
+                ah_did,
+                self._on_downloaded_file,
+                on_bytes_downloaded=self._on_bytes_downloaded,
+            )
 
     def _on_downloaded_file(self, future: Future) -> None:
         try:
@@ -296,6 +313,22 @@ class _AnkiHubMediaSync:
             self._errors.append(exc)
         aqt.mw.taskman.run_on_main(lambda: self._increment_dialog_progress())
 
+    def _on_bytes_downloaded(self, bytes_count: int) -> None:
+        # This is called from the download threads for each downloaded chunk, so the download speed
+        # shown in the dialog is only updated at most once per DOWNLOAD_SPEED_UPDATE_INTERVAL_SECONDS.
+        with self._download_speed_lock:
+            self._downloaded_bytes_since_speed_update += bytes_count
+            now = time.monotonic()
+            elapsed_seconds = now - self._last_download_speed_update
+            if elapsed_seconds < DOWNLOAD_SPEED_UPDATE_INTERVAL_SECONDS:
+                return
+
+            bytes_per_second = self._downloaded_bytes_since_speed_update / elapsed_seconds
+            self._downloaded_bytes_since_speed_update = 0
+            self._last_download_speed_update = now
+
+        aqt.mw.taskman.run_on_main(lambda: self._update_dialog_download_speed(bytes_per_second))
+
     def _update_deck_media(self, ankihub_did: uuid.UUID) -> None:
         """Fetch deck media updates from AnkiHub and update the database and the config.
 
@@ -336,26 +369,9 @@ class _AnkiHubMediaSync:
             LOGGER.info("No new media updates for deck.", ah_did=ankihub_did)
 
     def _media_referenced_by_notes(self, ah_did: uuid.UUID) -> Set[str]:
-        """Scan all notes in the AnkiHub deck and return the set of referenced media filenames."""
-        anki_nids: List[NoteId] = ankihub_db.anki_nids_for_ankihub_deck(ah_did)
-
-        media_names: Set[str] = set()
-        note_type_ids: Set[int] = set()
-        for nid in anki_nids:
-            try:
-                note = collection_or_error().get_note(nid)
-            except NotFoundError:
-                continue
-            note_type_ids.add(note.mid)
-            note_type = note.note_type()
-            for field in note.values():
-                media_names.update(get_media_names_from_note_field(field, note_type))
-        for note_type_id in note_type_ids:
-            note_type = ankihub_db.note_type_dict(NotetypeId(note_type_id))
-            # Guard against notes converted to non-AnkiHub note types
-            if note_type:
-                media_names.update(get_media_names_from_note_type(note_type))
-        return media_names
+        """Return the set of media filenames referenced by the notes of the AnkiHub deck.
+        The media references of notes are stored in the AnkiHub DB, so no notes have to be loaded and scanned."""
+        return ankihub_db.media_names_for_ankihub_deck(ah_did)
 
     def _missing_media_for_ah_deck(self, ah_did: uuid.UUID) -> List[str]:
         media_list = ankihub_db.downloadable_media_for_ankihub_deck(ah_did)
@@ -366,12 +382,15 @@ class _AnkiHubMediaSync:
         # Filter to only media that is both downloadable AND referenced by notes
         media_list = [m for m in media_list if m.name in referenced_media]
 
+        # The hashes of local media files are cached, so that only files which changed since the
+        # last media sync need to be read.
         media_dir_path = Path(collection_or_error().media.dir())
+        local_media_hashes = ankihub_db.media_file_hashes([media_dir_path / media.name for media in media_list])
         result = [
             media.name
             for media in media_list
-            if not (media_dir_path / media.name).exists()
-            or media.file_content_hash != hashlib.md5((media_dir_path / media.name).read_bytes()).hexdigest()
+            if (media_dir_path / media.name) not in local_media_hashes
+            or media.file_content_hash != local_media_hashes[media_dir_path / media.name]
         ]
         return result
 
@@ -475,6 +494,8 @@ class MediaSyncProgressDialog(QDialog):
         self.status_label = status_label = QLabel()
         hbox1.addWidget(status_label)
         hbox1.addStretch(1)
+        self.speed_label = speed_label = QLabel()
+        hbox1.addWidget(speed_label)
         self.count_label = count_label = QLabel()
         hbox1.addWidget(count_label)
         vbox.addLayout(hbox1)
@@ -574,6 +595,8 @@ class MediaSyncProgressDialog(QDialog):
         self.minimize_button.setVisible(minimize)
         self.progress_bar.setVisible(progress)
         self.error_label.setVisible(error)
+        if status != MediaSyncStatus.DOWNLOAD:
+            self.speed_label.setText("")
         self.status_label.setText(label)
 
         self.error_log_area.show()
@@ -588,6 +611,9 @@ class MediaSyncProgressDialog(QDialog):
         self.progress_bar.setMaximum(maximum)
         self.update_count_label()
 
+    def update_download_speed(self, bytes_per_second: float) -> None:
+        self.speed_label.setText(f"{bytes_per_second / 1024 / 1024:.1f} MB/s")
+
     def update_count_label(self) -> None:
         if self.progress_bar.maximum():
             label = f"{self.progress_bar.value()}/{self.progress_bar.maximum()} files"
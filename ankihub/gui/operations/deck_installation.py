@@ -1,11 +1,12 @@
 """Code for downloading and installing decks in the background and showing the related dialogs
 (install confirmation dialog, import summary dialog, etc.)."""
 
+import itertools
 import uuid
 from concurrent.futures import Future
 from datetime import datetime
 from functools import partial
-from typing import Callable, Dict, List, cast
+from typing import Callable, Dict, Iterable, Iterator, List, cast
 
 import aqt
 from anki.models import NotetypeDict, NotetypeId
@@ -31,6 +32,7 @@ from ...settings import (
 from ..exceptions import DeckDownloadAndInstallError, RemoteDeckNotFoundError
 from ..media_sync import media_sync
 from ..messages import messages
+from ..threading_utils import prefetching
 from ..utils import deck_download_progress_cb, logged_into_ankiweb, show_dialog
 from .subdecks import build_subdecks_and_move_cards_to_them_in_background
 from .utils import future_with_result, pass_exceptions_to_on_done
@@ -225,27 +227,33 @@ def _download_and_install_single_deck(
     behavior_on_remote_note_deleted: BehaviorOnRemoteNoteDeleted,
     recommended_deck_settings: bool,
 ) -> AnkiHubImportResult:
-    notes_data: List[NoteInfo] = AnkiHubClient().download_deck(
+    # The notes are imported batch by batch while the rest of the deck is downloaded.
+    notes_batches = AnkiHubClient().download_deck_in_batches(
         deck.ah_did, download_progress_cb=deck_download_progress_cb
     )
+    with prefetching(notes_batches) as prefetched_notes_batches:
+        result = _install_deck(
+            notes_data=_notes_from_batches(prefetched_notes_batches),
+            deck_name=deck.name,
+            ankihub_did=deck.ah_did,
+            user_relation=deck.user_relation,
+            behavior_on_remote_note_deleted=behavior_on_remote_note_deleted,
+            latest_update=deck.csv_last_upload,
+            recommended_deck_settings=recommended_deck_settings,
+        )
 
-    aqt.mw.taskman.run_on_main(lambda: aqt.mw.progress.update(label="Installing deck...", max=0, value=0))
+    return result
 
-    result = _install_deck(
-        notes_data=notes_data,
-        deck_name=deck.name,
-        ankihub_did=deck.ah_did,
-        user_relation=deck.user_relation,
-        behavior_on_remote_note_deleted=behavior_on_remote_note_deleted,
-        latest_update=deck.csv_last_upload,
-        recommended_deck_settings=recommended_deck_settings,
-    )
 
-    return result
+def _notes_from_batches(notes_batches: Iterable[List[NoteInfo]]) -> Iterator[NoteInfo]:
+    yield from itertools.chain.from_iterable(notes_batches)
+
+    # The import of the deck continues after the download is finished
+    aqt.mw.taskman.run_on_main(lambda: aqt.mw.progress.update(label="Installing deck...", max=0, value=0))
 
 
 def _install_deck(
-    notes_data: List[NoteInfo],
+    notes_data: Iterable[NoteInfo],
     deck_name: str,
     ankihub_did: uuid.UUID,
     user_relation: UserDeckRelation,
@@ -253,7 +261,8 @@ def _install_deck(
     latest_update: datetime,
     recommended_deck_settings: bool,
 ) -> AnkiHubImportResult:
-    """Imports the notes_data into the Anki collection.
+    """Imports the notes_data into the Anki collection. notes_data can be a lazy iterable of notes which are still
+    being downloaded.
     Saves the deck subscription to the config file.
     Starts the media download.
     Returns information about the import.
@@ -135,6 +135,7 @@ class OptionalTagsSuggestionDialog(QDialog):
             task=lambda: self._optional_tags_helper.suggest_tags_for_groups(
                 tag_groups=self._selected_tag_groups(),
                 auto_accept=self.auto_accept_cb.isChecked(),
+                progress_cb=_update_submit_progress,
             ),
             on_done=self._on_submit_finished,
             label="Submitting suggestions...",
@@ -241,3 +242,13 @@ class OptionalTagsSuggestionDialog(QDialog):
 
         self._refresh_submit_btn()
         self._refresh_auto_accept_check_box()
+
+
+def _update_submit_progress(suggestions_sent: int, suggestions_count: int) -> None:
+    aqt.mw.taskman.run_on_main(
+        lambda: aqt.mw.progress.update(
+            label=f"Submitting suggestions...\n{suggestions_sent} / {suggestions_count}",
+            value=suggestions_sent,
+            max=suggestions_count,
+        )
+    )
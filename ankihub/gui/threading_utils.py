@@ -1,7 +1,10 @@
+import queue
 import threading
 import time
+from contextlib import contextmanager
 from functools import wraps
-from typing import Callable, Optional
+from types import GeneratorType
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple, TypeVar
 
 from .. import LOGGER
 
@@ -35,3 +38,63 @@ def rate_limited(seconds: float, on_done_arg_name: Optional[str] = None) -> Call
         return wrapper
 
     return decorator
+
+
+T = TypeVar("T")
+
+# How often the prefetching thread checks whether it should stop while waiting for the consumer
+PREFETCH_POLL_INTERVAL_SECONDS = 0.1
+
+_END_OF_ITEMS = object()
+
+
+@contextmanager
+def prefetching(iterable: Iterable[T], max_prefetched: int = 1) -> Iterator[Iterator[T]]:
+    """Iterates over the iterable in a background thread, so that up to max_prefetched items are
+    produced while the consumer is still processing the previous item.
+    This is useful when producing an item and processing it are both slow, e.g. when downloading
+    pages of data and importing them.
+    Exceptions raised while producing an item are re-raised to the consumer when it reaches that item.
+    When the context is left, the background thread stops after producing its current item."""
+    items: "queue.Queue[Tuple[Any, Optional[BaseException]]]" = queue.Queue(maxsize=max_prefetched)
+    should_stop = threading.Event()
+
+    def put(item: Any, exception: Optional[BaseException] = None) -> bool:
+        while not should_stop.is_set():
+            try:
+                items.put((item, exception), timeout=PREFETCH_POLL_INTERVAL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce() -> None:
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(_END_OF_ITEMS, e)
+        else:
+            put(_END_OF_ITEMS)
+        finally:
+            if isinstance(iterator, GeneratorType):
+                # Make sure that resources held by the generator are released in this thread.
+                iterator.close()
+
+    def consume() -> Iterator[T]:
+        while True:
+            item, exception = items.get()
+            if exception is not None:
+                raise exception
+            if item is _END_OF_ITEMS:
+                return
+            yield item
+
+    thread = threading.Thread(target=produce, name="prefetching", daemon=True)
+    thread.start()
+    try:
+        yield consume()
+    finally:
+        should_stop.set()
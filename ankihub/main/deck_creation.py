@@ -7,13 +7,15 @@ from typing import Dict, List
 
 import aqt
 from anki.decks import DeckId
-from anki.models import NotetypeId
+from anki.models import NotetypeDict, NotetypeId
 from anki.notes import NoteId
+from anki.utils import ids2str
 
 from .. import LOGGER
 from ..addon_ankihub_client import AddonAnkiHubClient as AnkiHubClient
 from ..ankihub_client.models import NoteInfo
 from ..db import ankihub_db
+from ..db.db import DEFAULT_CHUNK_SIZE, chunks
 from ..settings import ANKIHUB_NOTE_TYPE_FIELD_NAME
 from .exporting import to_note_data
 from .subdecks import add_subdeck_tags_to_notes
@@ -57,10 +59,7 @@ def create_ankihub_deck(
     if add_subdeck_tags:
         add_subdeck_tags_to_notes(anki_deck_name=deck_name, ankihub_deck_name=deck_name)
 
-    nids = aqt.mw.col.find_notes(f'deck:"{deck_name}"')
-    notes_data = [to_note_data(aqt.mw.col.get_note(nid), set_new_id=True) for nid in nids]
-
-    _set_ankihub_id_fields_based_on_notes_data(notes_data)
+    notes_data = _assign_ankihub_ids_to_notes(note_ids)
 
     ankihub_did = _upload_deck(
         deck_id,
@@ -97,25 +96,31 @@ def _create_note_types_for_deck(deck_id: DeckId) -> Dict[NotetypeId, NotetypeId]
 def _change_note_types_of_notes(note_ids: typing.List[NoteId], note_type_mapping: dict) -> None:
     LOGGER.info("Changing note types of notes...", note_type_mapping=note_type_mapping)
     nid_mid_pairs = []
-    for note_id in note_ids:
-        note = aqt.mw.col.get_note(id=note_id)
-        target_note_type_id = note_type_mapping[note.mid]
-        nid_mid_pairs.append((note_id, target_note_type_id))
+    for note_ids_chunk in chunks(note_ids, DEFAULT_CHUNK_SIZE):
+        for note_id, mid in aqt.mw.col.db.execute(f"SELECT id, mid FROM notes WHERE id IN {ids2str(note_ids_chunk)}"):
+            nid_mid_pairs.append((NoteId(note_id), note_type_mapping[mid]))
 
     change_note_types_of_notes(nid_mid_pairs=nid_mid_pairs)
     LOGGER.info("Changed note types of notes.")
 
 
-def _set_ankihub_id_fields_based_on_notes_data(notes_data: List[NoteInfo]) -> None:
-    """Assign UUID to notes that have an AnkiHub ID field already."""
-    updated_notes = []
+def _assign_ankihub_ids_to_notes(note_ids: typing.List[NoteId]) -> List[NoteInfo]:
+    """Assign new AnkiHub IDs to the notes and return the note data for uploading them.
+    The notes are processed in chunks and each note is loaded only once."""
     LOGGER.info("Assigning AnkiHub IDs to notes...")
-    for note_data in notes_data:
-        note = aqt.mw.col.get_note(id=NoteId(note_data.anki_nid))
-        note[ANKIHUB_NOTE_TYPE_FIELD_NAME] = str(note_data.ah_nid)
-        updated_notes.append(note)
-    aqt.mw.col.update_notes(updated_notes)
-    LOGGER.info("Updated notes.", updated_notes_count=len(updated_notes))
+    note_type_dict_cache: Dict[NotetypeId, NotetypeDict] = {}
+    notes_data: List[NoteInfo] = []
+    for note_ids_chunk in chunks(note_ids, DEFAULT_CHUNK_SIZE):
+        updated_notes = []
+        for note_id in note_ids_chunk:
+            note = aqt.mw.col.get_note(note_id)
+            note_data = to_note_data(note, set_new_id=True, note_type_dict_cache=note_type_dict_cache)
+            note[ANKIHUB_NOTE_TYPE_FIELD_NAME] = str(note_data.ah_nid)
+            updated_notes.append(note)
+            notes_data.append(note_data)
+        aqt.mw.col.update_notes(updated_notes)
+    LOGGER.info("Updated notes.", updated_notes_count=len(notes_data))
+    return notes_data
 
 
 def _upload_deck(
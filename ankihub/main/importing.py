@@ -6,22 +6,22 @@ import uuid
 from dataclasses import dataclass
 from enum import Enum
 from pprint import pformat
-from typing import Collection, Dict, List, Optional, Sequence, Set, Tuple
+from typing import Collection, Dict, Iterable, List, Optional, Sequence, Set, Sized, Tuple
 
 import aqt
 from anki import consts as anki_consts
-from anki.cards import Card
+from anki.cards import CardId
 from anki.consts import QUEUE_TYPE_SUSPENDED
 from anki.decks import DeckId
-from anki.errors import NotFoundError
 from anki.models import NotetypeDict, NotetypeId
 from anki.notes import Note, NoteId
-from anki.utils import ids2str
+from anki.utils import ids2str, split_fields
 
 from .. import LOGGER, settings
 from ..ankihub_client import Field, NoteInfo
 from ..ankihub_client.models import SuggestionType
 from ..db import ankihub_db
+from ..db.db import DEFAULT_CHUNK_SIZE, chunks
 from ..settings import (
     TAG_FOR_INSTRUCTION_NOTES,
     TAG_STARTER_NOTES,
@@ -35,7 +35,7 @@ from .deck_options import set_ankihub_config_for_deck
 from .exceptions import ChangesRequireFullSyncError
 from .note_conversion import (
     TAG_FOR_PROTECTING_ALL_FIELDS,
-    get_fields_protected_by_tags,
+    fields_protected_by_tags,
     is_internal_tag,
     is_optional_tag,
 )
@@ -43,6 +43,7 @@ from .note_deletion import TAG_FOR_DELETED_NOTES
 from .subdecks import build_subdecks_and_move_cards_to_them
 from .utils import (
     add_notes,
+    batched,
     change_note_types_of_notes,
     create_deck_with_id,
     create_note_type_with_id,
@@ -51,13 +52,18 @@ from .utils import (
     get_unique_ankihub_deck_name,
     is_tag_in_list,
     lowest_level_common_ancestor_did,
-    note_type_with_updated_templates_and_css,
     truncated_list,
+    update_note_type_templates_and_css,
 )
 
 # How many cards the previous AnKing deck should at least have to be considered the previous deck
 MIN_ANKING_CARDS_FOR_PREVIOUS_DECK = 1000
 
+# How many notes are imported into the Anki and AnkiHub databases at once.
+# Notes are imported in batches so that the notes to import can be streamed in without holding all of them
+# (and the Anki notes prepared from them) in memory at the same time.
+IMPORT_BATCH_SIZE = 2000
+
 # How many note ids to keep per key in the summaries of overwritten content
 OVERWRITE_SAMPLE_LIMIT = 10
 
@@ -130,6 +136,17 @@ class AnkiHubImportResult:
         return pformat(self.__dict__)
 
 
+@dataclass(frozen=True)
+class _AnkiNoteRow:
+    """The columns of a row of the notes table of the Anki DB which are needed to prepare a note for import."""
+
+    id: NoteId
+    guid: str
+    mid: NotetypeId
+    fields: List[str]
+    tags: List[str]
+
+
 class AnkiHubImporter:
     def __init__(self):
         self._created_nids: List[NoteId] = []
@@ -150,10 +167,12 @@ class AnkiHubImporter:
         self._protected_tags: Optional[List[str]] = None
         self._local_did: Optional[DeckId] = None
 
+        self._field_names_by_mid: Dict[NotetypeId, List[str]] = {}
+
     def import_ankihub_deck(
         self,
         ankihub_did: uuid.UUID,
-        notes: List[NoteInfo],
+        notes: Iterable[NoteInfo],
         note_types: Dict[NotetypeId, NotetypeDict],
         protected_fields: Dict[int, List[str]],
         protected_tags: List[str],
@@ -178,6 +197,8 @@ class AnkiHubImporter:
         but they will be updated to e.g. have the same fields and field order as the provided note types.
         subdeck indicates whether cards should be moved into subdecks based on subdeck tags
         subdecks_for_new_notes_only indicates whether only new notes should be moved into subdecks
+        notes can be a lazy iterable, e.g. notes which are still being downloaded. They are consumed and imported
+        in batches of IMPORT_BATCH_SIZE notes. When a note occurs multiple times, the last occurrence wins.
         """
         LOGGER.info(
             "Importing ankihub deck...",
@@ -185,7 +206,7 @@ class AnkiHubImporter:
             ankihub_did=ankihub_did,
             anki_did=anki_did,
             is_first_import_of_deck=is_first_import_of_deck,
-            notes_count=len(notes),
+            notes_count=len(notes) if isinstance(notes, Sized) else None,
             protected_fields=protected_fields,
             protected_tags=protected_tags,
             subdecks=subdecks,
@@ -197,11 +218,13 @@ class AnkiHubImporter:
         self._updated_nids = []
         self._nids_without_changes = []
         self._deleted_nids = []
+        self._marked_as_deleted_nids = []
         self._skipped_nids = []
         self._overwritten_fields = _OverwriteTally()
         self._cleared_fields = _OverwriteTally()
         self._removed_tags = _OverwriteTally()
         self._overwritten_mids_without_protection = set()
+        self._field_names_by_mid = {}
 
         self._ankihub_did = ankihub_did
         self._is_first_import_of_deck = is_first_import_of_deck
@@ -217,13 +240,20 @@ class AnkiHubImporter:
 
         self._import_note_types(note_types=note_types)
 
-        if notes:
+        imported_notes_count = 0
+        for notes_batch in batched(notes, IMPORT_BATCH_SIZE):
             self._import_notes(
-                notes_data=notes,
+                notes_data=_last_occurrences_of_notes(notes_batch),
                 behavior_on_remote_note_deleted=behavior_on_remote_note_deleted,
                 suspend_new_cards_of_new_notes=suspend_new_cards_of_new_notes,
                 suspend_new_cards_of_existing_notes=suspend_new_cards_of_existing_notes,
             )
+            imported_notes_count += len(notes_batch)
+
+        if imported_notes_count:
+            self._merge_nids_of_batches()
+            self._log_note_import_summary()
+            self._log_overwritten_content_summary()
 
         merged_with_existing_deck = False
         if self._is_first_import_of_deck:
@@ -349,13 +379,11 @@ class AnkiHubImporter:
 
         for mid, remote_note_type in remote_note_types.items():
             local_note_type = aqt.mw.col.models.get(mid)
-            updated_note_type = note_type_with_updated_templates_and_css(
+            update_note_type_templates_and_css(
                 old_note_type=local_note_type,
                 new_note_type=(remote_note_type if should_use_new_templates_by_mid[mid] else None),
             )
 
-            aqt.mw.col.models.update_dict(updated_note_type)
-
     def _import_note_types_into_ankihub_db(self, note_types: Dict[NotetypeId, NotetypeDict]) -> None:
         with ankihub_db.db.atomic():
             if self._clear_note_types_before_import:
@@ -379,14 +407,14 @@ class AnkiHubImporter:
 
         Cards in the Anki database may be suspended based on the provided parameters.
 
-        Returns a set of Anki deck IDs that the created or updated or notes
-        without changes belong to.
+        Can be called multiple times for batches of notes of the same import. The nids of the
+        imported notes are added to the nid lists of the importer.
         """
         # Upsert notes into AnkiHub DB.
         upserted_notes_data, skipped_notes_data = ankihub_db.upsert_notes_data(
             ankihub_did=self._ankihub_did, notes_data=notes_data
         )
-        self._skipped_nids = [NoteId(note_data.anki_nid) for note_data in skipped_notes_data]
+        self._skipped_nids.extend(NoteId(note_data.anki_nid) for note_data in skipped_notes_data)
         LOGGER.info(
             "Upserted notes into AnkiHub DB.",
             upserted_notes_count=len(upserted_notes_data),
@@ -400,18 +428,18 @@ class AnkiHubImporter:
             notes_to_create_by_ah_nid,
             notes_to_update,
             notes_to_delete,
-            notes_without_changes,
+            nids_without_changes,
         ) = self._prepare_notes(notes_data=upserted_notes_data)
         LOGGER.info(
             "Prepared notes for import.",
             notes_to_create_count=len(notes_to_create_by_ah_nid),
             notes_to_update_count=len(notes_to_update),
             notes_to_delete_count=len(notes_to_delete),
-            notes_without_changes_count=len(notes_without_changes),
+            notes_without_changes_count=len(nids_without_changes),
         )
-        self._nids_without_changes = [NoteId(note.id) for note in notes_without_changes]
+        self._nids_without_changes.extend(nids_without_changes)
 
-        cards_by_anki_nid_before_import = cards_by_anki_nid_dict(notes_to_update)
+        card_queues_by_nid_before_import = _card_queues_by_nid([NoteId(note.id) for note in notes_to_update])
 
         self._update_notes(notes_to_update)
         self._create_notes(notes_to_create_by_ah_nid, notes_data=upserted_notes_data)
@@ -427,15 +455,26 @@ class AnkiHubImporter:
         notes = list(notes_to_create_by_ah_nid.values()) + notes_to_update
         self._suspend_cards(
             notes=notes,
-            cards_by_anki_nid_before=cards_by_anki_nid_before_import,
+            card_queues_by_nid_before=card_queues_by_nid_before_import,
             suspend_new_cards_of_new_notes=suspend_new_cards_of_new_notes,
             suspend_new_cards_of_existing_notes=suspend_new_cards_of_existing_notes,
         )
 
         aqt.mw.col.save()
 
-        self._log_note_import_summary()
-        self._log_overwritten_content_summary()
+    def _merge_nids_of_batches(self) -> None:
+        """Removes duplicates from the nid lists which can occur when a note is contained in multiple batches.
+        A note which was created by one batch and updated by a later one is only reported as created."""
+        self._created_nids = list(dict.fromkeys(self._created_nids))
+        created_nids = set(self._created_nids)
+        self._updated_nids = [nid for nid in dict.fromkeys(self._updated_nids) if nid not in created_nids]
+        changed_nids = created_nids | set(self._updated_nids)
+        self._nids_without_changes = [
+            nid for nid in dict.fromkeys(self._nids_without_changes) if nid not in changed_nids
+        ]
+        self._deleted_nids = list(dict.fromkeys(self._deleted_nids))
+        self._marked_as_deleted_nids = list(dict.fromkeys(self._marked_as_deleted_nids))
+        self._skipped_nids = list(dict.fromkeys(self._skipped_nids))
 
     def _reset_note_types_of_notes_based_on_notes_data(self, notes_data: Sequence[NoteInfo]) -> None:
         """Set the note type of notes back to the note type they have in the remote deck if they have a different one"""
@@ -490,20 +529,36 @@ class AnkiHubImporter:
 
     def _prepare_notes(
         self, notes_data: Collection[NoteInfo]
-    ) -> Tuple[Dict[uuid.UUID, Note], List[Note], List[Note], List[Note]]:
+    ) -> Tuple[Dict[uuid.UUID, Note], List[Note], List[Note], List[NoteId]]:
         """Prepare Anki notes for import into Anki DB. Fields and tags are updated according to the
         notes_data. The changes are not committed to the Anki DB yet.
-        Returns a tuple of (notes_to_create_by_ah_nid, notes_to_update, notes_to_delete, notes_without_changes).
+        Returns a tuple of (notes_to_create_by_ah_nid, notes_to_update, notes_to_delete, nids_without_changes).
+
+        The existing notes are loaded from the Anki DB in bulk and compared to the notes_data first. Note objects
+        are only created for notes which will be created, updated or deleted, because creating them is slow and
+        usually only a few notes of a deck change.
         """
+        note_rows_by_nid = self._anki_note_rows_by_nid([NoteId(note_data.anki_nid) for note_data in notes_data])
+
         notes_to_create_by_ah_nid: Dict[uuid.UUID, Note] = {}
         notes_to_update: List[Note] = []
         notes_to_delete: List[Note] = []
-        notes_without_changes: List[Note] = []
+        nids_without_changes: List[NoteId] = []
         for note_data in notes_data:
+            note_row = note_rows_by_nid.get(NoteId(note_data.anki_nid))
+            if (
+                note_row is not None
+                and note_data.last_update_type != SuggestionType.DELETE
+                and not self._anki_note_row_needs_changes(note_row, note_data)
+            ):
+                nids_without_changes.append(note_row.id)
+                continue
+
             note, operation = self._prepare_note(
                 note_data=note_data,
                 protected_fields=self._protected_fields,
                 protected_tags=self._protected_tags,
+                note_exists=note_row is not None,
             )
 
             if operation == NoteOperation.CREATE:
@@ -513,7 +568,7 @@ class AnkiHubImporter:
             elif operation == NoteOperation.DELETE:
                 notes_to_delete.append(note)
             elif operation == NoteOperation.NO_CHANGES:
-                notes_without_changes.append(note)
+                nids_without_changes.append(note.id)
             else:
                 raise ValueError(f"Unknown value for {str(NoteOperation)}")  # pragma: no cover
 
@@ -521,15 +576,66 @@ class AnkiHubImporter:
             notes_to_create_by_ah_nid,
             notes_to_update,
             notes_to_delete,
-            notes_without_changes,
+            nids_without_changes,
+        )
+
+    def _anki_note_rows_by_nid(self, nids: List[NoteId]) -> Dict[NoteId, _AnkiNoteRow]:
+        result: Dict[NoteId, _AnkiNoteRow] = {}
+        for nids_chunk in chunks(nids, DEFAULT_CHUNK_SIZE):
+            for nid, guid, mid, flds, tags in aqt.mw.col.db.execute(
+                f"SELECT id, guid, mid, flds, tags FROM notes WHERE id IN {ids2str(nids_chunk)}"
+            ):
+                result[NoteId(nid)] = _AnkiNoteRow(
+                    id=NoteId(nid),
+                    guid=guid,
+                    mid=NotetypeId(mid),
+                    fields=split_fields(flds),
+                    tags=aqt.mw.col.tags.split(tags),
+                )
+        return result
+
+    def _anki_note_row_needs_changes(self, note_row: _AnkiNoteRow, note_data: NoteInfo) -> bool:
+        """Returns whether preparing the note for the note_data would change it.
+        Does the same checks as _prepare_note_inner, but without loading the note. Returns True when
+        in doubt, because then the note is prepared as usual."""
+        field_names = self._field_names(note_row.mid)
+        if len(field_names) != len(note_row.fields):
+            return True
+
+        if note_row.guid != note_data.guid:
+            return True
+
+        field_values = dict(zip(field_names, note_row.fields))
+        if field_values.get(settings.ANKIHUB_NOTE_TYPE_FIELD_NAME) != str(note_data.ah_nid):
+            return True
+
+        if _changed_fields(
+            field_values,
+            tags=note_row.tags,
+            fields=note_data.fields,
+            protected_fields_for_model=self._protected_fields.get(note_row.mid, []),
+        ):
+            return True
+
+        updated_tags = _updated_tags(
+            cur_tags=note_row.tags, incoming_tags=note_data.tags, protected_tags=self._protected_tags
         )
+        return set(updated_tags) != set(note_row.tags)
+
+    def _field_names(self, mid: NotetypeId) -> List[str]:
+        """Returns the field names of the note type. They are cached for the current import, the note types
+        are not modified while notes are imported."""
+        if (result := self._field_names_by_mid.get(mid)) is None:
+            result = [field["name"] for field in aqt.mw.col.models.get(mid)["flds"]]
+            self._field_names_by_mid[mid] = result
+        return result
 
     def _update_notes(self, notes_to_update: List[Note]) -> None:
         if not notes_to_update:
             return
 
         aqt.mw.col.update_notes(notes_to_update)
-        self._updated_nids = [note.id for note in notes_to_update]
+        self._updated_nids.extend(note.id for note in notes_to_update)
 
     def _create_notes(
         self,
@@ -543,7 +649,7 @@ class AnkiHubImporter:
             notes_to_create_by_ah_nid=notes_to_create_by_ah_nid,
             notes_data=notes_data,
         )
-        self._created_nids = [note.id for note in notes_to_create_by_ah_nid.values()]
+        self._created_nids.extend(note.id for note in notes_to_create_by_ah_nid.values())
 
     def _delete_notes_or_mark_as_deleted(
         self,
@@ -580,18 +686,18 @@ class AnkiHubImporter:
             )
 
     def _delete_notes(self, notes: Collection[Note]) -> None:
-        """Delete notes from the Anki database. Updates the _deleted_nids attribute."""
+        """Delete notes from the Anki database. Adds their ids to the _deleted_nids attribute."""
         if not notes:
             return
 
         nids_to_delete = [note.id for note in notes]
         changes = aqt.mw.col.remove_notes(nids_to_delete)
         LOGGER.info("Deleted notes.", deleted_notes_count=changes.count)
-        self._deleted_nids = nids_to_delete
+        self._deleted_nids.extend(nids_to_delete)
 
     def _mark_notes_as_deleted(self, notes: Collection[Note]) -> None:
         """Add a tag to the notes to mark them as deleted and clear their ankihub_id field.
-        Updates the _marked_as_deleted_nids attribute.
+        Adds their ids to the _marked_as_deleted_nids attribute.
         By clearing their ankihub_id field the "View on AnkiHub" button won't be shown on mobile for these notes.
         """
         if not notes:
@@ -603,35 +709,36 @@ class AnkiHubImporter:
         aqt.mw.col.update_notes(list(notes))
 
         nids = [note.id for note in notes]
-        self._marked_as_deleted_nids = nids
+        self._marked_as_deleted_nids.extend(nids)
 
         LOGGER.info("Marked notes as deleted.", marked_as_deleted_notes_count=len(nids))
 
     def _suspend_cards(
         self,
         notes: Collection[Note],
-        cards_by_anki_nid_before: Dict[NoteId, List[Card]],
+        card_queues_by_nid_before: Dict[NoteId, Dict[CardId, int]],
         suspend_new_cards_of_new_notes: bool,
         suspend_new_cards_of_existing_notes: SuspendNewCardsOfExistingNotes,
     ) -> None:
-        cards_to_suspend: List[Card] = []
+        card_queues_by_nid = _card_queues_by_nid([NoteId(note.id) for note in notes])
+
+        cids_to_suspend: List[CardId] = []
         for note in notes:
-            cards_to_suspend_for_note = self._cards_to_suspend_for_note(
+            cids_to_suspend_for_note = self._cids_to_suspend_for_note(
                 note=note,
-                cards_before_changes=cards_by_anki_nid_before.get(NoteId(note.id), []),
+                card_queues=card_queues_by_nid.get(NoteId(note.id), {}),
+                card_queues_before_changes=card_queues_by_nid_before.get(NoteId(note.id), {}),
                 suspend_new_cards_of_new_notes=suspend_new_cards_of_new_notes,
                 suspend_new_cards_of_existing_notes=suspend_new_cards_of_existing_notes,
             )
-            cards_to_suspend.extend(cards_to_suspend_for_note)
-
-        for card in cards_to_suspend:
-            card.queue = QUEUE_TYPE_SUSPENDED
+            cids_to_suspend.extend(cids_to_suspend_for_note)
 
-        aqt.mw.col.update_cards(cards_to_suspend)
+        if cids_to_suspend:
+            aqt.mw.col.sched.suspend_cards(cids_to_suspend)
 
         LOGGER.info(
             "Suspended cards.",
-            suspended_cards_count=len(cards_to_suspend),
+            suspended_cards_count=len(cids_to_suspend),
         )
 
     def _create_notes_inner(
@@ -760,13 +867,17 @@ class AnkiHubImporter:
         common_ancestor_did = lowest_level_common_ancestor_did(dids_without_created)
         return common_ancestor_did
 
-    def _cards_to_suspend_for_note(
+    def _cids_to_suspend_for_note(
         self,
         note: Note,
-        cards_before_changes: Collection[Card],
+        card_queues: Dict[CardId, int],
+        card_queues_before_changes: Dict[CardId, int],
         suspend_new_cards_of_new_notes: bool,
         suspend_new_cards_of_existing_notes: SuspendNewCardsOfExistingNotes,
-    ) -> Collection[Card]:
+    ) -> Collection[CardId]:
+        """Returns the ids of the cards of the note which should be suspended.
+        card_queues and card_queues_before_changes map the card ids of the note to the queues of the cards
+        after and before the import."""
         if is_tag_in_list(TAG_FOR_INSTRUCTION_NOTES, note.tags):
             return []
 
@@ -775,20 +886,19 @@ class AnkiHubImporter:
         ):
             return []
 
-        def new_cards() -> List[Card]:
-            cids_before_changes = {c.id for c in cards_before_changes}
-            result = [c for c in note.cards() if c.id not in cids_before_changes]
+        def new_cids() -> List[CardId]:
+            result = [cid for cid in card_queues if cid not in card_queues_before_changes]
             return result
 
-        if cards_before_changes:
+        if card_queues_before_changes:
             # If there were cards before the changes, the note already existed in Anki.
             if suspend_new_cards_of_existing_notes == SuspendNewCardsOfExistingNotes.NEVER:
                 return []
             elif suspend_new_cards_of_existing_notes == SuspendNewCardsOfExistingNotes.ALWAYS:
-                return new_cards()
+                return new_cids()
             elif suspend_new_cards_of_existing_notes == SuspendNewCardsOfExistingNotes.IF_SIBLINGS_SUSPENDED:
-                if all(card.queue == QUEUE_TYPE_SUSPENDED for card in cards_before_changes):
-                    return new_cards()
+                if all(queue == QUEUE_TYPE_SUSPENDED for queue in card_queues_before_changes.values()):
+                    return new_cids()
                 else:
                     return []
             else:
@@ -796,7 +906,7 @@ class AnkiHubImporter:
         else:
             # If there were no cards before the changes, the note didn't exist in Anki before.
             if suspend_new_cards_of_new_notes:
-                return new_cards()
+                return new_cids()
             else:
                 return []
 
@@ -805,16 +915,15 @@ class AnkiHubImporter:
         note_data: NoteInfo,
         protected_fields: Dict[int, List[str]],
         protected_tags: List[str],
+        note_exists: bool,
     ) -> Tuple[Note, NoteOperation]:
         """Gets or creates a note and prepares it for import into Anki DB. Returns the note and the operation that
         should be performed on it."""
-        try:
+        if note_exists:
             note = aqt.mw.col.get_note(id=NoteId(note_data.anki_nid))
-            note_exists = True
-        except NotFoundError:
+        else:
             note_type = aqt.mw.col.models.get(NotetypeId(note_data.mid))
             note = aqt.mw.col.new_note(note_type)
-            note_exists = False
 
         if note_data.last_update_type == SuggestionType.DELETE:
             operation = NoteOperation.DELETE
@@ -888,33 +997,18 @@ class AnkiHubImporter:
         fields: List[Field],
         protected_fields: Dict[int, List[str]],
     ) -> bool:
-        if is_tag_in_list(TAG_FOR_PROTECTING_ALL_FIELDS, note.tags):
-            return False
-
-        changed = False
-        fields_protected_by_tags = get_fields_protected_by_tags(note)
-        protected_fields_for_model = protected_fields.get(aqt.mw.col.models.get(note.mid)["id"], [])
-
-        for field_name in note.keys():
-            if field_name == settings.ANKIHUB_NOTE_TYPE_FIELD_NAME:
-                continue
-            field = next(
-                (f for f in fields if f.name == field_name),
-                Field(name=field_name, value=""),
-            )
-            if field.name in protected_fields_for_model:
-                continue
-
-            if field.name in fields_protected_by_tags:
-                continue
-
-            current_value = note[field.name]
-            if current_value != field.value:
-                if current_value:
-                    self._record_field_overwrite(note, field, protects_any_field=bool(protected_fields_for_model))
-                note[field.name] = field.value
-                changed = True
-        return changed
+        protected_fields_for_model = protected_fields.get(note.mid, [])
+        changed_fields = _changed_fields(
+            dict(note.items()),
+            tags=note.tags,
+            fields=fields,
+            protected_fields_for_model=protected_fields_for_model,
+        )
+        for field in changed_fields:
+            if note[field.name]:
+                self._record_field_overwrite(note, field, protects_any_field=bool(protected_fields_for_model))
+            note[field.name] = field.value
+        return bool(changed_fields)
 
     def _record_field_overwrite(self, note: Note, field: Field, protects_any_field: bool) -> None:
         """Notes that a prepared change replaces existing local content in a field.
@@ -963,6 +1057,13 @@ class AnkiHubImporter:
             self._removed_tags.record(tag, nid)
 
 
+def _last_occurrences_of_notes(notes_data: Sequence[NoteInfo]) -> List[NoteInfo]:
+    """Returns the notes data without the earlier occurrences of notes which occur multiple times.
+    Otherwise the media references and tags of an earlier occurrence would be kept for the note."""
+    notes_data_by_ah_nid = {note_data.ah_nid: note_data for note_data in notes_data}
+    return list(notes_data_by_ah_nid.values())
+
+
 def _adjust_deck(deck_name: str, local_did: Optional[DeckId] = None) -> DeckId:
     unique_name = get_unique_ankihub_deck_name(deck_name)
     if local_did is None:
@@ -976,6 +1077,36 @@ def _adjust_deck(deck_name: str, local_did: Optional[DeckId] = None) -> DeckId:
     return local_did
 
 
+def _changed_fields(
+    field_values: Dict[str, str],
+    tags: List[str],
+    fields: List[Field],
+    protected_fields_for_model: List[str],
+) -> List[Field]:
+    """Returns the incoming fields whose values differ from the current field_values of a note.
+    The AnkiHub ID field and fields which are protected by the deck settings or by tags of the note are excluded.
+    Fields of the note which are missing from the incoming fields are compared to an empty value."""
+    if is_tag_in_list(TAG_FOR_PROTECTING_ALL_FIELDS, tags):
+        return []
+
+    # The first field with a given name takes precedence
+    fields_by_name = {field.name: field for field in reversed(fields)}
+    protected_fields_from_tags = fields_protected_by_tags(tags, list(field_values.keys()))
+
+    result = []
+    for field_name, current_value in field_values.items():
+        if field_name == settings.ANKIHUB_NOTE_TYPE_FIELD_NAME:
+            continue
+
+        if field_name in protected_fields_for_model or field_name in protected_fields_from_tags:
+            continue
+
+        field = fields_by_name.get(field_name, Field(name=field_name, value=""))
+        if current_value != field.value:
+            result.append(field)
+    return result
+
+
 def _updated_tags(cur_tags: List[str], incoming_tags: List[str], protected_tags: List[str]) -> List[str]:
     # get subset of cur_tags that are protected
     # by being equal to a protected tag or by containing a protected tag
@@ -1052,8 +1183,12 @@ def _adjust_fields(cur_model_fields: List[Dict], new_model_fields: List[Dict]) -
     return final_fields
 
 
-def cards_by_anki_nid_dict(notes: List[Note]) -> Dict[NoteId, List[Card]]:
-    result = {}
-    for note in notes:
-        result[NoteId(note.id)] = note.cards()
+def _card_queues_by_nid(nids: List[NoteId]) -> Dict[NoteId, Dict[CardId, int]]:
+    """Returns the queues of the cards of the notes with the given ids, grouped by note id."""
+    result: Dict[NoteId, Dict[CardId, int]] = {}
+    for nids_chunk in chunks(nids, DEFAULT_CHUNK_SIZE):
+        for nid, cid, queue in aqt.mw.col.db.execute(
+            f"SELECT nid, id, queue FROM cards WHERE nid IN {ids2str(nids_chunk)}"
+        ):
+            result.setdefault(NoteId(nid), {})[CardId(cid)] = queue
     return result
@@ -1,14 +1,37 @@
 """Performant functions for working with media in Anki"""
 
+import re
+from typing import Collection, Dict
+
 import aqt
+from anki.utils import ids2str
+
+from ..db.db import DEFAULT_CHUNK_SIZE, chunks
+
+
+def replace_media_names_in_fields_of_notes(media_name_map: Dict[str, str], nids: Collection[int]) -> None:
+    """Replaces references to the media files in the keys of the map with references to the media files
+    in the values of the map, in the fields of the notes with the given ids.
+    The notes are read and written in a single pass and only notes which change are written."""
+    if not media_name_map or not nids:
+        return
+
+    replacements: Dict[str, str] = {}
+    for old_name, new_name in media_name_map.items():
+        replacements[f'src="{old_name}"'] = f'src="{new_name}"'
+        replacements[f"src='{old_name}'"] = f"src='{new_name}'"
+        replacements[f"[sound:{old_name}]"] = f"[sound:{new_name}]"
+
+    pattern = re.compile("|".join(re.escape(old) for old in replacements))
 
+    for nids_chunk in chunks(list(nids), DEFAULT_CHUNK_SIZE):
+        updated_flds_and_nids = []
+        for nid, flds in aqt.mw.col.db.execute(f"SELECT id, flds FROM notes WHERE id IN {ids2str(nids_chunk)}"):
+            new_flds = pattern.sub(lambda match: replacements[match.group(0)], flds)
+            if new_flds != flds:
+                updated_flds_and_nids.append((new_flds, nid))
 
-def find_and_replace_text_in_fields_on_all_notes(old: str, new: str) -> None:
-    # Used to rename media across all notes in the collection.
+        if updated_flds_and_nids:
+            aqt.mw.col.db.executemany("UPDATE notes SET flds = ? WHERE id = ?", updated_flds_and_nids)
 
-    aqt.mw.col.db.execute(
-        "UPDATE notes SET flds = REPLACE(flds, ?, ?)",
-        old,
-        new,
-    )
     aqt.mw.col.save()
@@ -63,11 +63,11 @@ def optional_tag_prefix_for_group(group_name: str) -> str:
 
 
 def get_fields_protected_by_tags(note: Note) -> List[str]:
-    result = _get_fields_protected_by_tags(note.tags, note.keys())
+    result = fields_protected_by_tags(note.tags, note.keys())
     return result
 
 
-def _get_fields_protected_by_tags(tags: List[str], field_names: List[str]) -> List[str]:
+def fields_protected_by_tags(tags: List[str], field_names: List[str]) -> List[str]:
     if is_tag_in_list(TAG_FOR_PROTECTING_ALL_FIELDS, tags):
         return [field_name for field_name in field_names if field_name != settings.ANKIHUB_NOTE_TYPE_FIELD_NAME]
 
@@ -1,4 +1,5 @@
-from typing import Dict, List, Optional
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
 
 import aqt
 from anki.notes import NoteId
@@ -7,8 +8,13 @@ from anki.utils import ids2str
 from ..addon_ankihub_client import AddonAnkiHubClient as AnkiHubClient
 from ..ankihub_client import OptionalTagSuggestion, TagGroupValidationResponse
 from ..db import ankihub_db
+from ..db.db import execute_list_query_in_chunks
 from ..settings import config
-from .note_conversion import TAG_FOR_OPTIONAL_TAGS, is_optional_tag, is_tag_for_group
+from .note_conversion import TAG_FOR_OPTIONAL_TAGS, is_optional_tag
+from .utils import batched
+
+# How many optional tag suggestions are sent to AnkiHub in one request
+OPTIONAL_TAG_SUGGESTIONS_PAGE_SIZE = 2000
 
 
 class OptionalTagsSuggestionHelper:
@@ -26,6 +32,7 @@ class OptionalTagsSuggestionHelper:
         self._ankihub_did = ankihub_dids[0]
 
         self._optional_tags_by_nid = self._optional_tags_by_nid_dict()
+        self._optional_tags_by_tag_group_by_nid = self._optional_tags_by_tag_group_dict()
 
         self._tag_group_names_from_tags = self._extract_optional_tag_group_names(self._optional_tags_by_nid)
         deck_extensions_ids_for_deck = config.deck_extensions_ids_for_ah_did(self._ankihub_did)
@@ -63,40 +70,52 @@ class OptionalTagsSuggestionHelper:
         }
         return result
 
-    def suggest_tags_for_groups(self, tag_groups: List[str], auto_accept: bool) -> None:
+    def suggest_tags_for_groups(
+        self,
+        tag_groups: List[str],
+        auto_accept: bool,
+        progress_cb: Optional[Callable[[int, int], None]] = None,
+    ) -> None:
         """Suggest optional tags for the given tag groups.
         self.prevalidate_tag_groups() needs to be called before this method to validate the tag groups.
+        The suggestions are sent in pages, progress_cb is called with the number of suggestions that were sent
+        and the total number of suggestions after each page.
         """
         assert self._valid_tag_group_names is not None
         assert set(tag_groups).issubset(set(self._valid_tag_group_names))
 
-        suggestions: List[OptionalTagSuggestion] = []
-
-        for tag_group in tag_groups:
-            for nid in self._nids:
-                optional_tags_for_nid = self._optional_tags_by_nid.get(nid, [])
-                tags_for_group = [tag for tag in optional_tags_for_nid if is_tag_for_group(tag, tag_group)]
-
-                suggestions.append(
-                    OptionalTagSuggestion(
-                        tag_group_name=tag_group,
-                        deck_extension_id=self._extension_id_by_tag_group_name[tag_group],
-                        ah_nid=ankihub_db.ankihub_nid_for_anki_nid(nid),
-                        tags=tags_for_group,
-                    ),
-                )
+        ah_nid_by_anki_nid = ankihub_db.anki_nids_to_ankihub_nids(self._nids)
+        suggestions = (
+            OptionalTagSuggestion(
+                tag_group_name=tag_group,
+                deck_extension_id=self._extension_id_by_tag_group_name[tag_group],
+                ah_nid=ah_nid_by_anki_nid[nid],
+                tags=self._optional_tags_by_tag_group_by_nid.get(nid, {}).get(_tag_group_key(tag_group), []),
+            )
+            for tag_group in tag_groups
+            for nid in self._nids
+        )
+        suggestions_count = len(tag_groups) * len(self._nids)
 
         client = AnkiHubClient()
-        client.suggest_optional_tags(
-            suggestions=suggestions,
-            auto_accept=auto_accept,
-        )
+        suggestions_sent = 0
+        for suggestions_page in batched(suggestions, OPTIONAL_TAG_SUGGESTIONS_PAGE_SIZE):
+            client.suggest_optional_tags(
+                suggestions=suggestions_page,
+                auto_accept=auto_accept,
+            )
+            suggestions_sent += len(suggestions_page)
+            if progress_cb:
+                progress_cb(suggestions_sent, suggestions_count)
 
     def _optional_tags_by_nid_dict(self) -> Dict[NoteId, List[str]]:
         """Returns a dict mapping note ids to a list of optional tags for that note."""
-        nid_tags_string_tuples = aqt.mw.col.db.all(
-            f"SELECT DISTINCT id, tags FROM NOTES WHERE id IN {ids2str(self._nids)} "
-            f"AND tags LIKE '%{TAG_FOR_OPTIONAL_TAGS}%'"
+        nid_tags_string_tuples = execute_list_query_in_chunks(
+            lambda nids: aqt.mw.col.db.all(
+                f"SELECT DISTINCT id, tags FROM NOTES WHERE id IN {ids2str(nids)} "
+                f"AND tags LIKE '%{TAG_FOR_OPTIONAL_TAGS}%'"
+            ),
+            ids=self._nids,
         )
 
         result = {}
@@ -113,6 +132,17 @@ class OptionalTagsSuggestionHelper:
 
         return result
 
+    def _optional_tags_by_tag_group_dict(self) -> Dict[NoteId, Dict[str, List[str]]]:
+        """Returns a dict mapping note ids to dicts which map tag group keys (see _tag_group_key)
+        to the optional tags of the note for that tag group."""
+        result: Dict[NoteId, Dict[str, List[str]]] = {}
+        for nid, optional_tags in self._optional_tags_by_nid.items():
+            optional_tags_by_tag_group: Dict[str, List[str]] = defaultdict(list)
+            for tag in optional_tags:
+                optional_tags_by_tag_group[_tag_group_key(self._optional_tag_to_tag_group(tag))].append(tag)
+            result[nid] = dict(optional_tags_by_tag_group)
+        return result
+
     def _extract_optional_tag_group_names(self, optional_tags_by_nid: Dict[NoteId, List[str]]) -> List[str]:
         """Extracts the tag group names from the optional tags of the given notes."""
         result = set()
@@ -125,3 +155,9 @@ class OptionalTagsSuggestionHelper:
     def _optional_tag_to_tag_group(self, optional_tag: str) -> str:
         """Extracts the tag group name from the given optional tag."""
         return optional_tag.split("::", maxsplit=2)[1]
+
+
+def _tag_group_key(tag_group_name: str) -> str:
+    # Spaces in tag group names are replaced with underscores in optional tags, see optional_tag_prefix_for_group.
+    # Tags are case-insensitive, so the tag group names of optional tags are as well.
+    return tag_group_name.replace(" ", "_").lower()
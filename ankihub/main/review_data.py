@@ -1,7 +1,8 @@
 import uuid
 from collections import defaultdict
+from dataclasses import dataclass
 from datetime import date, datetime, timedelta
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import aqt
 from anki import consts as anki_consts
@@ -10,7 +11,8 @@ from .. import LOGGER
 from ..addon_ankihub_client import AddonAnkiHubClient as AnkiHubClient
 from ..ankihub_client import CardReviewData
 from ..ankihub_client.models import DailyCardReviewSummary
-from ..db import ankihub_db
+from ..db import NOTE_NOT_DELETED_CONDITION, ankihub_rows_json, ankihub_rows_table
+from ..db.models import AnkiHubNote
 from ..settings import config, get_end_cutoff_date_for_sending_review_summaries
 
 
@@ -20,23 +22,23 @@ def send_review_data() -> None:
     LOGGER.info("Sending review data to AnkiHub...")
 
     now = datetime.now()
+    review_stats_by_ah_did = _get_review_stats_by_ah_did(
+        since_times=[now - timedelta(days=7), now - timedelta(days=30)],
+    )
     card_review_data: List[CardReviewData] = []
     for ah_did in config.deck_ids():
-        first_and_last_review_times = _get_first_and_last_review_datetime_for_ah_deck(ah_did)
-        if first_and_last_review_times is None:
+        if (review_stats := review_stats_by_ah_did.get(ah_did)) is None:
             # This deck has no reviews yet
             continue
 
-        first_review_at, last_review_at = first_and_last_review_times
-        total_card_reviews_last_7_days = _get_review_count_for_ah_deck_since(ah_did, now - timedelta(days=7))
-        total_card_reviews_last_30_days = _get_review_count_for_ah_deck_since(ah_did, now - timedelta(days=30))
+        total_card_reviews_last_7_days, total_card_reviews_last_30_days = review_stats.review_counts_since
         card_review_data.append(
             CardReviewData(
                 ah_did=ah_did,
                 total_card_reviews_last_7_days=total_card_reviews_last_7_days,
                 total_card_reviews_last_30_days=total_card_reviews_last_30_days,
-                first_card_review_at=first_review_at,
-                last_card_review_at=last_review_at,
+                first_card_review_at=review_stats.first_review_at,
+                last_card_review_at=review_stats.last_review_at,
             )
         )
 
@@ -44,45 +46,68 @@ def send_review_data() -> None:
     client.send_card_review_data(card_review_data)
 
 
-def _get_review_count_for_ah_deck_since(ah_did: uuid.UUID, since: datetime) -> int:
-    """Get the number of reviews (recorded in Anki's review log table) for an ankihub deck since a given time."""
-    timestamp_ms = int(datetime.timestamp(since) * 1000)
-    anki_nids = ankihub_db.anki_nids_for_ankihub_deck(ah_did)
-    result = aqt.mw.col.db.scalar(
+@dataclass(frozen=True)
+class _ReviewStats:
+    first_review_at: datetime
+    last_review_at: datetime
+    # The number of reviews after each of the since_times passed to _get_review_stats_by_ah_did, in the same order
+    review_counts_since: List[int]
+
+
+def _get_review_stats_by_ah_did(
+    since_times: Sequence[datetime], ah_did: Optional[uuid.UUID] = None
+) -> Dict[uuid.UUID, _ReviewStats]:
+    """Get statistics about the reviews (recorded in Anki's review log table) of the notes of all AnkiHub decks
+    (or only of the given deck) with a single query. Decks without reviews are not included in the result.
+
+    The AnkiHub DB entries of the notes are passed to the query as a table, so that the review log can be grouped
+    by the AnkiHub deck of the notes, instead of querying the review log once per deck."""
+    counts_sql = "".join(f", SUM(r.id > {_datetime_to_ms_timestamp(since)})" for since in since_times)
+    fields = (AnkiHubNote.anki_note_id, AnkiHubNote.ankihub_deck_id)
+    ah_notes_query = AnkiHubNote.select(*fields).filter(NOTE_NOT_DELETED_CONDITION)
+    if ah_did is not None:
+        ah_notes_query = ah_notes_query.filter(ankihub_deck_id=ah_did)
+    rows = aqt.mw.col.db.all(
         f"""
-        SELECT COUNT(*)
-        FROM revlog as r
-        JOIN cards as c ON r.cid = c.id
-        WHERE r.id > ?
-            AND r.type != {anki_consts.REVLOG_RESCHED}
-            AND c.nid IN ({",".join(map(str, anki_nids))})
+        SELECT ah_notes.ankihub_deck_id, MIN(r.id), MAX(r.id){counts_sql}
+        FROM {ankihub_rows_table(fields)} AS ah_notes
+        JOIN cards AS c ON c.nid = ah_notes.anki_note_id
+        JOIN revlog AS r ON r.cid = c.id
+        WHERE r.type != {anki_consts.REVLOG_RESCHED}
+        GROUP BY ah_notes.ankihub_deck_id
         """,
-        timestamp_ms,
+        ankihub_rows_json(ah_notes_query.tuples()),
     )
-    return result
+
+    return {
+        uuid.UUID(row_ah_did): _ReviewStats(
+            first_review_at=_ms_timestamp_to_datetime(int(first_timestamp)),
+            last_review_at=_ms_timestamp_to_datetime(int(last_timestamp)),
+            review_counts_since=[int(count) for count in counts],
+        )
+        for row_ah_did, first_timestamp, last_timestamp, *counts in rows
+    }
+
+
+def _get_review_count_for_ah_deck_since(ah_did: uuid.UUID, since: datetime) -> int:
+    """Get the number of reviews (recorded in Anki's review log table) for an ankihub deck since a given time."""
+    review_stats = _get_review_stats_by_ah_did(since_times=[since], ah_did=ah_did).get(ah_did)
+    return review_stats.review_counts_since[0] if review_stats else 0
 
 
 def _get_first_and_last_review_datetime_for_ah_deck(
     ah_did: uuid.UUID,
 ) -> Optional[Tuple[datetime, datetime]]:
     """Get the date time of the first and last review (recorded in Anki's review log table) for an ankihub deck."""
-    anki_nids = ankihub_db.anki_nids_for_ankihub_deck(ah_did)
-    row = aqt.mw.col.db.first(
-        f"""
-        SELECT MIN(r.id), MAX(r.id)
-        FROM revlog as r
-        JOIN cards as c ON r.cid = c.id
-        WHERE r.type != {anki_consts.REVLOG_RESCHED}
-            AND c.nid IN ({",".join(map(str, anki_nids))})
-        """,
-    )
-    if row[0] is None:
+    review_stats = _get_review_stats_by_ah_did(since_times=[], ah_did=ah_did).get(ah_did)
+    if review_stats is None:
         return None
 
-    first_timestamp_str, last_timestamp_str = row
-    first_review_datetime = _ms_timestamp_to_datetime(int(first_timestamp_str))
-    last_review_datetime = _ms_timestamp_to_datetime(int(last_timestamp_str))
-    return first_review_datetime, last_review_datetime
+    return review_stats.first_review_at, review_stats.last_review_at
+
+
+def _datetime_to_ms_timestamp(value: datetime) -> int:
+    return int(datetime.timestamp(value) * 1000)
 
 
 def _ms_timestamp_to_datetime(timestamp: int) -> datetime:
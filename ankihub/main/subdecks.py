@@ -17,8 +17,7 @@ from anki.utils import ids2str
 
 from .. import LOGGER
 from ..db import ankihub_db
-from ..db.db import NOTE_NOT_DELETED_CONDITION
-from ..db.models import AnkiHubNote
+from ..db.models import NoteTag
 from ..settings import config
 from .block_exam_subdecks import get_exam_subdecks
 from .utils import move_notes_to_decks_while_respecting_odid, nids_in_deck_but_not_in_subdeck, note_ids_in_decks
@@ -29,10 +28,9 @@ SUBDECK_TAG = "AnkiHub_Subdeck"
 
 def deck_contains_subdeck_tags(ah_did: uuid.UUID) -> bool:
     """Return whether the given deck contains any notes which have subdeck tags in the AnkiHub database."""
-    return AnkiHubNote.filter(
-        NOTE_NOT_DELETED_CONDITION,
+    return NoteTag.filter(
         ankihub_deck_id=ah_did,
-        tags__ilike=f"%{SUBDECK_TAG}::%::%",
+        tag__ilike=f"{SUBDECK_TAG}::%::%",
     ).exists()
 
 
@@ -50,8 +50,8 @@ from ..db.db import execute_list_query_in_chunks
 from ..db.models import AnkiHubNote
 from ..settings import config
 from .exporting import to_note_data
-from .media_utils import find_and_replace_text_in_fields_on_all_notes
-from .utils import get_anki_nid_to_mid_dict, is_tag_in_list, md5_file_hash
+from .media_utils import replace_media_names_in_fields_of_notes
+from .utils import get_anki_nid_to_mid_dict, is_tag_in_list
 
 # The Fields-to-Suggest selector and the auto-protect-on-edit hook share this
 # flag — auto-protect's silent tagging only makes sense if the dialog surfaces
@@ -864,9 +864,7 @@ def _rename_and_upload_media_for_suggestions(
     Returns suggestion with updated media names."""
 
     client = AnkiHubClient()
-    original_notes_data = [
-        note_info for suggestion in suggestions if (note_info := ankihub_db.note_data(NoteId(suggestion.anki_nid)))
-    ]
+    original_notes_data = ankihub_db.notes_data_for_anki_nids([NoteId(s.anki_nid) for s in suggestions])
     original_media_names: Set[str] = get_media_names_from_notes_data(
         original_notes_data, lambda mid: ankihub_db.note_type_dict(NotetypeId(mid))
     )
@@ -919,7 +917,7 @@ def _rename_and_upload_media_for_suggestions(
         for suggestion in suggestions:
             _replace_media_names_in_suggestion(suggestion, media_name_map)
 
-        _update_media_names_on_notes(media_name_map)
+        _update_media_names_on_notes(media_name_map, anki_nids=[NoteId(s.anki_nid) for s in suggestions])
 
     return suggestions
 
@@ -935,7 +933,12 @@ def _handle_media_with_matching_hashes(
     we create it by copying the referenced media file to prevent broken media references.
     """
     media_dir = Path(aqt.mw.col.media.dir())
-    media_to_hash_dict = {media_name: md5_file_hash(media_dir / media_name) for media_name in media_names}
+    # The hashes of all files are looked up at once, most of them are cached in the AnkiHub DB
+    media_file_hashes = ankihub_db.media_file_hashes([media_dir / media_name for media_name in media_names])
+    missing_media_names = [media_name for media_name in media_names if media_dir / media_name not in media_file_hashes]
+    if missing_media_names:
+        raise FileNotFoundError(f"Media files not found: {missing_media_names}")
+    media_to_hash_dict = {media_name: media_file_hashes[media_dir / media_name] for media_name in media_names}
 
     media_with_same_hash_dict = ankihub_db.media_names_with_matching_hashes(
         ah_did=ah_did, media_to_hash=media_to_hash_dict
@@ -946,7 +949,7 @@ def _handle_media_with_matching_hashes(
     for suggestion in suggestions:
         _replace_media_names_in_suggestion(suggestion, media_with_same_hash_dict)
 
-    _update_media_names_on_notes(media_with_same_hash_dict)
+    _update_media_names_on_notes(media_with_same_hash_dict, anki_nids=[NoteId(s.anki_nid) for s in suggestions])
 
     # If the file with the matching hash is not in the Anki collection,
     # we create it by copying the referenced media file.
@@ -977,8 +980,7 @@ def _field_with_replaced_media_names(field: Field, media_name_map: Dict[str, str
     return result
 
 
-def _update_media_names_on_notes(media_name_map: Dict[str, str]):
-    for original_filename, new_filename in media_name_map.items():
-        find_and_replace_text_in_fields_on_all_notes(f'src="{original_filename}"', f'src="{new_filename}"')
-        find_and_replace_text_in_fields_on_all_notes(f"src='{original_filename}'", f"src='{new_filename}'")
-        find_and_replace_text_in_fields_on_all_notes(f"[sound:{original_filename}]", f"[sound:{new_filename}]")
+def _update_media_names_on_notes(media_name_map: Dict[str, str], anki_nids: Collection[NoteId]):
+    # Only the notes of the suggestions are updated. The media files are copied to the new names, so the original
+    # files still exist for other notes which reference them.
+    replace_media_names_in_fields_of_notes(media_name_map, anki_nids)
@@ -1,5 +1,5 @@
 import copy
-import hashlib
+import itertools
 import re
 import time
 from collections import defaultdict
@@ -7,10 +7,11 @@ from concurrent.futures import Future
 from dataclasses import dataclass
 from pathlib import Path
 from textwrap import dedent
-from typing import Any, Collection, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+from typing import Any, Collection, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, TypeVar, Union
 from uuid import UUID
 
 import aqt
+from anki.cards import CardId
 from anki.collection import EmptyCardsReport
 from anki.decks import DeckDict, DeckId
 from anki.models import ChangeNotetypeRequest, NoteType, NotetypeDict, NotetypeId
@@ -20,6 +21,7 @@ from aqt.emptycards import EmptyCardsDialog
 
 from .. import LOGGER, settings
 from ..db import ankihub_db
+from ..db.db import DEFAULT_CHUNK_SIZE, chunks
 from ..settings import (
     ANKI_INT_VERSION,
     ANKI_VERSION_23_10_00,
@@ -269,18 +271,39 @@ def move_notes_to_decks_while_respecting_odid(nid_to_did: Dict[NoteId, DeckId])
     """Moves the cards of notes to the decks specified in nid_to_did.
     If a card is in a filtered deck it is not moved and only its original deck id value gets changed.
     """
-    cards_to_update = []
-    for nid, did in nid_to_did.items():
-        # This is a bit faster than aqt.mw.col.get_note(nid).cards() to get the cards of a note.
-        cids = aqt.mw.col.db.list(f"SELECT id FROM cards WHERE nid={nid}")
-        cards = [aqt.mw.col.get_card(cid) for cid in cids]
-        for card in cards:
-            if card.odid == 0:
-                card.did = did
-            else:
-                card.odid = did
-            cards_to_update.append(card)
-    aqt.mw.col.update_cards(cards_to_update)
+    cids_by_did: Dict[DeckId, List[CardId]] = defaultdict(list)
+    cids_in_filtered_decks_by_did: Dict[DeckId, List[CardId]] = defaultdict(list)
+    for nids_chunk in chunks(list(nid_to_did.keys()), DEFAULT_CHUNK_SIZE):
+        for cid, nid, did, odid in aqt.mw.col.db.execute(
+            f"SELECT id, nid, did, odid FROM cards WHERE nid IN {ids2str(nids_chunk)}"
+        ):
+            target_did = nid_to_did[NoteId(nid)]
+            if odid == 0:
+                if did != target_did:
+                    cids_by_did[target_did].append(CardId(cid))
+            elif odid != target_did:
+                cids_in_filtered_decks_by_did[target_did].append(CardId(cid))
+
+    # Moving cards with set_deck updates their modification time and usn, so that the changes are synced.
+    for did, cids in cids_by_did.items():
+        aqt.mw.col.set_deck(cids, did)
+
+    # set_deck would remove cards from filtered decks, so only the original deck ids of these cards are changed.
+    # Cards are rarely in filtered decks, so it's fine to load them individually.
+    cards_in_filtered_decks = []
+    for did, cids in cids_in_filtered_decks_by_did.items():
+        for cid in cids:
+            card = aqt.mw.col.get_card(cid)
+            card.odid = did
+            cards_in_filtered_decks.append(card)
+    if cards_in_filtered_decks:
+        aqt.mw.col.update_cards(cards_in_filtered_decks)
+
+    LOGGER.info(
+        "Moved cards of notes to decks.",
+        moved_cards_count=sum(len(cids) for cids in cids_by_did.values()),
+        cards_in_filtered_decks_count=len(cards_in_filtered_decks),
+    )
 
 
 # cards
@@ -346,15 +369,22 @@ def change_note_types_of_notes(
 ) -> None:
     """Changes the note type of notes based on provided pairs of note id and target note type id."""
 
-    # Group notes by source and target note type
-    notes_grouped_by_type_change: Dict[Tuple[NotetypeId, NotetypeId], List[NoteId]] = defaultdict(list)
+    nids_by_target_mid: Dict[NotetypeId, List[NoteId]] = defaultdict(list)
     for nid, mid in nid_mid_pairs:
-        current_mid = aqt.mw.col.db.scalar(f"SELECT mid FROM notes WHERE id={nid}")
-        if current_mid is None:
-            continue
+        nids_by_target_mid[mid].append(nid)
 
-        if current_mid != mid:
-            notes_grouped_by_type_change[(current_mid, mid)].append(nid)
+    # Group notes by source and target note type.
+    # Only notes with a different note type are returned by the query, notes that don't exist are ignored.
+    notes_grouped_by_type_change: Dict[Tuple[NotetypeId, NotetypeId], List[NoteId]] = defaultdict(list)
+    for target_mid, nids in nids_by_target_mid.items():
+        for nids_chunk in chunks(nids, DEFAULT_CHUNK_SIZE):
+            for nid, current_mid in aqt.mw.col.db.execute(
+                f"SELECT id, mid FROM notes WHERE id IN {ids2str(nids_chunk)} AND mid != {target_mid}"
+            ):
+                notes_grouped_by_type_change[(NotetypeId(current_mid), target_mid)].append(NoteId(nid))
+
+    if not notes_grouped_by_type_change:
+        return
 
     if raise_if_full_sync_required and notes_grouped_by_type_change:
         affected_note_type_ids = set(
@@ -452,11 +482,29 @@ def _modify_fields(note_type: Dict) -> None:
 def modify_note_type_templates(note_type_ids: Iterable[NotetypeId]) -> None:
     for mid in note_type_ids:
         note_type = aqt.mw.col.models.get(mid)
-        note_type = note_type_with_updated_templates_and_css(
+        update_note_type_templates_and_css(
             old_note_type=note_type,
             new_note_type=None,
         )
-        aqt.mw.col.models.update_dict(note_type)
+
+
+def update_note_type_templates_and_css(
+    old_note_type: NotetypeDict,
+    new_note_type: Optional[NotetypeDict],
+) -> bool:
+    """Saves the note type with the templates and css returned by note_type_with_updated_templates_and_css.
+    The note type is only saved if its templates or css change, because saving a note type is slow for
+    note types with many cards and changes its modification time, which causes it to be synced with AnkiWeb.
+    Returns whether the note type was saved."""
+    updated_note_type = note_type_with_updated_templates_and_css(
+        old_note_type=old_note_type,
+        new_note_type=new_note_type,
+    )
+    if updated_note_type["tmpls"] == old_note_type["tmpls"] and updated_note_type["css"] == old_note_type["css"]:
+        return False
+
+    aqt.mw.col.models.update_dict(updated_note_type)
+    return True
 
 
 def _template_side_with_ankihub_modifications(
@@ -780,17 +828,28 @@ def _create_backup_anki_50() -> bool:
     return created
 
 
+T = TypeVar("T")
+
+
+def batched(items: Iterable[T], batch_size: int) -> Iterator[List[T]]:
+    """Yield lists of up to batch_size items from the items. The items are consumed lazily."""
+    iterator = iter(items)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        yield batch
+
+
 def truncated_list(values: List[Any], limit: int = 10) -> List[Any]:
     assert limit > 0
     return values[:limit] + ["..."] if len(values) > limit else values
 
 
 def md5_file_hash(media_path: Path) -> str:
-    """Return the md5 hash of the file content of the given media file."""
-    with media_path.open("rb") as media_file:
-        file_content_hash = hashlib.md5(media_file.read())
-    result = file_content_hash.hexdigest()
-    return result
+    """Return the md5 hash of the file content of the given media file.
+    The hash is cached in the AnkiHub DB, the file is only read if it changed since it was last hashed."""
+    file_content_hash = ankihub_db.media_file_hashes([media_path]).get(media_path)
+    if file_content_hash is None:
+        raise FileNotFoundError(f"Media file not found: {media_path}")
+    return file_content_hash
 
 
 def truncate_string(string: str, limit: int) -> str:
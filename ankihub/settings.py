@@ -14,6 +14,7 @@ import sys
 import threading
 import time
 import uuid
+from contextlib import contextmanager
 from copy import deepcopy
 from dataclasses import dataclass, field
 from datetime import date, datetime, timedelta
@@ -22,7 +23,7 @@ from json import JSONDecodeError
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
 from shutil import copyfile, move, rmtree
-from typing import Any, Callable, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 import aqt
 import requests
@@ -237,6 +238,9 @@ class PrivateConfig(DataClassJSONMixin):
     step_deck_tutorial_pending: bool = False
     # Show Step Deck tutorial next time the user opens the deck
     show_step_deck_tutorial: bool = False
+    # Fingerprints of the inputs of the tasks that are run when the profile is opened, by task name.
+    # Used to skip tasks whose inputs haven't changed since they last ran, see startup_tasks.py
+    startup_task_fingerprints: Dict[str, str] = field(default_factory=dict)
 
 
 class _Config:
@@ -245,6 +249,10 @@ class _Config:
         self.public_config: Optional[Dict[str, Any]] = None
         self._private_config: Optional[PrivateConfig] = None
         self._private_config_path: Optional[Path] = None
+        # Used to defer writes of the private config to its file, see batched_private_config_updates
+        self._private_config_lock = threading.RLock()
+        self._private_config_batch_depth = 0
+        self._private_config_update_pending = False
         self.token_change_hook: List[Callable[[], None]] = []
         self.app_url: Optional[str] = None
         self.s3_bucket_url: Optional[str] = None
@@ -380,11 +388,40 @@ class _Config:
         return result
 
     def _update_private_config(self):
-        with open(self._private_config_path, "w") as f:
-            config_json = self._private_config.to_json()
-            f.write(json.dumps(json.loads(config_json), indent=4, sort_keys=True))
+        with self._private_config_lock:
+            if self._private_config_batch_depth > 0:
+                self._private_config_update_pending = True
+                return
+
+            self._private_config_update_pending = False
+            self._write_private_config()
         self.log_private_config(log_level=logging.DEBUG)
 
+    def _write_private_config(self) -> None:
+        # The config is written to a temporary file which then replaces the config file, so that the config file
+        # is not left half-written if Anki is closed or crashes during the write.
+        config_json = json.dumps(self._private_config.to_dict(), indent=4, sort_keys=True)
+        temp_path = self._private_config_path.with_name(f"{self._private_config_path.name}.tmp")
+        temp_path.write_text(config_json)
+        os.replace(temp_path, self._private_config_path)
+
+    @contextmanager
+    def batched_private_config_updates(self) -> Iterator[None]:
+        """Defers writing the private config to its file until the context is exited, so that many updates
+        of the private config (e.g. during a sync of multiple decks) result in a single write.
+        Contexts can be nested, the file is written when the outermost context is exited.
+        Updates made from other threads while the context is active are deferred as well."""
+        with self._private_config_lock:
+            self._private_config_batch_depth += 1
+        try:
+            yield
+        finally:
+            with self._private_config_lock:
+                self._private_config_batch_depth -= 1
+                should_write = self._private_config_batch_depth == 0 and self._private_config_update_pending
+            if should_write:
+                self._update_private_config()
+
     def load_public_config(self) -> None:
         """For loading the public config from its file."""
         self.public_config = aqt.mw.addonManager.getConfig(ADDON_PATH.name)
@@ -503,6 +540,17 @@ class _Config:
         self.deck_config(ankihub_did).behavior_on_remote_note_deleted = note_delete_behavior
         self._update_private_config()
 
+    def startup_task_fingerprint(self, task_name: str) -> Optional[str]:
+        return self._private_config.startup_task_fingerprints.get(task_name)
+
+    def set_startup_task_fingerprint(self, task_name: str, fingerprint: str) -> None:
+        # The dict is replaced instead of updated in place, because tasks can run in background threads
+        self._private_config.startup_task_fingerprints = {
+            **self._private_config.startup_task_fingerprints,
+            task_name: fingerprint,
+        }
+        self._update_private_config()
+
     def set_feature_flags(self, feature_flags: Optional[dict]):
         self._private_config.feature_flags = feature_flags
         self._update_private_config()
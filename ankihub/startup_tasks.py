@@ -0,0 +1,68 @@
+"""Run tasks when a profile is opened, skipping tasks whose inputs haven't changed since they last ran.
+
+Each task has a fingerprint function which returns a digest of the inputs of the task. The fingerprint is
+recorded in the private config after the task has run, and the task is skipped when the profile is opened the
+next time if the fingerprint is still the same. The fingerprint is computed again after the task has run,
+so that changes the task makes to its own inputs don't cause it to run again.
+
+Tasks that don't need the collection are run in the background, so that they don't delay the profile open.
+"""
+
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Sequence
+
+import aqt
+
+from . import LOGGER
+from .gui.operations import AddonQueryOp
+from .settings import config
+
+
+@dataclass(frozen=True)
+class StartupTask:
+    name: str
+    run: Callable[[], None]
+    fingerprint: Callable[[], str]
+    # Background tasks are run outside the main thread, so they must not access the collection.
+    in_background: bool = False
+
+
+def fingerprint_of(*values: Any) -> str:
+    """Returns a digest of the given values, which can be used as the fingerprint of a task."""
+    return hashlib.md5(repr(values).encode("utf-8")).hexdigest()
+
+
+def run_startup_tasks(tasks: Sequence[StartupTask]) -> None:
+    """Runs the tasks whose fingerprint has changed since they last ran. The background tasks are started first,
+    then the other tasks are run on the main thread, in the given order."""
+    background_tasks = [task for task in tasks if task.in_background]
+    if background_tasks:
+        AddonQueryOp(
+            parent=aqt.mw,
+            op=lambda _: _run_tasks_if_changed(background_tasks),
+            success=lambda _: None,
+        ).without_collection().run_in_background()
+
+    _run_tasks_if_changed([task for task in tasks if not task.in_background])
+
+
+def _run_tasks_if_changed(tasks: Sequence[StartupTask]) -> None:
+    for task in tasks:
+        _run_task_if_changed(task)
+
+
+def _run_task_if_changed(task: StartupTask) -> None:
+    start_time = time.monotonic()
+    if task.fingerprint() == config.startup_task_fingerprint(task.name):
+        LOGGER.info(
+            "Skipped startup task, its inputs didn't change.",
+            task=task.name,
+            duration_seconds=round(time.monotonic() - start_time, 3),
+        )
+        return
+
+    task.run()
+    config.set_startup_task_fingerprint(task.name, task.fingerprint())
+    LOGGER.info("Ran startup task.", task=task.name, duration_seconds=round(time.monotonic() - start_time, 3))
@@ -102,3 +102,22 @@ def test_anking_deck_update(
         duration_seconds = profile(lambda: import_anking_notes(notes_data))
         print(f"Importing {len(notes_data)} notes took {duration_seconds} seconds")
         assert duration_seconds < 0.5
+
+
+@pytest.mark.performance
+def test_anking_deck_notes_data_read(
+    anki_session_with_addon_data: AnkiSession,
+    anking_notes_data: List[NoteInfo],
+    import_anking_notes: ImportAnkingNotes,
+    profile: Profile,
+):
+    """Test that reading the data of notes of the AnKing deck from the AnkiHub DB takes less than a threshold
+    duration."""
+    with anki_session_with_addon_data.profile_loaded():
+        notes_data = anking_notes_data[:1000]
+        import_anking_notes(notes_data)
+
+        anki_nids = [NoteId(note.anki_nid) for note in notes_data]
+        duration_seconds = profile(lambda: ankihub_db.notes_data_for_anki_nids(anki_nids))
+        print(f"Reading the data of {len(notes_data)} notes took {duration_seconds} seconds")
+        assert duration_seconds < 0.5
@@ -0,0 +1,35 @@
+import os
+from typing import Dict, List
+
+import pytest
+from anki.models import NotetypeDict, NotetypeId
+
+from .conftest import Profile
+
+# workaround for vscode test discovery not using pytest.ini which sets this env var
+# has to be set before importing ankihub
+os.environ["SKIP_INIT"] = "1"
+
+from ankihub.ankihub_client import NoteInfo
+from ankihub.ankihub_client.models import get_media_names_from_notes_data
+
+
+@pytest.mark.performance
+def test_anking_media_names_extraction(
+    anking_notes_data: List[NoteInfo],
+    anking_note_types: Dict[NotetypeId, NotetypeDict],
+    profile: Profile,
+):
+    """Test that extracting the media names from a portion of the AnKing deck twice takes less than a threshold
+    duration. Media names are extracted multiple times from the same notes, e.g. when notes are imported and when
+    the media of their deck is synced."""
+    notes_data = anking_notes_data[:5000]
+    note_types_by_id = {int(mid): note_type for mid, note_type in anking_note_types.items()}
+
+    def extract_media_names():
+        for _ in range(2):
+            get_media_names_from_notes_data(notes_data, lambda mid: note_types_by_id[mid])
+
+    duration_seconds = profile(extract_media_names)
+    print(f"Extracting the media names of {len(notes_data)} notes twice took {duration_seconds} seconds")
+    assert duration_seconds < 0.5
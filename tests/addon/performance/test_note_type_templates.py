@@ -0,0 +1,61 @@
+import os
+import uuid
+from typing import Callable, Dict, List
+
+import pytest
+from anki.models import NotetypeDict, NotetypeId
+from pytest_anki import AnkiSession
+
+from .conftest import Profile
+
+# workaround for vscode test discovery not using pytest.ini which sets this env var
+# has to be set before importing ankihub
+os.environ["SKIP_INIT"] = "1"
+
+from ankihub.ankihub_client import NoteInfo
+from ankihub.main.importing import AnkiHubImporter
+from ankihub.main.utils import modify_note_type_templates
+from ankihub.settings import BehaviorOnRemoteNoteDeleted, DeckConfig
+
+
+@pytest.mark.performance
+def test_modify_anking_note_type_templates(
+    anki_session_with_addon_data: AnkiSession,
+    next_deterministic_uuid: Callable[[], uuid.UUID],
+    anking_notes_data: List[NoteInfo],
+    anking_note_types: Dict[NotetypeId, NotetypeDict],
+    profile: Profile,
+):
+    """Test that adjusting the templates of the AnKing note types, which happens on every startup and every sync,
+    takes less than a threshold duration when the templates are already up to date. The note types are only saved
+    when their templates change, saving them is slow when they have many cards."""
+    with anki_session_with_addon_data.profile_loaded():
+        mw = anki_session_with_addon_data.mw
+
+        importer = AnkiHubImporter()
+        importer.import_ankihub_deck(
+            ankihub_did=next_deterministic_uuid(),
+            notes=anking_notes_data[:5000],
+            deck_name="test",
+            is_first_import_of_deck=True,
+            behavior_on_remote_note_deleted=BehaviorOnRemoteNoteDeleted.NEVER_DELETE,
+            note_types=anking_note_types,
+            protected_fields={},
+            protected_tags=[],
+            suspend_new_cards_of_new_notes=False,
+            suspend_new_cards_of_existing_notes=DeckConfig.suspend_new_cards_of_existing_notes_default(),
+        )
+
+        mids = [NotetypeId(int(mid)) for mid in anking_note_types.keys()]
+        mtimes_before = {mid: mw.col.models.get(mid)["mod"] for mid in mids}
+
+        def modify_templates():
+            for _ in range(10):
+                modify_note_type_templates(mids)
+
+        duration_seconds = profile(modify_templates)
+        print(f"Adjusting the templates of {len(mids)} note types 10 times took {duration_seconds} seconds")
+        assert duration_seconds < 0.5
+
+        # The note types were not saved, because their templates were already up to date
+        assert {mid: mw.col.models.get(mid)["mod"] for mid in mids} == mtimes_before
@@ -5,13 +5,14 @@ import os
 import re
 import shutil
 import tempfile
+import threading
 import uuid
 from concurrent.futures import Future
 from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
 from time import sleep, time
 from typing import Any, Callable, Dict, Iterator, List, Optional, Protocol, Set, Tuple, Union, cast
-from unittest.mock import Mock
+from unittest.mock import Mock, call
 from zipfile import ZipFile
 
 import aqt
@@ -127,14 +128,14 @@ from ankihub.ankihub_client.ankihub_client import (
 )
 from ankihub.ankihub_client.models import (
     DeckMediaUpdateChunk,
-    DeckUpdates,
+    DeckUpdatesChunk,
     NotesAction,
     NotesActionChoices,
     UserDeckExtensionRelation,
 )
 from ankihub.common_utils import get_media_names_from_note_field
 from ankihub.db import ankihub_db
-from ankihub.db.models import AnkiHubNote
+from ankihub.db.models import AnkiHubNote, NoteTag
 from ankihub.gui import decks_dialog, editor, utils
 from ankihub.gui.auto_sync import (
     SYNC_RATE_LIMIT_SECONDS,
@@ -154,6 +155,7 @@ from ankihub.gui.browser.browser import (
     _on_reset_local_changes_action,
     _on_reset_optional_tags_action,
 )
+from ankihub.gui.browser.custom_columns import ColumnDataProvider
 from ankihub.gui.browser.custom_search_nodes import (
     AnkiHubNoteSearchNode,
     AnkiHubNoteTypeSearchNode,
@@ -237,6 +239,7 @@ from ankihub.main.note_conversion import (
 )
 from ankihub.main.note_deletion import TAG_FOR_DELETED_NOTES
 from ankihub.main.note_type_management import add_note_type, add_note_type_fields, update_note_type_templates_and_styles
+from ankihub.main.optional_tag_suggestions import OptionalTagsSuggestionHelper
 from ankihub.main.reset_local_changes import reset_local_changes_to_notes
 from ankihub.main.subdecks import SUBDECK_TAG, build_subdecks_and_move_cards_to_them, flatten_deck
 from ankihub.main.suggestions import (
@@ -452,11 +455,19 @@ def mock_client_methods_called_during_ankihub_sync(mocker: MockerFixture) -> Non
     mocker.patch.object(AnkiHubClient, "get_deck_by_id")
     mocker.patch.object(AnkiHubClient, "get_note_types_dict_for_deck", return_value={})
 
-    deck_updates_mock = Mock()
-    deck_updates_mock.notes = []
-    deck_updates_mock.latest_update = None
-    deck_updates_mock.protected_fields = {}
-    mocker.patch.object(AnkiHubClient, "get_deck_updates", return_value=deck_updates_mock)
+    mocker.patch.object(
+        AnkiHubClient,
+        "get_deck_updates_chunks",
+        return_value=[
+            DeckUpdatesChunk(
+                latest_update=None,
+                protected_fields={},
+                protected_tags=[],
+                notes=[],
+                from_csv=False,
+            )
+        ],
+    )
 
 
 class MockClientGetNoteType(Protocol):
@@ -1110,6 +1121,39 @@ def test_create_collaborative_deck_and_upload(
         assert AnkiHubNote.get(AnkiHubNote.anki_note_id == note.id).mod == note.mod
 
 
+def test_create_collaborative_deck_with_notes_of_multiple_note_types(
+    anki_session_with_addon_data: AnkiSession,
+    mocker: MockerFixture,
+    next_deterministic_uuid: Callable[[], uuid.UUID],
+):
+    with anki_session_with_addon_data.profile_loaded():
+        mw = anki_session_with_addon_data.mw
+
+        deck_name = "New Deck"
+        mw.col.decks.add_normal_deck_with_name(deck_name)
+        anki_did = mw.col.decks.id_for_name(deck_name)
+
+        notes = []
+        for note_type_name in ["Basic", "Cloze", "Basic"]:
+            note = mw.col.new_note(mw.col.models.by_name(note_type_name))
+            note.fields[0] = "{{c1::text}}"
+            mw.col.add_note(note, anki_did)
+            notes.append(note)
+
+        upload_deck_mock = mocker.patch.object(AnkiHubClient, "upload_deck", return_value=next_deterministic_uuid())
+        create_ankihub_deck(deck_name, private=False)
+
+        notes_data = upload_deck_mock.call_args.kwargs["notes_data"]
+        assert [note_data.anki_nid for note_data in notes_data] == [note.id for note in notes]
+        assert len(upload_deck_mock.call_args.kwargs["note_types_data"]) == 2
+
+        for note, note_data in zip(notes, notes_data):
+            note.load()
+            assert f"({deck_name} / " in note.note_type()["name"]
+            assert note[ANKIHUB_NOTE_TYPE_FIELD_NAME] == str(note_data.ah_nid)
+            assert note_data.mid == note.mid
+
+
 def test_create_collaborative_deck_strips_personally_protected_fields(
     anki_session_with_addon_data: AnkiSession,
     mocker: MockerFixture,
@@ -1446,6 +1490,30 @@ class TestDownloadAndInstallDecks:
             for name, mock in mocks.items():
                 assert mock.call_count == 1, f"Mock {name} was not called once, but {mock.call_count} times"
 
+    def test_download_and_install_deck_with_multiple_batches_of_notes(
+        self,
+        anki_session_with_addon_data: AnkiSession,
+        qtbot: QtBot,
+        mock_download_and_install_deck_dependencies: MockDownloadAndInstallDeckDependencies,
+        ankihub_basic_note_type: NotetypeDict,
+    ):
+        with anki_session_with_addon_data.profile_loaded():
+            deck = DeckFactory.create()
+            notes_data = [NoteInfoFactory.create(mid=ankihub_basic_note_type["id"]) for _ in range(3)]
+            mocks = mock_download_and_install_deck_dependencies(deck, notes_data, ankihub_basic_note_type)
+            mocks["download_deck_in_batches"].return_value = [notes_data[:2], notes_data[2:]]
+
+            with qtbot.wait_callback() as callback:
+                download_and_install_decks(
+                    [deck.ah_did],
+                    on_done=callback,
+                    behavior_on_remote_note_deleted=BehaviorOnRemoteNoteDeleted.NEVER_DELETE,
+                )
+
+            # The notes of all batches are installed
+            for note_data in notes_data:
+                assert ankihub_db.note_data(NoteId(note_data.anki_nid)) == note_data
+
     def test_exception_is_not_backpropagated_to_caller(
         self, anki_session_with_addon_data: AnkiSession, mocker: MockerFixture
     ):
@@ -2944,6 +3012,31 @@ def test_reset_note_types_of_notes(anki_session_with_addon_data: AnkiSession):
         assert mw.col.get_note(note.id).mid == cloze["id"]
 
 
+def test_change_note_types_of_notes_groups_notes_by_type_change(
+    anki_session_with_addon_data: AnkiSession,
+    add_anki_note: AddAnkiNote,
+    mocker: MockerFixture,
+):
+    with anki_session_with_addon_data.profile_loaded():
+        basic = aqt.mw.col.models.by_name("Basic")
+        basic_and_reversed = aqt.mw.col.models.by_name("Basic (and reversed card)")
+        notes = [add_anki_note(note_type=basic) for _ in range(3)]
+
+        change_notetype_spy = mocker.spy(aqt.mw.col.models, "change_notetype_of_notes")
+
+        # Notes that already have the target note type don't require any changes
+        change_note_types_of_notes([(NoteId(note.id), NotetypeId(basic["id"])) for note in notes])
+        assert change_notetype_spy.call_count == 0
+
+        # Notes with the same type change are changed at once, notes that don't exist are ignored
+        nid_mid_pairs = [(NoteId(note.id), NotetypeId(basic_and_reversed["id"])) for note in notes]
+        nid_mid_pairs.append((NoteId(1), NotetypeId(basic_and_reversed["id"])))
+        change_note_types_of_notes(nid_mid_pairs)
+
+        assert change_notetype_spy.call_count == 1
+        assert all(aqt.mw.col.get_note(note.id).mid == basic_and_reversed["id"] for note in notes)
+
+
 class TestAnkiHubImporter:
     def test_import_new_deck(
         self,
@@ -2988,6 +3081,36 @@ class TestAnkiHubImporter:
 
             assert_that_only_ankihub_sample_deck_info_in_database(ah_did=ah_did)
 
+    def test_last_occurrence_of_note_wins(
+        self,
+        anki_session_with_addon_data: AnkiSession,
+        next_deterministic_uuid: Callable[[], uuid.UUID],
+    ):
+        anki_session = anki_session_with_addon_data
+        with anki_session.profile_loaded():
+            notes_data = ankihub_sample_deck_notes_data()
+            earlier_note_data = copy.deepcopy(notes_data[0])
+            earlier_note_data.fields[0].value = '<img src="earlier.png">'
+            earlier_note_data.tags = ["earlier_tag"]
+
+            ah_did = next_deterministic_uuid()
+            AnkiHubImporter().import_ankihub_deck(
+                ankihub_did=ah_did,
+                notes=[earlier_note_data, *notes_data],
+                deck_name="test",
+                is_first_import_of_deck=True,
+                behavior_on_remote_note_deleted=BehaviorOnRemoteNoteDeleted.NEVER_DELETE,
+                note_types=SAMPLE_NOTE_TYPES,
+                protected_fields={},
+                protected_tags=[],
+                suspend_new_cards_of_new_notes=DeckConfig.suspend_new_cards_of_new_notes_default(ah_did),
+                suspend_new_cards_of_existing_notes=DeckConfig.suspend_new_cards_of_existing_notes_default(),
+            )
+
+            # The media references and tags of the earlier occurrence of the note are not kept
+            assert "earlier.png" not in ankihub_db.media_names_for_ankihub_deck(ah_did)
+            assert not NoteTag.filter(ankihub_note_id=notes_data[0].ah_nid, tag="earlier_tag").exists()
+
     def test_import_existing_deck_1(
         self,
         anki_session_with_addon_data: AnkiSession,
@@ -3654,6 +3777,45 @@ class TestAnkiHubImporter:
             assert "Back" not in importer._overwritten_fields.counts
             assert note.mid not in importer._overwritten_mids_without_protection
 
+    def test_notes_without_changes_are_not_loaded(
+        self,
+        anki_session_with_addon_data: AnkiSession,
+        install_ah_deck: InstallAHDeck,
+        import_ah_note: ImportAHNote,
+        mocker: MockerFixture,
+    ):
+        with anki_session_with_addon_data.profile_loaded():
+            ah_did = install_ah_deck()
+            unchanged_note_data = import_ah_note(ah_did=ah_did)
+            changed_note_data = import_ah_note(ah_did=ah_did)
+            changed_note_data.fields = [
+                Field(name="Front", value="remote front"),
+                Field(name="Back", value="remote back"),
+            ]
+
+            get_note_spy = mocker.spy(aqt.mw.col, "get_note")
+            importer = AnkiHubImporter()
+            import_result = importer.import_ankihub_deck(
+                ankihub_did=ah_did,
+                notes=[unchanged_note_data, changed_note_data],
+                deck_name="test",
+                is_first_import_of_deck=False,
+                behavior_on_remote_note_deleted=BehaviorOnRemoteNoteDeleted.NEVER_DELETE,
+                note_types={
+                    NotetypeId(unchanged_note_data.mid): ankihub_db.note_type_dict(NotetypeId(unchanged_note_data.mid))
+                },
+                protected_fields={},
+                protected_tags=[],
+                suspend_new_cards_of_new_notes=DeckConfig.suspend_new_cards_of_new_notes_default(ah_did),
+                suspend_new_cards_of_existing_notes=DeckConfig.suspend_new_cards_of_existing_notes_default(),
+            )
+
+            # Only the changed note is loaded from the Anki DB
+            assert get_note_spy.call_args_list == [mocker.call(id=NoteId(changed_note_data.anki_nid))]
+            assert import_result.updated_nids == [NoteId(changed_note_data.anki_nid)]
+            assert importer._nids_without_changes == [NoteId(unchanged_note_data.anki_nid)]
+            assert aqt.mw.col.get_note(NoteId(changed_note_data.anki_nid))["Front"] == "remote front"
+
     def test_import_deck_and_check_that_values_are_saved_to_databases(
         self,
         anki_session_with_addon_data: AnkiSession,
@@ -4386,6 +4548,24 @@ class TestAnkiHubImporterSuspendNewCardsOfNewNotesOption:
             # Assert the new card is suspended or not suspended depending on the option value
             assert new_card.queue == (QUEUE_TYPE_SUSPENDED if expected_new_card_suspended else QUEUE_TYPE_NEW)
 
+    def test_cards_are_not_loaded_for_suspending(
+        self,
+        anki_session_with_addon_data: AnkiSession,
+        install_ah_deck: InstallAHDeck,
+        import_ah_note: ImportAHNote,
+        mocker: MockerFixture,
+    ):
+        with anki_session_with_addon_data.profile_loaded():
+            ah_did = install_ah_deck()
+            config.set_suspend_new_cards_of_new_notes(ah_did, True)
+
+            note_cards_spy = mocker.spy(Note, "cards")
+            note_info = import_ah_note(ah_did=ah_did)
+            assert note_cards_spy.call_count == 0
+
+            note = aqt.mw.col.get_note(NoteId(note_info.anki_nid))
+            assert [card.queue for card in note.cards()] == [QUEUE_TYPE_SUSPENDED]
+
 
 def test_keep_notes_with_instructions_tag_unsuspended(
     anki_session_with_addon_data: AnkiSession,
@@ -4755,6 +4935,34 @@ class TestCustomSearchNodes:
             with qtbot.wait_callback() as callback:
                 dialogs.closeAll(onsuccess=callback)
 
+    def test_custom_search_node_does_not_clear_undo_queue(
+        self,
+        anki_session_with_addon_data: AnkiSession,
+        import_ah_note: ImportAHNote,
+        qtbot: QtBot,
+    ):
+        setup_browser()
+        with anki_session_with_addon_data.profile_loaded():
+            note_info = NoteInfoFactory.create()
+            import_ah_note(note_info)
+            add_basic_anki_note_to_deck(DeckId(1))
+
+            undo_label = aqt.mw.col.undo_status().undo
+            assert undo_label
+
+            browser: Browser = dialogs.open("Browser", aqt.mw)
+            browser.search_for(search=f"{ModifiedAfterSyncSearchNode.parameter_name}:no")
+
+            browser.table.select_all()
+            assert browser.table.get_selected_note_ids() == [note_info.anki_nid]
+
+            # Anki clears the undo queue when a query which is not a SELECT is executed on the collection
+            assert aqt.mw.col.undo_status().undo == undo_label
+
+            # Close the browser to prevent RuntimeErrors getting raised during teardown
+            with qtbot.wait_callback() as callback:
+                dialogs.closeAll(onsuccess=callback)
+
     def test_ModifiedAfterSyncSearchNode_with_notes(
         self,
         anki_session_with_addon_data: AnkiSession,
@@ -5310,6 +5518,71 @@ def test_browser_custom_columns(
         ]
 
 
+@pytest.mark.qt_no_exception_capture
+def test_browser_custom_columns_data_is_loaded_once_per_page(
+    anki_session_with_addon_data: AnkiSession,
+    qtbot: QtBot,
+    install_sample_ah_deck: InstallSampleAHDeck,
+    mocker: MockerFixture,
+):
+    config.public_config["sync_on_startup"] = False
+    entry_point.run()
+
+    with anki_session_with_addon_data.profile_loaded():
+        mw = anki_session_with_addon_data.mw
+
+        install_sample_ah_deck()
+
+        browser: Browser = dialogs.open("Browser", mw)
+        for custom_column in custom_columns:
+            browser.table._on_column_toggled(True, custom_column.builtin_column.key)
+        qtbot.wait(500)
+
+        last_syncs_spy = mocker.spy(ankihub_db, "last_syncs")
+        browser.search_for("")
+        rows = [browser.table._model.get_row(browser.table._model.index(row, 0)) for row in range(browser.table.len())]
+
+        # The data for all rows of the search result is loaded at once
+        assert len(rows) == 3
+        assert last_syncs_spy.call_count == 1
+        assert all(cell.text for row in rows for cell in row.cells[4:])
+
+        # A new search loads the data again
+        browser.search_for("")
+        browser.table._model.get_row(browser.table._model.index(0, 0))
+        assert last_syncs_spy.call_count == 2
+
+        # Close the browser to prevent RuntimeErrors getting raised during teardown
+        with qtbot.wait_callback() as callback:
+            dialogs.closeAll(onsuccess=callback)
+
+
+def test_column_data_provider_with_notes_without_ankihub_id_field(
+    anki_session_with_addon_data: AnkiSession,
+    install_sample_ah_deck: InstallSampleAHDeck,
+    mocker: MockerFixture,
+):
+    with anki_session_with_addon_data.profile_loaded():
+        install_sample_ah_deck()
+        nids = aqt.mw.col.find_notes("")
+
+        # The first note has fewer fields than its note type
+        aqt.mw.col.db.execute("UPDATE notes SET flds = ? WHERE id = ?", "front", nids[0])
+
+        browser = mocker.Mock()
+        browser.table._model._items = nids
+        column_data_provider = ColumnDataProvider()
+
+        # The data of the other notes on the page is still loaded
+        assert column_data_provider.data(browser, nids[0], is_notes_mode=True).ankihub_id is None
+        assert all(column_data_provider.data(browser, nid, is_notes_mode=True).ankihub_id for nid in nids[1:])
+
+        # Notes whose note type doesn't exist have no AnkiHub ID
+        mocker.patch.object(aqt.mw.col.models, "get", return_value=None)
+        column_data_provider.invalidate()
+        assert all(column_data_provider.data(browser, nid, is_notes_mode=True).ankihub_id is None for nid in nids)
+
+
 class TestBrowserContextMenu:
     def test_ankihub_actions_are_added_to_the_browser_context_menu(
         self,
@@ -7070,7 +7343,7 @@ class TestDeckUpdater:
             # Install a deck to be updated
             ah_did = install_ah_deck()
 
-            # Mock client.get_deck_updates to return a note update
+            # Mock client.get_deck_updates_chunks to return a note update
             note_info = import_ah_note(ah_did=ah_did)
             note_info.fields[0].value = "changed"
 
@@ -7078,13 +7351,16 @@ class TestDeckUpdater:
             latest_update = datetime.now()
             mocker.patch.object(
                 AnkiHubClient,
-                "get_deck_updates",
-                return_value=DeckUpdates(
-                    latest_update=latest_update,
-                    protected_fields=protected_fields,
-                    protected_tags=[],
-                    notes=[note_info],
-                ),
+                "get_deck_updates_chunks",
+                return_value=[
+                    DeckUpdatesChunk(
+                        latest_update=latest_update,
+                        protected_fields=protected_fields,
+                        protected_tags=[],
+                        notes=[note_info],
+                        from_csv=False,
+                    )
+                ],
             )
 
             mocker.patch.object(
@@ -7230,6 +7506,68 @@ class TestDeckUpdater:
                 latest_update=latest_update,
             )
 
+    def test_notes_with_unchanged_optional_tags_are_not_updated(
+        self,
+        anki_session_with_addon_data: AnkiSession,
+        install_ah_deck: InstallAHDeck,
+        import_ah_note: ImportAHNote,
+        mocker: MockerFixture,
+        mock_ankihub_sync_dependencies: None,
+    ):
+        with anki_session_with_addon_data.profile_loaded():
+            ah_did = install_ah_deck()
+
+            # Create note which already has the incoming optional tag
+            note_info = import_ah_note(ah_did=ah_did)
+            note = aqt.mw.col.get_note(NoteId(note_info.anki_nid))
+            note.tags = ["foo::bar", "AnkiHub_Optional::tag_group::test1"]
+            aqt.mw.col.update_note(note)
+
+            # Mock client to return a deck extension update with the optional tag of the note
+            latest_update = datetime.now()
+
+            mocker.patch.object(
+                AnkiHubClient,
+                "get_deck_by_id",
+                return_value=DeckFactory.create(ah_did=ah_did),
+            )
+
+            deck_extension = DeckExtensionFactory.create(ah_did=ah_did, tag_group_name="tag_group")
+            mocker.patch.object(
+                AnkiHubClient,
+                "get_deck_extensions_by_deck_id",
+                return_value=[deck_extension],
+            )
+
+            mocker.patch.object(
+                AnkiHubClient,
+                "get_deck_extension_updates",
+                return_value=[
+                    DeckExtensionUpdateChunk(
+                        note_customizations=[
+                            NoteCustomization(
+                                ankihub_nid=note_info.ah_nid,
+                                tags=["AnkiHub_Optional::tag_group::test1"],
+                            ),
+                        ],
+                        latest_update=latest_update,
+                    ),
+                ],
+            )
+            update_notes_spy = mocker.spy(aqt.mw.col, "update_notes")
+
+            # Update the deck
+            deck_updater = _AnkiHubDeckUpdater()
+            deck_updater.update_decks_and_media(
+                ah_dids=[ah_did],
+                start_media_sync=False,
+                raise_if_full_sync_required=True,
+            )
+
+            # Assert that the note wasn't saved, but the latest update of the extension was
+            update_notes_spy.assert_not_called()
+            assert config.deck_extension_config(extension_id=deck_extension.id).latest_update == latest_update
+
     def test_removes_deck_extension_config_when_no_longer_on_ankihub(
         self,
         anki_session_with_addon_data: AnkiSession,
@@ -7355,6 +7693,73 @@ class TestDeckUpdater:
             assert config.deck_config(ah_did).user_relation == incoming_relation
             assert config.deck_config(ah_did).has_note_embeddings is True
 
+    def test_decks_are_downloaded_concurrently(
+        self,
+        anki_session_with_addon_data: AnkiSession,
+        install_ah_deck: InstallAHDeck,
+        mocker: MockerFixture,
+        mock_ankihub_sync_dependencies: None,
+    ):
+        with anki_session_with_addon_data.profile_loaded():
+            ah_dids = [install_ah_deck(), install_ah_deck()]
+
+            # Fetching a deck only succeeds if all decks are fetched at the same time
+            barrier = threading.Barrier(len(ah_dids), timeout=5)
+
+            def get_deck_by_id(ah_did: uuid.UUID) -> Deck:
+                barrier.wait()
+                return DeckFactory.create(ah_did=ah_did)
+
+            mocker.patch.object(AnkiHubClient, "get_deck_by_id", side_effect=get_deck_by_id)
+
+            # Update the decks
+            deck_updater = _AnkiHubDeckUpdater()
+            deck_updater.update_decks_and_media(
+                ah_dids=ah_dids,
+                start_media_sync=False,
+                raise_if_full_sync_required=True,
+            )
+
+            # Assert that the decks were imported in the given order
+            assert [result.ankihub_did for result in deck_updater.last_deck_updates_results()] == ah_dids
+
+    def test_note_updates_are_only_downloaded_for_the_current_and_next_deck(
+        self,
+        anki_session_with_addon_data: AnkiSession,
+        install_ah_deck: InstallAHDeck,
+        mocker: MockerFixture,
+        mock_ankihub_sync_dependencies: None,
+    ):
+        with anki_session_with_addon_data.profile_loaded():
+            ah_dids = [install_ah_deck(), install_ah_deck(), install_ah_deck()]
+
+            get_deck_updates_chunks_mock = AnkiHubClient.get_deck_updates_chunks
+            downloaded_ah_dids_by_updated_ah_did: Dict[uuid.UUID, List[uuid.UUID]] = {}
+            update_single_deck = _AnkiHubDeckUpdater._update_single_deck
+
+            def update_single_deck_wrapper(updater: _AnkiHubDeckUpdater, ankihub_did: uuid.UUID, **kwargs) -> bool:
+                downloaded_ah_dids_by_updated_ah_did[ankihub_did] = [
+                    call.args[0] for call in get_deck_updates_chunks_mock.call_args_list
+                ]
+                return update_single_deck(updater, ankihub_did, **kwargs)
+
+            mocker.patch.object(_AnkiHubDeckUpdater, "_update_single_deck", update_single_deck_wrapper)
+
+            # Update the decks
+            deck_updater = _AnkiHubDeckUpdater()
+            deck_updater.update_decks_and_media(
+                ah_dids=ah_dids,
+                start_media_sync=False,
+                raise_if_full_sync_required=True,
+            )
+
+            # Assert that the note updates of a deck are only requested once the previous deck is imported
+            assert downloaded_ah_dids_by_updated_ah_did == {
+                ah_dids[0]: ah_dids[:2],
+                ah_dids[1]: ah_dids[:3],
+                ah_dids[2]: ah_dids[:3],
+            }
+
 
 class TestSyncWithAnkiHub:
     """Tests for the sync_with_ankihub operation."""
@@ -7656,13 +8061,16 @@ class TestSyncWithAnkiHub:
         latest_update = datetime.now()
         mocker.patch.object(
             AnkiHubClient,
-            "get_deck_updates",
-            return_value=DeckUpdates(
-                latest_update=latest_update,
-                protected_fields={},
-                protected_tags=[],
-                notes=notes,
-            ),
+            "get_deck_updates_chunks",
+            return_value=[
+                DeckUpdatesChunk(
+                    latest_update=latest_update,
+                    protected_fields={},
+                    protected_tags=[],
+                    notes=notes,
+                    from_csv=False,
+                )
+            ],
         )
 
 
@@ -8248,6 +8656,58 @@ def test_optional_tag_suggestion_dialog(
         }
 
 
+def test_optional_tag_suggestions_are_sent_in_pages(
+    anki_session_with_addon_data: AnkiSession,
+    mocker: MockerFixture,
+    import_ah_note: ImportAHNote,
+    next_deterministic_uuid,
+):
+    with anki_session_with_addon_data.profile_loaded():
+        ah_did = next_deterministic_uuid()
+        note_infos = [import_ah_note(ah_did=ah_did) for _ in range(3)]
+        nids = [NoteId(note_info.anki_nid) for note_info in note_infos]
+
+        note = aqt.mw.col.get_note(nids[0])
+        # The case of the tag group name in the tags doesn't matter
+        note.tags = [f"{TAG_FOR_OPTIONAL_TAGS}::valid_group::tag1", f"{TAG_FOR_OPTIONAL_TAGS}::OTHER::tag2"]
+        note.flush()
+
+        mocker.patch.object(
+            AnkiHubClient,
+            "prevalidate_tag_groups",
+            return_value=[
+                TagGroupValidationResponse(
+                    tag_group_name="VALID group",
+                    deck_extension_id=1,
+                    success=True,
+                    errors=[],
+                ),
+            ],
+        )
+        suggest_optional_tags_mock = mocker.patch.object(AnkiHubClient, "suggest_optional_tags")
+        mocker.patch("ankihub.main.optional_tag_suggestions.OPTIONAL_TAG_SUGGESTIONS_PAGE_SIZE", 2)
+        progress_cb = Mock()
+
+        helper = OptionalTagsSuggestionHelper(nids)
+        helper.prevalidate_tag_groups()
+        helper.suggest_tags_for_groups(tag_groups=["VALID group"], auto_accept=False, progress_cb=progress_cb)
+
+        pages = [mock_call.kwargs["suggestions"] for mock_call in suggest_optional_tags_mock.call_args_list]
+        assert [len(page) for page in pages] == [2, 1]
+
+        suggestions = [suggestion for page in pages for suggestion in page]
+        assert suggestions == [
+            OptionalTagSuggestion(
+                tag_group_name="VALID group",
+                deck_extension_id=1,
+                ah_nid=note_info.ah_nid,
+                tags=[f"{TAG_FOR_OPTIONAL_TAGS}::valid_group::tag1"] if note_info is note_infos[0] else [],
+            )
+            for note_info in note_infos
+        ]
+        assert progress_cb.call_args_list == [call(2, 3), call(3, 3)]
+
+
 @pytest.mark.qt_no_exception_capture
 def test_reset_optional_tags_action(
     anki_session_with_addon_data: AnkiSession,
@@ -8378,7 +8838,12 @@ class TestMediaSyncMediaDownload:
                 ah_did,
                 since=None,
             )
-            download_media_mock.assert_called_once_with(["image.png"], ah_did, media_sync._on_downloaded_file)
+            download_media_mock.assert_called_once_with(
+                ["image.png"],
+                ah_did,
+                media_sync._on_downloaded_file,
+                on_bytes_downloaded=media_sync._on_bytes_downloaded,
+            )
 
             # Assert that the deck media was added to the database
             assert ankihub_db.downloadable_media_for_ankihub_deck(ah_did) == [deck_media]
@@ -8478,7 +8943,10 @@ class TestMediaSyncMediaDownload:
 
             # Should only download the referenced media, not the unreferenced one
             download_media_mock.assert_called_once_with(
-                ["referenced_image.png"], ah_did, media_sync._on_downloaded_file
+                ["referenced_image.png"],
+                ah_did,
+                media_sync._on_downloaded_file,
+                on_bytes_downloaded=media_sync._on_bytes_downloaded,
             )
 
             # Assert that both media were added to the database (this happens before filtering)
@@ -8526,20 +8994,15 @@ class TestMediaSyncMediaDownload:
 @fixture
 def mock_client_media_upload(mocker: MockerFixture) -> Iterator[Mock]:
     """Setup a temporary media folder and mock client methods used for uploading media.
-    Returns a mock for the _upload_file_to_s3_with_reusable_presigned_url method,
-    which takes a filepath argument for the file to upload.
-    This fixture also mocks the os.remove function so that the file to upload is not deleted
-    by the client.
+    Returns a mock for the _upload_zipped_media_to_s3_with_reusable_presigned_url method,
+    which takes a media_paths argument for the media files to upload.
     """
-    upload_file_to_s3_with_reusable_presigned_url_mock = mocker.patch.object(
-        AnkiHubClient, "_upload_file_to_s3_with_reusable_presigned_url"
+    upload_zipped_media_mock = mocker.patch.object(
+        AnkiHubClient, "_upload_zipped_media_to_s3_with_reusable_presigned_url"
     )
     mocker.patch.object(AnkiHubClient, "_get_presigned_url_for_multiple_uploads")
     mocker.patch.object(AnkiHubClient, "media_upload_finished")
 
-    # Mock os.remove so the zip is not deleted
-    mocker.patch("os.remove")
-
     # Create a temporary media folder and copy the test media files to it.
     # Patch the media folder path to point to the temporary folder.
     # Clean up with ignore_errors=True rather than TemporaryDirectory's context
@@ -8552,7 +9015,7 @@ def mock_client_media_upload(mocker: MockerFixture) -> Iterator[Mock]:
 
         mocker.patch("anki.media.MediaManager.dir", return_value=tmp_dir)
 
-        yield upload_file_to_s3_with_reusable_presigned_url_mock
+        yield upload_zipped_media_mock
     finally:
         shutil.rmtree(tmp_dir, ignore_errors=True)
 
@@ -8803,12 +9266,8 @@ class TestSuggestionsWithMedia:
         upload_request_mock: Mock,
         expected_media_name: str,
     ) -> None:
-        zipfile_name = upload_request_mock.call_args.kwargs["filepath"]
-        media_dir = Path(aqt.mw.col.media.dir())
-        path_to_created_zip_file: Path = media_dir / zipfile_name
-        with ZipFile(path_to_created_zip_file, "r") as zfile:
-            namelist = zfile.namelist()
-            name_of_uploaded_media = namelist[0]
+        media_paths = upload_request_mock.call_args.kwargs["media_paths"]
+        name_of_uploaded_media = media_paths[0].name
 
         assert name_of_uploaded_media == expected_media_name
 
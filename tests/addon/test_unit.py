@@ -1,9 +1,13 @@
+import copy
+import hashlib
 import importlib.util
+import itertools
 import json
 import logging
 import os
 import sqlite3
 import tempfile
+import threading
 import time
 import uuid
 from concurrent.futures import Future
@@ -18,7 +22,7 @@ import aqt.profiles
 import pytest
 import requests
 from anki.decks import DeckId
-from anki.models import NotetypeDict
+from anki.models import NotetypeDict, NotetypeId
 from anki.notes import Note, NoteId
 from approvaltests.approvals import verify  # type: ignore
 from approvaltests.namer import NamerFactory  # type: ignore
@@ -106,9 +110,9 @@ from ankihub.ankihub_client.models import (  # type: ignore
     UserDeckExtensionRelation,
     UserDeckRelation,
 )
-from ankihub.db.db import _AnkiHubDB
+from ankihub.db.db import _AnkiHubDB, flat
 from ankihub.db.exceptions import IntegrityError, MissingValueError
-from ankihub.db.models import AnkiHubNote, DeckMedia, get_peewee_database
+from ankihub.db.models import AnkiHubNote, DeckMedia, MediaFileHash, NoteMedia, NoteTag, get_peewee_database
 from ankihub.gui import menu
 from ankihub.gui.ankiweb import (
     ERROR_DIALOG_LINK,
@@ -173,7 +177,7 @@ from ankihub.gui.suggestion_dialog import (
     open_suggestion_dialog_for_bulk_suggestion,
     open_suggestion_dialog_for_single_suggestion,
 )
-from ankihub.gui.threading_utils import rate_limited
+from ankihub.gui.threading_utils import prefetching, rate_limited
 from ankihub.gui.utils import (
     _Dialog,
     ask_user,
@@ -198,7 +202,7 @@ from ankihub.main.note_conversion import (
     TAG_FOR_OPTIONAL_TAGS,
     TAG_FOR_PROTECTING_ALL_FIELDS,
     TAG_FOR_PROTECTING_FIELDS,
-    _get_fields_protected_by_tags,
+    fields_protected_by_tags,
 )
 from ankihub.main.note_type_management import add_note_type_fields
 from ankihub.main.review_data import (
@@ -217,6 +221,7 @@ from ankihub.main.suggestions import ChangeSuggestionResult
 from ankihub.main.utils import (
     ANKIHUB_CSS_END_COMMENT,
     ANKIHUB_HTML_END_COMMENT,
+    ANKIHUB_SNIPPET_MARKER,
     Resource,
     clear_empty_cards,
     exclude_descendant_decks,
@@ -224,6 +229,8 @@ from ankihub.main.utils import (
     lowest_level_common_ancestor_deck_name,
     mh_tag_to_resource,
     mids_of_notes,
+    modify_note_type_templates,
+    move_notes_to_decks_while_respecting_odid,
     note_type_name_without_ankihub_modifications,
     note_type_with_updated_templates_and_css,
     retain_nids_with_ah_note_type,
@@ -236,6 +243,7 @@ from ankihub.settings import (
     log_file_path,
     setup_native_ankihub_token_hook,
 )
+from ankihub.startup_tasks import StartupTask, run_startup_tasks
 from ankihub.user_state import (
     _state,
     add_user_state_refreshed_callback,
@@ -277,15 +285,22 @@ class TestUploadMediaForSuggestion:
                 "other_test.gif": "fWJKERDVNMOWIKJCIWJefgjnverf.gif",
             }
 
-            suggestions._update_media_names_on_notes(hashed_name_map)
+            # The last note references the same media file as the first one, but it's not passed to the function
+            other_note = mw.col.new_note(mw.col.models.by_name("Basic"))
+            other_note["Front"] = note_contents[0]
+            mw.col.add_note(other_note, mw.col.decks.by_name("MediaTestDeck")["id"])
+
+            suggestions._update_media_names_on_notes(hashed_name_map, anki_nids=[note.id for note in notes])
 
             notes[0].load()
             notes[1].load()
             notes[2].load()
+            other_note.load()
 
             assert f'<img src="{hashed_name_map["test.png"]}">' in " ".join(notes[0].fields)
             assert f"<img src='{hashed_name_map['other_test.gif']}' width='250'>" in " ".join(notes[1].fields)
             assert '<img src="will_not_replace.jpeg">' in " ".join(notes[2].fields)
+            assert '<img src="test.png">' in " ".join(other_note.fields)
 
 
 class TestMediaSyncMediaDownload:
@@ -401,6 +416,14 @@ class TestMediaSyncProgressDialog:
         assert dialog.error_label.isHidden() is True
         assert not dialog.icon_label.pixmap().isNull()
 
+    def test_download_speed_is_cleared_when_download_is_finished(self, dialog: MediaSyncProgressDialog):
+        dialog.update_status(MediaSyncStatus.DOWNLOAD)
+        dialog.update_download_speed(2.5 * 1024 * 1024)
+        assert dialog.speed_label.text() == "2.5 MB/s"
+
+        dialog.update_status(MediaSyncStatus.IDLE)
+        assert dialog.speed_label.text() == ""
+
     @pytest.mark.parametrize(
         "status, expected_label",
         [
@@ -960,6 +983,39 @@ class TestGetOriginalDidsForNids:
             assert result == {DeckId(123)}
 
 
+class TestMoveNotesToDecksWhileRespectingOdid:
+    def test_moves_cards_to_decks(self, anki_session: AnkiSession, add_anki_note: AddAnkiNote):
+        with anki_session.profile_loaded():
+            deck_a_id = create_anki_deck("A")
+            deck_b_id = create_anki_deck("B")
+            note1 = add_anki_note()
+            note2 = add_anki_note()
+            note3 = add_anki_note(anki_did=deck_b_id)
+
+            move_notes_to_decks_while_respecting_odid({note1.id: deck_a_id, note2.id: deck_b_id, note3.id: deck_b_id})
+
+            assert [card.did for card in note1.cards()] == [deck_a_id]
+            assert [card.did for card in note2.cards()] == [deck_b_id]
+            assert [card.did for card in note3.cards()] == [deck_b_id]
+
+    def test_cards_in_filtered_decks_are_not_moved(self, anki_session: AnkiSession, add_anki_note: AddAnkiNote):
+        with anki_session.profile_loaded():
+            deck_a_id = create_anki_deck("A")
+            note = add_anki_note()
+
+            filtered_deck = aqt.mw.col.sched.get_or_create_filtered_deck(DeckId(0))
+            filtered_deck.name = "Filtered"
+            filtered_deck.config.search_terms[0].search = f"nid:{note.id}"
+            aqt.mw.col.sched.add_or_update_filtered_deck(filtered_deck)
+            filtered_deck_id = aqt.mw.col.decks.id_for_name("Filtered")
+
+            move_notes_to_decks_while_respecting_odid({note.id: deck_a_id})
+
+            card = note.cards()[0]
+            assert card.did == filtered_deck_id
+            assert card.odid == deck_a_id
+
+
 class TestGetFieldsProtectedByTags:
     @pytest.mark.parametrize(
         "tags,field_names,expected_protected_fields",
@@ -1010,7 +1066,7 @@ class TestGetFieldsProtectedByTags:
         expected_protected_fields: List[str],
     ):
         assert set(
-            _get_fields_protected_by_tags(
+            fields_protected_by_tags(
                 tags=tags,
                 field_names=field_names,
             )
@@ -1019,7 +1075,7 @@ class TestGetFieldsProtectedByTags:
     def test_try_to_protect_not_existing_field(self):
         # When trying to protect a field that does not exist, it should be ignored.
         assert set(
-            _get_fields_protected_by_tags(
+            fields_protected_by_tags(
                 tags=[
                     f"{TAG_FOR_PROTECTING_FIELDS}::Text",
                     f"{TAG_FOR_PROTECTING_FIELDS}::Front",
@@ -3447,6 +3503,39 @@ class TestAnkiHubDBAnkiHubNidsToAnkiIds:
         }
 
 
+class TestAnkiHubDBAnkiNidsToAnkiHubNids:
+    def test_anki_nids_to_ankihub_nids(
+        self,
+        ankihub_db: _AnkiHubDB,
+        ankihub_basic_note_type: NotetypeDict,
+        next_deterministic_uuid: Callable[[], uuid.UUID],
+    ):
+        ah_did = next_deterministic_uuid()
+        ankihub_db.upsert_note_type(
+            ankihub_did=ah_did,
+            note_type=ankihub_basic_note_type,
+        )
+
+        ah_nid = next_deterministic_uuid()
+        existing_anki_nid = NoteId(1)
+        note = NoteInfoFactory.create(
+            anki_nid=existing_anki_nid,
+            ah_nid=ah_nid,
+            mid=ankihub_basic_note_type["id"],
+        )
+        ankihub_db.upsert_notes_data(
+            ankihub_did=ah_did,
+            notes_data=[note],
+        )
+
+        not_existing_anki_nid = NoteId(2)
+
+        assert ankihub_db.anki_nids_to_ankihub_nids(anki_nids=[existing_anki_nid, not_existing_anki_nid]) == {
+            existing_anki_nid: ah_nid,
+            not_existing_anki_nid: None,
+        }
+
+
 class TestAnkiHubDBRemoveNotes:
     def test_remove_notes(
         self,
@@ -3594,6 +3683,7 @@ class TestAnkiHubDBMediaNamesForAnkiHubDeck:
                 ),
             ],
         )
+        self.note_info = note_info
         self.ah_did = next_deterministic_uuid()
         ankihub_db.upsert_note_type(ankihub_did=self.ah_did, note_type=ankihub_basic_note_type)
         ankihub_db.upsert_notes_data(self.ah_did, [note_info])
@@ -3613,6 +3703,43 @@ class TestAnkiHubDBMediaNamesForAnkiHubDeck:
                 "_test4.jpg",
             }
 
+    def test_media_references_are_updated_when_note_is_updated(
+        self,
+        anki_session: AnkiSession,
+        ankihub_db: _AnkiHubDB,
+    ):
+        with anki_session.profile_loaded():
+            note_info = self.note_info
+            note_info.fields = [
+                Field(value="test <img src='test5.jpg'>", name="Front"),
+                Field(value="", name="Back"),
+            ]
+            ankihub_db.upsert_notes_data(self.ah_did, [note_info])
+
+            assert ankihub_db.media_names_for_ankihub_deck(self.ah_did) == {"test5.jpg", "_test4.jpg"}
+
+    def test_media_references_of_deleted_notes_are_ignored(
+        self,
+        anki_session: AnkiSession,
+        ankihub_db: _AnkiHubDB,
+    ):
+        with anki_session.profile_loaded():
+            note_info = self.note_info
+            note_info.last_update_type = SuggestionType.DELETE
+            ankihub_db.upsert_notes_data(self.ah_did, [note_info])
+
+            assert ankihub_db.media_names_for_ankihub_deck(self.ah_did) == set()
+
+    def test_media_references_of_removed_notes_are_removed(
+        self,
+        anki_session: AnkiSession,
+        ankihub_db: _AnkiHubDB,
+    ):
+        with anki_session.profile_loaded():
+            ankihub_db.remove_notes([self.note_info.ah_nid])
+
+            assert NoteMedia.select().count() == 0
+
 
 @pytest.mark.parametrize(
     "referenced_on_accepted_note,exists_on_s3,download_enabled",
@@ -3760,6 +3887,177 @@ class TestAnkiHubDBDeckMedia:
         assert modified_in_db == deck_media_from_client.modified.isoformat()
 
 
+class TestAnkiHubDBMediaFileHashes:
+    def test_returns_hashes_of_existing_files(self, ankihub_db: _AnkiHubDB, tmp_path: Path):
+        media_path = tmp_path / "test1.jpg"
+        media_path.write_bytes(b"test1")
+        missing_media_path = tmp_path / "missing.jpg"
+
+        assert ankihub_db.media_file_hashes([media_path, missing_media_path, tmp_path]) == {
+            media_path: hashlib.md5(b"test1").hexdigest()
+        }
+
+    def test_unchanged_file_is_not_read_again(self, ankihub_db: _AnkiHubDB, tmp_path: Path, mocker: MockerFixture):
+        media_path = tmp_path / "test1.jpg"
+        media_path.write_bytes(b"test1")
+        md5_file_content_hash_spy = mocker.spy(ankihub.db.db, "md5_file_content_hash")
+
+        first_result = ankihub_db.media_file_hashes([media_path])
+        second_result = ankihub_db.media_file_hashes([media_path])
+
+        assert first_result == second_result == {media_path: hashlib.md5(b"test1").hexdigest()}
+        md5_file_content_hash_spy.assert_called_once_with(media_path)
+
+    def test_changed_file_is_hashed_again(self, ankihub_db: _AnkiHubDB, tmp_path: Path):
+        media_path = tmp_path / "test1.jpg"
+        media_path.write_bytes(b"test1")
+        ankihub_db.media_file_hashes([media_path])
+
+        # Change the content without changing the size, but with a different modification time
+        media_path.write_bytes(b"test2")
+        stat_result = media_path.stat()
+        os.utime(media_path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 1_000_000_000))
+
+        assert ankihub_db.media_file_hashes([media_path]) == {media_path: hashlib.md5(b"test2").hexdigest()}
+
+    def test_cached_hash_of_removed_file_is_deleted(self, ankihub_db: _AnkiHubDB, tmp_path: Path):
+        media_path = tmp_path / "test1.jpg"
+        media_path.write_bytes(b"test1")
+        ankihub_db.media_file_hashes([media_path])
+        assert MediaFileHash.select().count() == 1
+
+        media_path.unlink()
+
+        assert ankihub_db.media_file_hashes([media_path]) == {}
+        assert MediaFileHash.select().count() == 0
+
+
+class TestAnkiHubDBNoteTags:
+    @pytest.fixture(autouse=True)
+    def setup(
+        self,
+        ankihub_db: _AnkiHubDB,
+        ankihub_basic_note_type: NotetypeDict,
+        next_deterministic_uuid: Callable[[], uuid.UUID],
+    ):
+        self.ah_did = next_deterministic_uuid()
+        self.note_info = NoteInfoFactory.create(
+            mid=ankihub_basic_note_type["id"],
+            tags=["tag1", f"{SUBDECK_TAG}::A::B"],
+        )
+        ankihub_db.upsert_note_type(ankihub_did=self.ah_did, note_type=ankihub_basic_note_type)
+        ankihub_db.upsert_notes_data(self.ah_did, [self.note_info])
+
+    def test_basic(self):
+        assert set(NoteTag.select(NoteTag.tag).objects(flat)) == {"tag1", f"{SUBDECK_TAG}::A::B"}
+        assert deck_contains_subdeck_tags(self.ah_did)
+
+    def test_tags_are_updated_when_note_is_updated(self, ankihub_db: _AnkiHubDB):
+        self.note_info.tags = ["tag2"]
+        ankihub_db.upsert_notes_data(self.ah_did, [self.note_info])
+
+        assert set(NoteTag.select(NoteTag.tag).objects(flat)) == {"tag2"}
+        assert not deck_contains_subdeck_tags(self.ah_did)
+
+    def test_tags_of_deleted_notes_are_ignored(self, ankihub_db: _AnkiHubDB):
+        self.note_info.last_update_type = SuggestionType.DELETE
+        ankihub_db.upsert_notes_data(self.ah_did, [self.note_info])
+
+        assert NoteTag.select().count() == 0
+        assert not deck_contains_subdeck_tags(self.ah_did)
+
+    def test_tags_of_removed_notes_are_removed(self, ankihub_db: _AnkiHubDB):
+        ankihub_db.remove_notes([self.note_info.ah_nid])
+
+        assert NoteTag.select().count() == 0
+
+
+class TestNoteFieldsField:
+    @pytest.mark.parametrize(
+        "fields",
+        [
+            {"Front": 'a "quoted" <b>value</b>', "Back": ""},
+            {"Text": "ü\nsecond line"},
+            {},
+            None,
+        ],
+    )
+    def test_round_trip(
+        self,
+        ankihub_db: _AnkiHubDB,
+        next_deterministic_uuid: Callable[[], uuid.UUID],
+        fields: Optional[Dict[str, str]],
+    ):
+        ah_nid = next_deterministic_uuid()
+        AnkiHubNote.insert(ankihub_note_id=ah_nid, fields=fields).execute()
+
+        assert AnkiHubNote.get(ankihub_note_id=ah_nid).fields == fields
+
+    def test_db_value(self):
+        assert AnkiHubNote.fields.db_value({"Front": "a", "Back": "b"}) == "Front\x1fa\x1fBack\x1fb"
+
+
+class TestAnkiHubDBQueryPlans:
+    """Frequent queries on the notes and note_tags tables should use indexes instead of scanning the whole table."""
+
+    @pytest.mark.parametrize(
+        "query_name, expected_index_name",
+        [
+            ("anki_nids_for_ankihub_deck", "notes_ankihub_deck_id_is_deleted_anki_note_id"),
+            ("deck_contains_subdeck_tags", "notetag_ankihub_deck_id_tag"),
+            ("ankihub_dids_of_decks_with_missing_values", "notes_with_missing_values_ankihub_deck_id_is_deleted"),
+        ],
+    )
+    def test_query_uses_index(
+        self,
+        ankihub_db: _AnkiHubDB,
+        next_deterministic_uuid: Callable[[], uuid.UUID],
+        mocker: MockerFixture,
+        query_name: str,
+        expected_index_name: str,
+    ):
+        ah_did = next_deterministic_uuid()
+        queries = {
+            "anki_nids_for_ankihub_deck": lambda: ankihub_db.anki_nids_for_ankihub_deck(ah_did),
+            "deck_contains_subdeck_tags": lambda: deck_contains_subdeck_tags(ah_did),
+            "ankihub_dids_of_decks_with_missing_values": lambda: ankihub_db.ankihub_dids_of_decks_with_missing_values(),
+        }
+
+        execute_sql_spy = mocker.spy(ankihub_db.db, "execute_sql")
+        queries[query_name]()
+        sql, params = execute_sql_spy.call_args.args[:2]
+
+        query_plan = ankihub_db.db.execute_sql(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        assert f"INDEX {expected_index_name}" in " ".join(row[3] for row in query_plan)
+
+    def test_is_deleted(
+        self,
+        ankihub_db: _AnkiHubDB,
+        ankihub_basic_note_type: NotetypeDict,
+        next_deterministic_uuid: Callable[[], uuid.UUID],
+    ):
+        ah_did = next_deterministic_uuid()
+        ankihub_db.upsert_note_type(ankihub_did=ah_did, note_type=ankihub_basic_note_type)
+
+        note_info = NoteInfoFactory.create(mid=ankihub_basic_note_type["id"])
+        deleted_note_info = NoteInfoFactory.create(
+            mid=ankihub_basic_note_type["id"],
+            last_update_type=SuggestionType.DELETE,
+        )
+        ankihub_db.upsert_notes_data(ankihub_did=ah_did, notes_data=[note_info, deleted_note_info])
+
+        assert dict(AnkiHubNote.select(AnkiHubNote.ankihub_note_id, AnkiHubNote.is_deleted).tuples()) == {
+            note_info.ah_nid: False,
+            deleted_note_info.ah_nid: True,
+        }
+        assert ankihub_db.anki_nids_for_ankihub_deck(ah_did) == [note_info.anki_nid]
+
+        # The column is updated when the note is upserted again
+        deleted_note_info.last_update_type = SuggestionType.UPDATED_CONTENT
+        ankihub_db.upsert_notes_data(ankihub_did=ah_did, notes_data=[deleted_note_info])
+        assert not AnkiHubNote.get(ankihub_note_id=deleted_note_info.ah_nid).is_deleted
+
+
 class TestErrorHandling:
     def test_contains_path_to_this_addon(self):
         # Assert that the function returns True when the input string contains the
@@ -3969,6 +4267,54 @@ class TestRateLimitedDecorator:
         assert execution_counter == 11
 
 
+class TestPrefetching:
+    def test_yields_all_items_in_order(self):
+        with prefetching(range(10), max_prefetched=2) as items:
+            assert list(items) == list(range(10))
+
+    def test_produces_next_item_while_consumer_processes_current_one(self):
+        produced = []
+
+        def produce() -> Generator[int, None, None]:
+            for i in range(2):
+                produced.append(i)
+                yield i
+
+        with prefetching(produce()) as items:
+            assert next(items) == 0
+            # The second item is produced in the background without the consumer asking for it
+            for _ in range(50):
+                if len(produced) == 2:
+                    break
+                time.sleep(0.01)
+            assert produced == [0, 1]
+            assert next(items) == 1
+
+    def test_exception_is_raised_to_consumer(self):
+        def produce() -> Generator[int, None, None]:
+            yield 1
+            raise ValueError("test")
+
+        with prefetching(produce()) as items:
+            assert next(items) == 1
+            with pytest.raises(ValueError, match="test"):
+                next(items)
+
+    def test_producer_stops_when_context_is_left(self):
+        closed = threading.Event()
+
+        def produce() -> Generator[int, None, None]:
+            try:
+                yield from itertools.count()
+            finally:
+                closed.set()
+
+        with prefetching(produce()) as items:
+            assert next(items) == 0
+
+        assert closed.wait(timeout=5)
+
+
 def test_error_dialog(qtbot: QtBot, mocker: MockerFixture):
     try:
         raise Exception("test")
@@ -4740,6 +5086,17 @@ class TestMediaNameExtraction:
         assert list(result)[0].startswith("latex-")
         assert list(result)[0].endswith(".svg" if svg else ".png")
 
+    def test_extracts_media_from_multiple_fields(self):
+        """Media references in multiple fields are extracted at once, also when the results are cached."""
+        from ankihub.common_utils import get_media_names_from_note_fields
+
+        fields = ['<IMG SRC="image.png">', "[sound:audio.mp3]", "[LaTeX]x^2[/LaTeX]", "no media", ""]
+        for svg in [False, True, False]:
+            result = get_media_names_from_note_fields(fields, {"latexsvg": svg})
+            latex_names = {name for name in result if name.startswith("latex-")}
+            assert result - latex_names == {"image.png", "audio.mp3"}
+            assert [Path(name).suffix for name in latex_names] == [".svg" if svg else ".png"]
+
 
 class TestGetReviewCountForAHDeckSince:
     @pytest.mark.parametrize(
@@ -4956,6 +5313,52 @@ class TestSendReviewData:
             assert_datetime_equal_ignore_milliseconds(card_review_data.first_card_review_at, first_review_time)
             assert_datetime_equal_ignore_milliseconds(card_review_data.last_card_review_at, second_review_time)
 
+    def test_with_reviews_for_multiple_decks(
+        self,
+        anki_session_with_addon_data: AnkiSession,
+        install_ah_deck: InstallAHDeck,
+        import_ah_note: ImportAHNote,
+        mocker: MockerFixture,
+    ) -> None:
+        with anki_session_with_addon_data.profile_loaded():
+            ah_did_1 = install_ah_deck()
+            note_info_1 = import_ah_note(ah_did=ah_did_1)
+
+            ah_did_2 = install_ah_deck()
+            note_info_2 = import_ah_note(ah_did=ah_did_2)
+
+            # A deck without reviews is not included in the data.
+            install_ah_deck()
+
+            now = datetime.now()
+            record_review_for_anki_nid(NoteId(note_info_1.anki_nid), now - timedelta(days=10))
+            record_review_for_anki_nid(NoteId(note_info_1.anki_nid), now - timedelta(days=1))
+            record_review_for_anki_nid(NoteId(note_info_2.anki_nid), now - timedelta(days=40))
+
+            send_card_review_data_mock = mocker.patch.object(AnkiHubClient, "send_card_review_data")
+
+            send_review_data()
+
+            review_data_by_ah_did: Dict[uuid.UUID, CardReviewData] = {
+                data.ah_did: data for data in send_card_review_data_mock.call_args[0][0]
+            }
+            assert review_data_by_ah_did.keys() == {ah_did_1, ah_did_2}
+
+            card_review_data_1 = review_data_by_ah_did[ah_did_1]
+            assert card_review_data_1.total_card_reviews_last_7_days == 1
+            assert card_review_data_1.total_card_reviews_last_30_days == 2
+            assert_datetime_equal_ignore_milliseconds(
+                card_review_data_1.first_card_review_at, now - timedelta(days=10)
+            )
+            assert_datetime_equal_ignore_milliseconds(card_review_data_1.last_card_review_at, now - timedelta(days=1))
+
+            card_review_data_2 = review_data_by_ah_did[ah_did_2]
+            assert card_review_data_2.total_card_reviews_last_7_days == 0
+            assert card_review_data_2.total_card_reviews_last_30_days == 0
+            assert_datetime_equal_ignore_milliseconds(
+                card_review_data_2.first_card_review_at, now - timedelta(days=40)
+            )
+
     def test_without_reviews(
         self,
         anki_session_with_addon_data: AnkiSession,
@@ -4977,6 +5380,29 @@ class TestSendReviewData:
             review_data_list = send_card_review_data_mock.call_args[0][0]
             assert review_data_list == []
 
+    def test_send_review_data_from_background_thread(
+        self,
+        anki_session_with_addon_data: AnkiSession,
+        install_ah_deck: InstallAHDeck,
+        import_ah_note: ImportAHNote,
+        mocker: MockerFixture,
+    ) -> None:
+        # The review data is read and sent in a background task after syncing
+        with anki_session_with_addon_data.profile_loaded():
+            ah_did = install_ah_deck()
+            note_info = import_ah_note(ah_did=ah_did)
+            record_review_for_anki_nid(NoteId(note_info.anki_nid), datetime.now())
+
+            send_card_review_data_mock = mocker.patch.object(AnkiHubClient, "send_card_review_data")
+
+            thread = threading.Thread(target=send_review_data)
+            thread.start()
+            thread.join()
+
+            [card_review_data] = send_card_review_data_mock.call_args[0][0]
+            assert card_review_data.ah_did == ah_did
+            assert card_review_data.total_card_reviews_last_7_days == 1
+
 
 def test_clear_empty_cards(anki_session_with_addon_data: AnkiSession, qtbot: QtBot):
     with anki_session_with_addon_data.profile_loaded():
@@ -5175,6 +5601,92 @@ class TestPrivateConfigMigrations:
             f.write(json.dumps(private_config_dict, indent=4, sort_keys=True))
 
 
+class TestBatchedPrivateConfigUpdates:
+    def test_private_config_is_written_once(self, anki_session_with_addon_data: AnkiSession, mocker: MockerFixture):
+        with anki_session_with_addon_data.profile_loaded():
+            write_private_config_spy = mocker.spy(config, "_write_private_config")
+            with config.batched_private_config_updates():
+                config.set_feature_flags({"flag": True})
+                with config.batched_private_config_updates():
+                    config.set_user_details({"id": 1})
+                assert write_private_config_spy.call_count == 0
+
+            assert write_private_config_spy.call_count == 1
+            assert not list(config._private_config_path.parent.glob("*.tmp"))
+
+            # Reload the private config from its file
+            config.setup_private_config()
+
+            assert config.get_feature_flags() == {"flag": True}
+            assert config.get_user_details() == {"id": 1}
+
+    def test_private_config_is_written_when_exception_is_raised(
+        self, anki_session_with_addon_data: AnkiSession, mocker: MockerFixture
+    ):
+        with anki_session_with_addon_data.profile_loaded():
+            write_private_config_spy = mocker.spy(config, "_write_private_config")
+            with pytest.raises(ValueError):
+                with config.batched_private_config_updates():
+                    config.set_feature_flags({"flag": True})
+                    raise ValueError()
+
+            assert write_private_config_spy.call_count == 1
+
+    def test_private_config_is_not_written_without_updates(
+        self, anki_session_with_addon_data: AnkiSession, mocker: MockerFixture
+    ):
+        with anki_session_with_addon_data.profile_loaded():
+            write_private_config_spy = mocker.spy(config, "_write_private_config")
+            with config.batched_private_config_updates():
+                pass
+
+            assert write_private_config_spy.call_count == 0
+
+
+class TestRunStartupTasks:
+    def test_task_is_skipped_when_fingerprint_is_unchanged(self, anki_session_with_addon_data: AnkiSession):
+        with anki_session_with_addon_data.profile_loaded():
+            run_mock = Mock()
+            fingerprint = "fingerprint"
+            task = StartupTask(name="task", run=run_mock, fingerprint=lambda: fingerprint)
+
+            run_startup_tasks([task])
+            run_startup_tasks([task])
+            assert run_mock.call_count == 1
+
+            fingerprint = "changed fingerprint"
+            run_startup_tasks([task])
+            assert run_mock.call_count == 2
+
+    def test_fingerprint_is_recorded_after_task_has_run(self, anki_session_with_addon_data: AnkiSession):
+        with anki_session_with_addon_data.profile_loaded():
+            # The task changes its own inputs, this shouldn't cause it to run again.
+            inputs = ["input"]
+            run_mock = Mock(side_effect=lambda: inputs.append("output"))
+            task = StartupTask(name="task", run=run_mock, fingerprint=lambda: str(inputs))
+
+            run_startup_tasks([task])
+            run_startup_tasks([task])
+            assert run_mock.call_count == 1
+
+    def test_background_task(self, anki_session_with_addon_data: AnkiSession, qtbot: QtBot):
+        with anki_session_with_addon_data.profile_loaded():
+            main_thread = threading.current_thread()
+            task_threads: List[threading.Thread] = []
+            task = StartupTask(
+                name="task",
+                run=lambda: task_threads.append(threading.current_thread()),
+                fingerprint=lambda: "fingerprint",
+                in_background=True,
+            )
+
+            run_startup_tasks([task])
+
+            qtbot.wait_until(lambda: config.startup_task_fingerprint("task") == "fingerprint")
+            assert len(task_threads) == 1
+            assert task_threads[0] != main_thread
+
+
 class TestOptionalTagSuggestionDialog:
     def test_submit_tags_for_validated_groups(
         self,
@@ -5467,6 +5979,71 @@ class TestAnkiHubDBMigrations:
             assert set(index_definitions) == set(expected_index_definitions)
             assert ankihub_db.database_path != migration_test_db_path  # sanity check
 
+    def test_migrate_from_schema_version_15(
+        self,
+        ankihub_db: _AnkiHubDB,
+        ankihub_basic_note_type: NotetypeDict,
+        next_deterministic_uuid: Callable[[], uuid.UUID],
+    ):
+        """Test that the changes of the schema versions 16 to 18 are applied to a database with schema version 15,
+        so that the table and index definitions are the same as for a new database."""
+        ah_did = next_deterministic_uuid()
+        ankihub_db.upsert_note_type(ankihub_did=ah_did, note_type=ankihub_basic_note_type)
+        note_info = NoteInfoFactory.create(mid=ankihub_basic_note_type["id"], tags=["tag1", "tag2"])
+        deleted_note_info = NoteInfoFactory.create(
+            mid=ankihub_basic_note_type["id"],
+            tags=["tag3"],
+            last_update_type=SuggestionType.DELETE,
+        )
+        ankihub_db.upsert_notes_data(ankihub_did=ah_did, notes_data=[note_info, deleted_note_info])
+        fields_by_ah_nid = dict(AnkiHubNote.select(AnkiHubNote.ankihub_note_id, AnkiHubNote.fields).tuples())
+
+        table_definitions_sql = "SELECT sql FROM sqlite_master WHERE type='table'"
+        index_definitions_sql = "SELECT sql FROM sqlite_master WHERE type='index'"
+
+        with tempfile.TemporaryDirectory() as f:
+            # Copy the database and revert the changes of the schema versions 16 to 18
+            migration_test_db_path = Path(f) / "test.db"
+            conn = sqlite3.Connection(ankihub_db.database_path)
+            expected_table_definitions = conn.execute(table_definitions_sql).fetchall()
+            expected_index_definitions = conn.execute(index_definitions_sql).fetchall()
+            conn.execute("VACUUM INTO ?", (str(migration_test_db_path),))
+            conn.close()
+
+            conn = sqlite3.Connection(migration_test_db_path)
+            conn.execute("DROP INDEX notes_ankihub_deck_id_is_deleted_anki_note_id")
+            conn.execute("DROP TABLE note_tags")
+            conn.execute("DROP INDEX notes_with_missing_values_ankihub_deck_id_is_deleted")
+            conn.execute("ALTER TABLE notes DROP COLUMN is_deleted")
+            conn.executemany(
+                "UPDATE notes SET fields = ? WHERE ankihub_note_id = ?",
+                [(json.dumps(fields), str(ah_nid)) for ah_nid, fields in fields_by_ah_nid.items()],
+            )
+            conn.execute("PRAGMA user_version = 15")
+            conn.commit()
+            conn.close()
+
+            # Apply the migrations
+            migration_test_db = _AnkiHubDB()
+            migration_test_db.setup_and_migrate(db_path=migration_test_db_path)
+
+            assert AnkiHubNote.get(ankihub_note_id=deleted_note_info.ah_nid).is_deleted
+            assert (
+                dict(AnkiHubNote.select(AnkiHubNote.ankihub_note_id, AnkiHubNote.fields).tuples()) == fields_by_ah_nid
+            )
+            assert set(NoteTag.select(NoteTag.ankihub_note_id, NoteTag.tag).tuples()) == {
+                (note_info.ah_nid, "tag1"),
+                (note_info.ah_nid, "tag2"),
+            }
+
+            conn = sqlite3.Connection(migration_test_db_path)
+            table_definitions = conn.execute(table_definitions_sql).fetchall()
+            index_definitions = conn.execute(index_definitions_sql).fetchall()
+            conn.close()
+
+            assert set(table_definitions) == set(expected_table_definitions)
+            assert set(index_definitions) == set(expected_index_definitions)
+
 
 class TestDatadogLogHandler:
     @pytest.mark.parametrize("send_logs_to_datadog_feature_flag", [True, False])
@@ -5720,6 +6297,37 @@ class TestNoteTypeWithUpdatedTemplates:
             assert old_template2_content in updated_note_type["tmpls"][1]["qfmt"]
 
 
+class TestModifyNoteTypeTemplates:
+    def test_note_type_is_only_saved_when_templates_change(
+        self, anki_session_with_addon_data: AnkiSession, mocker: MockerFixture
+    ):
+        with anki_session_with_addon_data.profile_loaded():
+            note_type = copy.deepcopy(aqt.mw.col.models.by_name("Basic"))
+            note_type["id"] = 0
+            mid = NotetypeId(aqt.mw.col.models.add_dict(note_type).id)
+
+            update_dict_spy = mocker.spy(aqt.mw.col.models, "update_dict")
+
+            modify_note_type_templates([mid])
+            assert update_dict_spy.call_count == 1
+            assert ANKIHUB_SNIPPET_MARKER in aqt.mw.col.models.get(mid)["tmpls"][0]["afmt"]
+
+            # The templates are already up to date
+            modify_note_type_templates([mid])
+            modify_note_type_templates([mid])
+            assert update_dict_spy.call_count == 1
+
+            # The templates are changed by the user
+            note_type = aqt.mw.col.models.get(mid)
+            note_type["tmpls"][0]["afmt"] = "{{Back}}"
+            aqt.mw.col.models.update_dict(note_type)
+            update_dict_spy.reset_mock()
+
+            modify_note_type_templates([mid])
+            assert update_dict_spy.call_count == 1
+            assert ANKIHUB_SNIPPET_MARKER in aqt.mw.col.models.get(mid)["tmpls"][0]["afmt"]
+
+
 def test_get_daily_review_data_since_last_sync(mocker, anki_session_with_addon_data):
     with anki_session_with_addon_data.profile_loaded():
         last_sync = datetime.now() - timedelta(days=2)
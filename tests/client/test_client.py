@@ -1,6 +1,7 @@
 import base64
 import dataclasses
 import gzip
+import io
 import json
 import os
 import subprocess
@@ -53,6 +54,12 @@ from ankihub.ankihub_client import (
     get_media_names_from_notes_data,
     get_media_names_from_suggestion,
 )
+from ankihub.ankihub_client.ankihub_client import (
+    MEDIA_DOWNLOAD_MAX_CHUNK_SIZE,
+    MEDIA_DOWNLOAD_MAX_QUEUED,
+    MEDIA_DOWNLOAD_TEMP_FILE_PREFIX,
+    _media_path_chunks,
+)
 from ankihub.ankihub_client.models import (
     ANKIHUB_DATETIME_FORMAT_STR,
     CardReviewData,
@@ -552,6 +559,64 @@ class TestDownloadDeck:
         assert notes_data[0].tags == ["asdf"]
 
 
+class TestDownloadDeckInBatches:
+    @pytest.mark.parametrize("gzipped", [True, False])
+    def test_yields_notes_in_batches(
+        self,
+        requests_mock: Mocker,
+        mocker: MockerFixture,
+        next_deterministic_uuid: Callable[[], uuid.UUID],
+        gzipped: bool,
+    ):
+        header, note_row = DECK_CSV.read_text().splitlines()
+        ah_nids = [next_deterministic_uuid() for _ in range(5)]
+        csv_content = "\r\n".join(
+            [header]
+            + [
+                note_row.replace("fe39b7ce-14a5-4efa-b517-bd87c4cc9ace", str(ah_nid)).replace(
+                    "1662901432199", str(1662901432199 + i)
+                )
+                for i, ah_nid in enumerate(ah_nids)
+            ]
+        ).encode("utf-8")
+        content = gzip.compress(csv_content) if gzipped else csv_content
+        deck_file_presigned_url = f"{DEFAULT_S3_BUCKET_URL}/deck.csv{'.gz' if gzipped else ''}?auth=123"
+        requests_mock.get(deck_file_presigned_url, content=content, headers={"content-length": str(len(content))})
+
+        # Use a tiny chunk size so that lines, line endings and gzip data are split across chunks
+        mocker.patch("ankihub.ankihub_client.ankihub_client.DECK_DOWNLOAD_CHUNK_SIZE", 7)
+
+        client = AnkiHubClient(local_media_dir_path_cb=lambda: TEST_MEDIA_PATH)
+        progress_cb = Mock()
+        batches = list(
+            client.download_deck_in_batches(
+                ah_did=ID_OF_DECK_OF_USER_TEST1,
+                s3_presigned_url=deck_file_presigned_url,
+                download_progress_cb=progress_cb,
+                batch_size=2,
+            )
+        )
+
+        assert [len(batch) for batch in batches] == [2, 2, 1]
+        notes_data = [note_data for batch in batches for note_data in batch]
+        assert [note_data.ah_nid for note_data in notes_data] == ah_nids
+        assert all(note_data.tags == ["asdf"] for note_data in notes_data)
+        assert progress_cb.call_args_list[-1].args == (100,)
+
+    def test_with_truncated_gzip_file(self, requests_mock: Mocker):
+        deck_file_presigned_url = f"{DEFAULT_S3_BUCKET_URL}/deck.csv.gz?auth=123"
+        requests_mock.get(deck_file_presigned_url, content=DECK_CSV_GZ.read_bytes()[:-10])
+
+        client = AnkiHubClient(local_media_dir_path_cb=lambda: TEST_MEDIA_PATH)
+        with pytest.raises(EOFError):
+            list(
+                client.download_deck_in_batches(
+                    ah_did=ID_OF_DECK_OF_USER_TEST1,
+                    s3_presigned_url=deck_file_presigned_url,
+                )
+            )
+
+
 def create_note_on_ankihub_and_assert(client, new_note_suggestion, uuid_of_deck: uuid.UUID):
     # utility function meant to be used in tests for creating a note with known values on ankihub
     # asserts that the note was created correctly
@@ -817,6 +882,43 @@ class TestCreateSuggestionsInBulk:
             errors_by_nid
         ) == 1 and "Suggestion fields and tags don't have any changes to the original note" in str(errors_by_nid)
 
+    def test_suggestions_are_sent_in_pages(
+        self,
+        new_note_suggestion: NewNoteSuggestion,
+        mocker: MockerFixture,
+    ):
+        client = AnkiHubClient(local_media_dir_path_cb=lambda: TEST_MEDIA_PATH)
+        mocker.patch("ankihub.ankihub_client.ankihub_client.SUGGESTIONS_BULK_PAGE_SIZE", 2)
+
+        new_note_suggestions = []
+        for anki_nid in range(1, 6):
+            suggestion = deepcopy(new_note_suggestion)
+            suggestion.anki_nid = anki_nid
+            new_note_suggestions.append(suggestion)
+
+        def send_request(*args, **kwargs) -> Mock:
+            # The server returns a validation error for the suggestion with anki_nid 3
+            response = Mock()
+            response.status_code = 200
+            response.json = lambda: [
+                {"validation_errors": ["error"]} if suggestion["anki_id"] == 3 else {}
+                for suggestion in kwargs["json"]["suggestions"]
+            ]
+            return response
+
+        send_request_mock = mocker.patch.object(client, "_send_request", side_effect=send_request)
+
+        errors_by_nid = client.create_suggestions_in_bulk(new_note_suggestions=new_note_suggestions)
+
+        # The errors of all pages are merged
+        assert errors_by_nid == {3: ["error"]}
+
+        sent_anki_nids = [
+            [suggestion["anki_id"] for suggestion in call.kwargs["json"]["suggestions"]]
+            for call in send_request_mock.call_args_list
+        ]
+        assert sent_anki_nids == [[1, 2], [3, 4], [5]]
+
 
 class TestDeckSubscriptions:
     @pytest.mark.vcr()
@@ -1023,6 +1125,43 @@ class TestGetDeckUpdates:
         assert deck_updates.notes == [note1_from_json, note2_from_csv]
         assert deck_updates.latest_update == latest_update
 
+    def test_get_deck_updates_chunks_with_external_notes_url(self, mocker: MockerFixture):
+        client = AnkiHubClient(local_media_dir_path_cb=lambda: TEST_MEDIA_PATH)
+
+        latest_update = datetime.now(timezone.utc)
+        note1_from_csv = NoteInfoFactory.create()
+        note2_from_csv = NoteInfoFactory.create()
+        note1_from_json = NoteInfoFactory.create(ah_nid=note1_from_csv.ah_nid)
+
+        response_with_csv_notes = self._deck_updates_response_mock_with_csv_notes(
+            notes=[note1_from_csv, note2_from_csv],
+            latest_update=latest_update,
+            mocker=mocker,
+        )
+        response_with_json_notes = self._deck_updates_response_mock_with_json_notes(
+            notes=[note1_from_json],
+            latest_update=latest_update,
+        )
+        send_request_mock = mocker.patch.object(
+            client, "_send_request", side_effect=[response_with_csv_notes, response_with_json_notes]
+        )
+
+        chunks = client.get_deck_updates_chunks(ID_OF_DECK_OF_USER_TEST1, since=None)
+
+        # The pages are only requested when the chunks are consumed
+        csv_chunk = next(chunks)
+        assert send_request_mock.call_count == 1
+        assert csv_chunk.from_csv
+        assert csv_chunk.notes == [note1_from_csv, note2_from_csv]
+
+        # The chunks with more recent notes come after the CSV chunks
+        json_chunk = next(chunks)
+        assert not json_chunk.from_csv
+        assert json_chunk.notes == [note1_from_json]
+        assert json_chunk.latest_update == latest_update
+
+        assert next(chunks, None) is None
+
     @pytest.mark.vcr()
     def test_get_empty_deck_updates(self, authorized_client_for_user_test1: AnkiHubClient, mocker: MockerFixture):
         client = authorized_client_for_user_test1
@@ -1080,8 +1219,8 @@ class TestGetDeckUpdates:
 
         # Mock the download of the deck from the external_notes_url
         mocker.patch(
-            "ankihub.ankihub_client.ankihub_client.AnkiHubClient.download_deck",
-            return_value=notes,
+            "ankihub.ankihub_client.ankihub_client.AnkiHubClient.download_deck_in_batches",
+            return_value=[notes],
         )
         return result
 
@@ -1559,6 +1698,148 @@ class TestDownloadMedia:
 
             assert len(calls) == len(media_names)
 
+    def test_download_is_retried_after_connection_error(
+        self,
+        requests_mock: Mocker,
+        mocker: MockerFixture,
+        next_deterministic_uuid: Callable[[], uuid.UUID],
+    ):
+        mocker.patch("time.sleep")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            client = AnkiHubClient(local_media_dir_path_cb=lambda: Path(temp_dir))
+
+            deck_id = next_deterministic_uuid()
+            requests_mock.get(
+                f"{DEFAULT_S3_BUCKET_URL}/deck_assets/{deck_id}/image.png",
+                [
+                    {"exc": requests.exceptions.ConnectionError},
+                    {"content": b"test data"},
+                ],
+            )
+            futures: List[Future] = []
+            client.download_media(media_names=["image.png"], deck_id=deck_id, on_downloaded_file=futures.append)
+
+            futures[0].result()
+            assert requests_mock.call_count == 2
+            assert (Path(temp_dir) / "image.png").read_bytes() == b"test data"
+            assert os.listdir(temp_dir) == ["image.png"]
+
+    def test_download_is_retried_after_server_error(
+        self,
+        requests_mock: Mocker,
+        mocker: MockerFixture,
+        next_deterministic_uuid: Callable[[], uuid.UUID],
+    ):
+        mocker.patch("time.sleep")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            client = AnkiHubClient(local_media_dir_path_cb=lambda: Path(temp_dir))
+
+            deck_id = next_deterministic_uuid()
+            requests_mock.get(
+                f"{DEFAULT_S3_BUCKET_URL}/deck_assets/{deck_id}/image.png",
+                [
+                    {"status_code": 503},
+                    {"content": b"test data"},
+                ],
+            )
+            futures: List[Future] = []
+            client.download_media(media_names=["image.png"], deck_id=deck_id, on_downloaded_file=futures.append)
+
+            futures[0].result()
+            assert requests_mock.call_count == 2
+            assert (Path(temp_dir) / "image.png").read_bytes() == b"test data"
+
+    @pytest.mark.parametrize(
+        "status_code, content, expected_file_content",
+        [
+            # The server sends the rest of the file
+            (206, b"data", b"test data"),
+            # The server ignores the Range header and sends the whole file
+            (200, b"test data", b"test data"),
+        ],
+    )
+    def test_partial_download_is_resumed(
+        self,
+        requests_mock: Mocker,
+        next_deterministic_uuid: Callable[[], uuid.UUID],
+        status_code: int,
+        content: bytes,
+        expected_file_content: bytes,
+    ):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            client = AnkiHubClient(local_media_dir_path_cb=lambda: Path(temp_dir))
+
+            # Simulate a partially downloaded file
+            (Path(temp_dir) / f"{MEDIA_DOWNLOAD_TEMP_FILE_PREFIX}image.png").write_bytes(b"test ")
+
+            deck_id = next_deterministic_uuid()
+            requests_mock.get(
+                f"{DEFAULT_S3_BUCKET_URL}/deck_assets/{deck_id}/image.png",
+                status_code=status_code,
+                content=content,
+            )
+            client.download_media(media_names=["image.png"], deck_id=deck_id, on_downloaded_file=Mock())
+
+            assert requests_mock.last_request.headers["Range"] == "bytes=5-"
+            assert (Path(temp_dir) / "image.png").read_bytes() == expected_file_content
+            assert os.listdir(temp_dir) == ["image.png"]
+
+    def test_stopped_download_leaves_no_partial_file(
+        self,
+        requests_mock: Mocker,
+        next_deterministic_uuid: Callable[[], uuid.UUID],
+    ):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            client = AnkiHubClient(local_media_dir_path_cb=lambda: Path(temp_dir))
+
+            deck_id = next_deterministic_uuid()
+            # The content is large enough to be downloaded in multiple chunks
+            requests_mock.get(
+                f"{DEFAULT_S3_BUCKET_URL}/deck_assets/{deck_id}/image.png",
+                content=b"x" * (MEDIA_DOWNLOAD_MAX_CHUNK_SIZE + 1),
+            )
+
+            def on_bytes_downloaded(bytes_count: int) -> None:
+                client.stop_background_threads()
+
+            client.download_media(
+                media_names=["image.png"],
+                deck_id=deck_id,
+                on_downloaded_file=Mock(),
+                on_bytes_downloaded=on_bytes_downloaded,
+            )
+
+            assert os.listdir(temp_dir) == []
+
+    def test_on_bytes_downloaded_is_called_with_received_bytes(
+        self,
+        requests_mock: Mocker,
+        next_deterministic_uuid: Callable[[], uuid.UUID],
+    ):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            client = AnkiHubClient(local_media_dir_path_cb=lambda: Path(temp_dir))
+
+            deck_id = next_deterministic_uuid()
+            media_names = [f"image_{i}.png" for i in range(MEDIA_DOWNLOAD_MAX_QUEUED + 1)]
+            for media_name in media_names:
+                requests_mock.get(
+                    f"{DEFAULT_S3_BUCKET_URL}/deck_assets/{deck_id}/{media_name}",
+                    content=b"test data",
+                )
+
+            on_bytes_downloaded = Mock()
+            client.download_media(
+                media_names=media_names,
+                deck_id=deck_id,
+                on_downloaded_file=Mock(),
+                on_bytes_downloaded=on_bytes_downloaded,
+            )
+
+            assert sum(call.args[0] for call in on_bytes_downloaded.call_args_list) == len(b"test data") * len(
+                media_names
+            )
+            assert sorted(os.listdir(temp_dir)) == sorted(media_names)
+
     def test_media_download_error_message(self):
         response = requests.Response()
         response.status_code = 404
@@ -1715,35 +1996,50 @@ class TestUploadMediaForDeck:
         notes_data = self.notes_data_with_many_media_files()
 
         # Mock upload-related stuff
-        mocker.patch.object(client, "_get_presigned_url_for_multiple_uploads")
-        mocker.patch.object(client, "_upload_file_to_s3_with_reusable_presigned_url")
+        mocker.patch.object(
+            client,
+            "_get_presigned_url_for_multiple_uploads",
+            return_value={"url": f"{client.s3_bucket_url}/", "fields": {"key": "deck_assets/test/${filename}"}},
+        )
+        uploaded_bodies: List[bytes] = []
+
+        def send_request_mock(*args, data, headers, **kwargs) -> requests.Response:
+            body = data.read()
+            assert len(body) == len(data)
+            assert headers["Content-Type"].startswith("multipart/form-data; boundary=")
+            uploaded_bodies.append(body)
+
+            response = requests.Response()
+            response.status_code = 204
+            return response
+
+        mocker.patch.object(client, "_send_request", side_effect=send_request_mock)
 
         deck_id = next_deterministic_uuid()
-        remove_mock = mocker.patch("os.remove")
         self._upload_media_for_notes_data(mocker, client, notes_data, deck_id)
 
+        # The zip file is not written to the media folder
+        assert not Path(TEST_MEDIA_PATH / f"{deck_id}_0_deck_assets_part.zip").exists()
+
         # We will create and check for just one chunk in this test
-        path_to_created_zip_file = Path(TEST_MEDIA_PATH / f"{deck_id}_0_deck_assets_part.zip")
+        assert len(uploaded_bodies) == 1
+        body = uploaded_bodies[0]
+        assert f'filename="{deck_id}_0_deck_assets_part.zip"'.encode() in body
 
         all_media_names_in_notes = get_media_names_from_notes_data(notes_data, lambda mid: self._empty_notetype())
-        assert path_to_created_zip_file.is_file()
         assert len(all_media_names_in_notes) == 14
-        with zipfile.ZipFile(path_to_created_zip_file, "r") as zip_ref:
+        zip_content = body[body.index(b"PK\x03\x04") : body.rindex(b"\r\n--")]
+        with zipfile.ZipFile(io.BytesIO(zip_content), "r") as zip_ref:
             assert set(zip_ref.namelist()) == set(all_media_names_in_notes)
+            assert zip_ref.testzip() is None
+            for media_name in all_media_names_in_notes:
+                assert zip_ref.read(media_name) == (TEST_MEDIA_PATH / media_name).read_bytes()
 
-        # Remove the zipped file at the end of the test
-        mocker.stop(remove_mock)
-        os.remove(path_to_created_zip_file)
-        assert path_to_created_zip_file.is_file() is False
-
-    def test_uploads_generated_zipped_file(
-        self, next_deterministic_uuid: Callable[[], uuid.UUID], mocker: MockerFixture
-    ):
+    def test_uploads_zipped_media_files(self, next_deterministic_uuid: Callable[[], uuid.UUID], mocker: MockerFixture):
         client = AnkiHubClient(local_media_dir_path_cb=lambda: TEST_MEDIA_PATH)
 
         notes_data = self.notes_data_with_many_media_files()
         deck_id = next_deterministic_uuid()
-        path_to_created_zip_file = Path(TEST_MEDIA_PATH / f"{deck_id}_0_deck_assets_part.zip")
 
         s3_info_mocked_value = {
             "url": "https://fake_s3.com",
@@ -1761,36 +2057,65 @@ class TestUploadMediaForDeck:
             "_get_presigned_url_for_multiple_uploads",
             return_value=s3_info_mocked_value,
         )
-        mocked_upload_file_to_s3 = mocker.patch.object(
+        mocked_upload_to_s3 = mocker.patch.object(
             client,
-            "_upload_file_to_s3_with_reusable_presigned_url",
+            "_upload_zipped_media_to_s3_with_reusable_presigned_url",
         )
 
         self._upload_media_for_notes_data(mocker, client, notes_data, deck_id)
 
         get_presigned_url_mock.assert_called_once_with(prefix=f"deck_assets/{deck_id}")
-        mocked_upload_file_to_s3.assert_called_once_with(
-            s3_presigned_info=s3_info_mocked_value,
-            filepath=path_to_created_zip_file,
-        )
+        mocked_upload_to_s3.assert_called_once()
+        assert mocked_upload_to_s3.call_args.kwargs["s3_presigned_info"] == s3_info_mocked_value
+        assert mocked_upload_to_s3.call_args.kwargs["zip_name"] == f"{deck_id}_0_deck_assets_part.zip"
+        media_names = get_media_names_from_notes_data(notes_data, lambda mid: self._empty_notetype())
+        assert {path.name for path in mocked_upload_to_s3.call_args.kwargs["media_paths"]} == media_names
 
-    def test_removes_zipped_file_after_upload(
+    def test_retries_upload_with_new_body(
         self, next_deterministic_uuid: Callable[[], uuid.UUID], mocker: MockerFixture
     ):
         client = AnkiHubClient(local_media_dir_path_cb=lambda: TEST_MEDIA_PATH)
+        mocker.patch.object(
+            client,
+            "_get_presigned_url_for_multiple_uploads",
+            return_value={"url": f"{client.s3_bucket_url}/", "fields": {}},
+        )
 
-        notes_data = self.notes_data_with_many_media_files()
+        bodies = []
 
-        # Mock upload-related stuff
-        mocker.patch.object(client, "_get_presigned_url_for_multiple_uploads")
-        mocker.patch.object(client, "_upload_file_to_s3_with_reusable_presigned_url")
+        def send_request_mock(*args, data, **kwargs) -> requests.Response:
+            bodies.append(data)
+            response = requests.Response()
+            response.status_code = 503 if len(bodies) == 1 else 204
+            return response
 
-        deck_id = next_deterministic_uuid()
-        self._upload_media_for_notes_data(mocker, client, notes_data, deck_id)
+        mocker.patch.object(client, "_send_request", side_effect=send_request_mock)
 
-        path_to_created_zip_file = Path(TEST_MEDIA_PATH / f"{deck_id}.zip")
+        futures: List[Future] = []
+        client.upload_media(
+            {TEST_MEDIA_PATH / "testfile_1.jpeg"},
+            ah_did=next_deterministic_uuid(),
+            on_media_chunk_uploaded=futures.append,
+        )
 
-        assert not path_to_created_zip_file.is_file()
+        assert futures[0].result() == 1
+        assert len(bodies) == 2
+        assert bodies[0] is not bodies[1]
+
+    def test_media_path_chunks(self, tmp_path: Path, mocker: MockerFixture):
+        mocker.patch("ankihub.ankihub_client.ankihub_client.CHUNK_BYTES_THRESHOLD", 10)
+        media_paths = []
+        for i, size in enumerate([4, 4, 4, 20, 1]):
+            media_path = tmp_path / f"file_{i}"
+            media_path.write_bytes(b"a" * size)
+            media_paths.append(media_path)
+        not_existing_path = tmp_path / "not_existing"
+
+        assert _media_path_chunks(media_paths + [not_existing_path]) == [
+            media_paths[:3],
+            media_paths[3:4],
+            media_paths[4:],
+        ]
 
     @staticmethod
     def _empty_notetype() -> Dict[str, Any]:
@@ -1859,7 +2184,7 @@ class TestUploadMediaProgress:
             response.reason = "Forbidden"
             mocker.patch.object(
                 client,
-                "_upload_file_to_s3_with_reusable_presigned_url",
+                "_upload_zipped_media_to_s3_with_reusable_presigned_url",
                 side_effect=AnkiHubHTTPError(response),
             )
 
@@ -1905,7 +2230,7 @@ class TestUploadMediaProgress:
     def _client_with_mocked_upload(self, mocker: MockerFixture, local_media_dir: str) -> AnkiHubClient:
         client = AnkiHubClient(local_media_dir_path_cb=lambda: Path(local_media_dir))
         mocker.patch.object(client, "_get_presigned_url_for_multiple_uploads")
-        mocker.patch.object(client, "_upload_file_to_s3_with_reusable_presigned_url")
+        mocker.patch.object(client, "_upload_zipped_media_to_s3_with_reusable_presigned_url")
         return client
 
 